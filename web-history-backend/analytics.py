@@ -0,0 +1,328 @@
+import threading
+import time
+from datetime import datetime, timezone, timedelta
+
+# NumPy powers the in-memory columns; analytics are unavailable without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from database_manager import db_manager, parse_time_bound, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+# Analytics settings
+BUCKET_SECONDS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+WEEK_ALIGN_SECONDS = 4 * 86400   # 1970-01-05, the first Monday after the epoch
+MAX_BUCKETS = 10000              # Longest timeline a single request may ask for
+LOAD_BATCH_ROWS = 100000         # Rows fetched from SQLite per step while loading
+MAX_DENSE_CELLS = 4 * 1024 * 1024  # Largest (bucket, domain) count matrix built in one go
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+class AnalyticsUnavailable(Exception):
+    """Raised when analytics are requested without NumPy installed"""
+    pass
+
+class VisitColumns:
+    """Every visit held in memory as NumPy columns for analytics.
+
+    Three parallel arrays hold each visit's time in epoch seconds, the id of
+    its domain and its weight: 1 for a raw visit, or the visit count of a
+    daily rollup, which stands in at its last visit time. The columns load
+    once from history, history_daily and the archives. After that, each
+    query first compares the history data_version with the one last seen
+    and, only if it moved, appends the visits whose seq is past the last one
+    read. Compaction and archiving only move visits that are already in
+    memory, so they need no reload; a restore or a seq going backwards does.
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        self.size = 0
+        self.times = None
+        self.domain_ids = None
+        self.weights = None
+
+        # Domain names by id, and the domain id of every URL by url_id
+        self.domains = []
+        self._domain_index = {}
+        self._url_domains = None
+        self._last_url_id = 0
+
+        self._epoch = None
+        self._version = None
+        self._last_seq = 0
+        self.load_ms = 0.0
+
+    def _reset(self):
+        """Drop every column, ready for a full load"""
+        self.size = 0
+        self.times = np.zeros(1024, dtype=np.int64)
+        self.domain_ids = np.zeros(1024, dtype=np.int32)
+        self.weights = np.zeros(1024, dtype=np.int64)
+        self.domains = []
+        self._domain_index = {}
+        self._url_domains = np.full(1024, -1, dtype=np.int32)
+        self._last_url_id = 0
+        self._last_seq = 0
+
+    def _append(self, times_ms, url_ids, weights):
+        """Append visits, growing the columns by doubling"""
+        count = len(times_ms)
+        if not count:
+            return
+        needed = self.size + count
+        if needed > len(self.times):
+            capacity = max(needed, len(self.times) * 2)
+            for name in ("times", "domain_ids", "weights"):
+                column = getattr(self, name)
+                grown = np.zeros(capacity, dtype=column.dtype)
+                grown[:self.size] = column[:self.size]
+                setattr(self, name, grown)
+
+        end = self.size + count
+        self.times[self.size:end] = times_ms // 1000
+        self.domain_ids[self.size:end] = self._url_domains[url_ids]
+        self.weights[self.size:end] = weights
+        self.size = end
+
+    def _load_urls(self, conn):
+        """Map URLs added since the last call to domain ids"""
+        cursor = conn.execute(
+            "SELECT id, domain FROM urls WHERE id > ? ORDER BY id",
+            (self._last_url_id,)
+        )
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH_ROWS)
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            if last_id >= len(self._url_domains):
+                grown = np.full(max(last_id + 1, len(self._url_domains) * 2), -1, dtype=np.int32)
+                grown[:len(self._url_domains)] = self._url_domains
+                self._url_domains = grown
+
+            index = self._domain_index
+            for url_id, domain in rows:
+                domain = domain or ''
+                domain_id = index.get(domain)
+                if domain_id is None:
+                    domain_id = index[domain] = len(self.domains)
+                    self.domains.append(domain)
+                self._url_domains[url_id] = domain_id
+            self._last_url_id = last_id
+
+    def _load_query(self, conn, query, params=()):
+        """Append the (visited_at, url_id, weight) rows of a query in batches"""
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH_ROWS)
+            if not rows:
+                return
+            batch = np.array(rows, dtype=np.int64)
+            self._append(batch[:, 0], batch[:, 1], batch[:, 2])
+
+    def _load_new_visits(self, conn):
+        """Append raw visits past the last seq read"""
+        row = conn.execute(
+            "SELECT MAX(seq) FROM history WHERE seq > ?", (self._last_seq,)
+        ).fetchone()
+        if row[0] is None:
+            return
+        self._load_urls(conn)
+        self._load_query(
+            conn,
+            "SELECT visited_at, url_id, 1 FROM history WHERE seq > ? AND seq <= ?",
+            (self._last_seq, row[0])
+        )
+        self._last_seq = row[0]
+
+    def _load(self, conn):
+        """Load every tier of history into fresh columns"""
+        started = time.perf_counter()
+        self._reset()
+        self._load_urls(conn)
+        self._load_new_visits(conn)
+        self._load_query(conn, "SELECT last_seen, url_id, visits FROM history_daily")
+
+        archives = self.db_manager.archives
+        for archive in archives.list(conn):
+            with archives.attached(conn, archive["name"]) as schema:
+                self._load_query(conn, f"SELECT visited_at, url_id, 1 FROM {schema}.history")
+
+        self.load_ms = (time.perf_counter() - started) * 1000
+        print(f"Loaded {self.size} history rows for analytics in {self.load_ms:.0f}ms")
+
+    def refresh(self):
+        """Bring the columns up to date with the database"""
+        if np is None:
+            raise AnalyticsUnavailable("Analytics need NumPy; install it with pip install numpy")
+
+        with self._lock, self.db_manager.get_connection() as conn:
+            row = conn.execute("SELECT version FROM data_versions WHERE resource = 'history'").fetchone()
+            version = row[0] if row else 0
+            if self._loaded and self._epoch == self.db_manager.epoch and self._version == version:
+                return
+
+            max_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM history").fetchone()[0]
+            if not self._loaded or self._epoch != self.db_manager.epoch or max_seq < self._last_seq:
+                self._load(conn)
+                self._loaded = True
+                self._epoch = self.db_manager.epoch
+            else:
+                self._load_new_visits(conn)
+            self._version = version
+
+    def select(self, start=None, end=None):
+        """Columns of the visits in [start, end), as (times, domain_ids, weights, start, end) in seconds"""
+        self.refresh()
+
+        # Appends only write past the current size, so these views stay valid
+        with self._lock:
+            size = self.size
+            times = self.times[:size]
+            domain_ids = self.domain_ids[:size]
+            weights = self.weights[:size]
+
+        start = parse_time_bound(start)
+        end = parse_time_bound(end)
+        start = start // 1000 if start is not None else None
+        end = -(-end // 1000) if end is not None else None
+
+        # Open bounds stop at the oldest and newest visits, but never cross
+        # the other bound, so a range without visits is empty, not invalid
+        if start is None:
+            start = int(times.min()) if size else (end if end is not None else 0)
+            if end is not None:
+                start = min(start, end)
+        if end is None:
+            end = max(int(times.max()) + 1 if size else start, start)
+        if end < start:
+            raise ValueError("The range ends before it starts")
+
+        # Filtering copies every column, so it is skipped when nothing falls outside
+        if size and (start > times.min() or end <= times.max()):
+            mask = (times >= start) & (times < end)
+            times, domain_ids, weights = times[mask], domain_ids[mask], weights[mask]
+        return times, domain_ids, weights, start, end
+
+    def buckets(self, times, start, end, bucket, offset):
+        """Bucket index of each time and the start of every bucket in the range.
+
+        `offset` is the client's distance from UTC in seconds, so days,
+        weeks and months begin at local midnight. Weeks start on Monday.
+        """
+        if bucket == "month":
+            edges = []
+            local = datetime.fromtimestamp(start + offset, timezone.utc)
+            month = local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            while True:
+                edge = int(month.timestamp()) - offset
+                if edge >= end:
+                    break
+                edges.append(edge)
+                if len(edges) > MAX_BUCKETS:
+                    raise ValueError("Too many buckets; pick a larger bucket or a shorter range")
+                month = (month + timedelta(days=32)).replace(day=1)
+            edges = np.array(edges, dtype=np.int64)
+            return np.searchsorted(edges, times, side="right") - 1, edges.tolist()
+
+        if bucket not in BUCKET_SECONDS:
+            raise ValueError(f"Unknown bucket: {bucket}")
+        size = BUCKET_SECONDS[bucket]
+        align = WEEK_ALIGN_SECONDS if bucket == "week" else 0
+
+        first = (start + offset - align) // size
+        last = (end - 1 + offset - align) // size
+        if last - first + 1 > MAX_BUCKETS:
+            raise ValueError("Too many buckets; pick a larger bucket or a shorter range")
+        starts = [index * size + align - offset for index in range(first, last + 1)]
+        return (times + offset - align) // size - first, starts
+
+    def timeline(self, start=None, end=None, bucket="day", offset=0):
+        """Visits per bucket over a range"""
+        times, _, weights, start, end = self.select(start, end)
+        index, starts = self.buckets(times, start, end, bucket, offset)
+        counts = np.bincount(index, weights=weights, minlength=len(starts)) if len(starts) else []
+        return {
+            "bucket": bucket,
+            "from": iso_time(start),
+            "to": iso_time(end),
+            "total": int(weights.sum()),
+            "buckets": [
+                {"start": iso_time(bucket_start), "visits": int(count)}
+                for bucket_start, count in zip(starts, counts)
+            ]
+        }
+
+    def heatmap(self, start=None, end=None, offset=0):
+        """Visits per hour of the week, as 7 rows (Monday first) of 24 hours"""
+        times, _, weights, start, end = self.select(start, end)
+        # The epoch fell on a Thursday, 72 hours after the start of its week
+        hour_of_week = ((times + offset) // 3600 + 72) % (7 * 24)
+        counts = np.bincount(hour_of_week, weights=weights, minlength=7 * 24)
+        return {
+            "from": iso_time(start),
+            "to": iso_time(end),
+            "days": WEEKDAYS,
+            "total": int(weights.sum()),
+            "matrix": counts.astype(np.int64).reshape(7, 24).tolist()
+        }
+
+    def domains_by_period(self, start=None, end=None, limit=DEFAULT_PAGE_SIZE, bucket=None, offset=0):
+        """Most visited domains over the whole range, or within each bucket of it"""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        times, domain_ids, weights, start, end = self.select(start, end)
+        domain_count = len(self.domains)
+
+        if bucket is None:
+            index = None
+            starts = [start]
+        else:
+            index, starts = self.buckets(times, start, end, bucket, offset)
+
+        periods = [{"start": iso_time(bucket_start), "domains": []} for bucket_start in starts]
+        result = {
+            "bucket": bucket,
+            "from": iso_time(start),
+            "to": iso_time(end),
+            "periods": periods
+        }
+        if not len(times):
+            return result
+
+        # Count every (bucket, domain) pair; a dense matrix when it is small
+        # enough, otherwise only the pairs that occur
+        if index is None:
+            counts = np.bincount(domain_ids, weights=weights, minlength=domain_count).astype(np.int64)
+            pairs = np.flatnonzero(counts)
+            counts = counts[pairs]
+        elif len(starts) * domain_count <= MAX_DENSE_CELLS:
+            keys = index * domain_count + domain_ids
+            counts = np.bincount(keys, weights=weights, minlength=len(starts) * domain_count).astype(np.int64)
+            pairs = np.flatnonzero(counts)
+            counts = counts[pairs]
+        else:
+            keys = index * domain_count + domain_ids
+            pairs, inverse = np.unique(keys, return_inverse=True)
+            counts = np.bincount(inverse, weights=weights).astype(np.int64)
+        pair_buckets = pairs // domain_count
+        order = np.lexsort((-counts, pair_buckets))
+
+        boundaries = np.searchsorted(pair_buckets[order], np.arange(len(starts) + 1))
+        for position, period in enumerate(periods):
+            for pair in order[boundaries[position]:min(boundaries[position] + limit, boundaries[position + 1])]:
+                period["domains"].append({
+                    "domain": self.domains[pairs[pair] % domain_count],
+                    "visits": int(counts[pair])
+                })
+        return result
+
+def iso_time(seconds):
+    """ISO UTC timestamp of epoch seconds"""
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+# Create an instance for direct use
+visit_columns = VisitColumns(db_manager)
@@ -1,6 +1,8 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Blueprint, jsonify, request
 from flask_cors import CORS
-from flask import make_response
+from flask import make_response, Response
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.serving import make_server
 import json
 import os
 from datetime import datetime
@@ -8,37 +10,161 @@ import uuid
 import threading
 import time
 import argparse
+import sys
+import signal
+import socket
 import hashlib
+from contextlib import redirect_stdout
+from functools import wraps
 from urllib.parse import urlparse
 
-from database_manager import db_manager, history_db, folders_db
+from database_manager import db_manager, history_db, folders_db, search_db, changes_db, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
 from backup_manager import backup_manager
+from json_stream import stream_json_array
+from ingest_queue import ingest_queue, IngestQueueFull, RETRY_AFTER_SECONDS
+from compaction import history_compactor
+from analytics import visit_columns, AnalyticsUnavailable
+from export import export_history, export_filename, export_bookmarks as bookmark_export, EXPORT_FORMATS
+from browser_import import import_jobs, import_browser_history, BROWSER_VISITS
+from process_lock import ProcessLock
+from metrics import metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+# Every route lives on this blueprint; create_app() builds the application around it
+api = Blueprint('api', __name__)
 
-# Initialize database
-db_manager.initialize_db()
+# Largest number of visits accepted by /api/history/batch
+MAX_BATCH_SIZE = 500
 
-@app.after_request
+# Change stream settings
+STREAM_POLL_SECONDS = 1
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Serving settings
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5000
+JOBS_RETRY_SECONDS = 5          # How often workers without the background jobs try to take them over
+WORKER_RESTART_SECONDS = 1      # Pause before replacing a worker process that exited
+
+@api.after_app_request
 def add_header(response):
+    if response.headers.get("ETag"):
+        # Let clients keep versioned responses but revalidate them every time
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+    
     # More aggressive cache prevention
     response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
     response.headers["Pragma"] = "no-cache"
     response.headers["Expires"] = "0"
     return response
 
+@api.before_app_request
+def start_request_timer():
+    if metrics.enabled:
+        rule = request.url_rule
+        metrics.begin_request(request.method, rule.rule if rule else 'unmatched')
+
+@api.after_app_request
+def finish_request_timer(response):
+    """Record the request in the metrics once its body has been sent"""
+    timer = metrics.current_request()
+    if timer is None:
+        return response
+    
+    if response.is_streamed and not response.direct_passthrough:
+        sent = [0]
+        response.response = count_bytes(response.response, sent)
+        size = lambda: sent[0]
+    else:
+        length = response.content_length or 0
+        size = lambda: length
+    status = response.status_code
+    response.call_on_close(lambda: metrics.end_request(timer, status, size()))
+    return response
+
+def count_bytes(chunks, sent):
+    """Pass a streamed body through, adding the size of each chunk to sent[0]"""
+    try:
+        for chunk in chunks:
+            sent[0] += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, charging the time it takes to the request's metrics"""
+    
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        text = super().dumps(obj, **kwargs)
+        metrics.observe_json(time.perf_counter() - started, len(text))
+        return text
+    
+    def loads(self, s, **kwargs):
+        started = time.perf_counter()
+        obj = super().loads(s, **kwargs)
+        metrics.observe_json(time.perf_counter() - started, len(s))
+        return obj
+
+def etag_for(*resources):
+    """
+    Serve the route with an ETag built from the resources' change counters,
+    answering a matching If-None-Match with 304 before the view runs
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = db_manager.get_etag(*resources)
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            return response
+        return wrapper
+    return decorator
+
+def wants_stream():
+    """Check whether the client asked for a streamed JSON array"""
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+def stream_response(items):
+    """Send pre-encoded JSON objects as a chunked JSON array"""
+    return Response(stream_json_array(items), mimetype='application/json')
+
 # Routes for history
-@app.route('/api/history', methods=['GET'])
+@api.route('/api/history', methods=['GET'])
+@etag_for('history')
 def get_history():
-    history = history_db.get_all()
-    return jsonify(history)
+    """
+    Get one page of history, newest first. Pass the returned nextCursor
+    as `before` to load older entries, or prevCursor as `after` for newer ones.
+    Optional `from` and `to` ISO times limit the page to visits in that range.
+    With ?stream=1 the full history is streamed as a JSON array instead.
+    """
+    if wants_stream():
+        return stream_response(history_db.iter_all_json())
+    
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        page = history_db.get_page(
+            limit=limit,
+            before=request.args.get('before'),
+            after=request.args.get('after'),
+            start=request.args.get('from'),
+            end=request.args.get('to')
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
 
-@app.route('/api/history', methods=['POST'])
-def add_history():
-    page = request.json
+def prepare_visit(page):
+    """Fill in defaults for a reported visit; returns None if it should be ignored"""
     if 'title' in page and page['title'] == 'WebHistoryFrontend':
-        return jsonify(page), 201
+        return None
     if 'id' not in page:
         page['id'] = str(uuid.uuid4())
     if 'timestamp' not in page:
@@ -46,23 +172,228 @@ def add_history():
 
     if 'favicon' in page:
         del page['favicon']
+    return page
+
+@api.route('/api/history', methods=['POST'])
+def add_history():
+    page = request.json
+    if not isinstance(page, dict) or not page.get('url'):
+        return jsonify({"error": "Visit needs a url"}), 400
+    if prepare_visit(page) is None:
+        return jsonify(page), 201
     
-    # Add to history database
-    history_db.add(page)
-    return jsonify(page), 201
+    # Hand off to the writer thread; the visit is committed with the next batch
+    try:
+        ingest_queue.submit(page)
+    except IngestQueueFull:
+        response = jsonify({"error": "Server is busy, try again shortly"})
+        response.headers["Retry-After"] = str(RETRY_AFTER_SECONDS)
+        return response, 503
+    return jsonify(page), 202
 
-@app.route('/api/history/frequent', methods=['GET'])
+@api.route('/api/database/stats', methods=['GET'])
+def get_database_stats():
+    """Connection pool hits and misses"""
+    return jsonify(db_manager.pool_stats()), 200
+
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Request, SQL, connection and backup metrics of this process in the
+    Prometheus text format
+    """
+    pool = db_manager.pool_stats()
+    text = metrics.render([
+        ("web_history_db_pool_idle_connections", "Idle connections in the pool", pool["idle"]),
+        ("web_history_db_pool_size", "Connections the pool keeps at most", pool["pool_size"]),
+        ("web_history_ingest_queue_depth", "Visits waiting for the ingest writer", ingest_queue.stats()["depth"])
+    ])
+    return Response(text, content_type=METRICS_CONTENT_TYPE)
+
+@api.route('/api/ingest/stats', methods=['GET'])
+def get_ingest_stats():
+    """Queue depth and commit latency of the visit writer thread"""
+    return jsonify(ingest_queue.stats()), 200
+
+@api.route('/api/history/compaction', methods=['GET'])
+def get_compaction_stats():
+    """Retention settings and progress of the history compaction job"""
+    return jsonify(history_compactor.stats()), 200
+
+@api.route('/api/history/batch', methods=['POST'])
+def add_history_batch():
+    """
+    Record an array of visits in one transaction
+    """
+    pages = request.json
+    if not isinstance(pages, list):
+        return jsonify({"error": "Expected an array of visits"}), 400
+    if len(pages) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch cannot exceed {MAX_BATCH_SIZE} visits"}), 413
+    if not all(isinstance(page, dict) and page.get('url') for page in pages):
+        return jsonify({"error": "Every visit needs a url"}), 400
+    
+    visits = [page for page in pages if prepare_visit(page) is not None]
+    inserted, skipped = history_db.add_batch(visits)
+    return jsonify({"inserted": inserted, "skipped": skipped}), 201
+
+@api.route('/api/history/frequent', methods=['GET'])
+@etag_for('frequency')
 def get_frequent_pages():
-    frequent_pages = history_db.get_frequent()
+    """
+    Get the most frecent pages (visit count weighted by recency). With
+    ?stream=1 every page is streamed in frecency order instead.
+    """
+    if wants_stream():
+        return stream_response(history_db.iter_frequent_json())
+    try:
+        frequent_pages = history_db.get_frequent(int(request.args.get('limit', DEFAULT_PAGE_SIZE)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify(frequent_pages)
 
+@api.route('/api/search', methods=['GET'])
+@etag_for('history', 'folders')
+def search():
+    """
+    Full-text search over history and folder pages. Every word matches as
+    a prefix; scope is one of all, history or folders.
+    """
+    try:
+        results = search_db.search(
+            request.args.get('q', ''),
+            scope=request.args.get('scope', 'all'),
+            limit=int(request.args.get('limit', DEFAULT_PAGE_SIZE)),
+            offset=int(request.args.get('offset', 0))
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(results)
+
+# Routes for analytics
+def analytics_response(build):
+    """Run an analytics query with the range, bucket and tz (minutes east of UTC) arguments"""
+    try:
+        offset = int(request.args.get('tz', 0)) * 60
+        result = build(request.args.get('from'), request.args.get('to'), offset)
+    except AnalyticsUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+@api.route('/api/analytics/timeline', methods=['GET'])
+@etag_for('history')
+def get_analytics_timeline():
+    """Visits per hour, day, week or month (?bucket=) over an optional from/to range"""
+    bucket = request.args.get('bucket', 'day')
+    return analytics_response(
+        lambda start, end, offset: visit_columns.timeline(start, end, bucket, offset)
+    )
+
+@api.route('/api/analytics/heatmap', methods=['GET'])
+@etag_for('history')
+def get_analytics_heatmap():
+    """Visits per hour of the week, Monday first"""
+    return analytics_response(
+        lambda start, end, offset: visit_columns.heatmap(start, end, offset)
+    )
+
+@api.route('/api/analytics/domains', methods=['GET'])
+@etag_for('history')
+def get_analytics_domains():
+    """Top domains over the range, or per period with ?bucket="""
+    bucket = request.args.get('bucket') or None
+    return analytics_response(
+        lambda start, end, offset: visit_columns.domains_by_period(
+            start, end, int(request.args.get('limit', 10)), bucket, offset
+        )
+    )
+
+# Routes for the change feed
+@api.route('/api/changes', methods=['GET'])
+def get_changes():
+    """
+    Get changes after ?since=<seq>. Without `since` only the current lastSeq
+    is returned. Passing ?client=<id> records the position so the log can
+    be trimmed; reset=true means the client fell behind and must reload.
+    """
+    try:
+        limit = int(request.args.get('limit', MAX_PAGE_SIZE))
+        since = request.args.get('since')
+        if since is None:
+            changes, last_seq, reset = [], changes_db.latest_seq(), False
+        else:
+            since = int(since)
+            changes, last_seq, reset = changes_db.get_since(since, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    client_id = request.args.get('client')
+    if client_id:
+        changes_db.save_cursor(client_id, last_seq if reset or since is None else since)
+    
+    body = (
+        '{"changes":' + ''.join(stream_json_array(changes)) +
+        f',"lastSeq":{last_seq},"reset":{"true" if reset else "false"}}}'
+    )
+    return Response(body, mimetype='application/json')
+
+@api.route('/api/changes/stream', methods=['GET'])
+def stream_changes():
+    """
+    Server-Sent Events stream of changes. Each `changes` event carries a
+    JSON array of deltas and its id is the last sequence number in it.
+    """
+    try:
+        since = request.headers.get('Last-Event-ID') or request.args.get('since')
+        since = int(since) if since is not None else changes_db.latest_seq()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    named_client = request.args.get('client')
+    client_id = named_client or f"stream-{uuid.uuid4()}"
+    
+    def generate(seq):
+        changes_db.save_cursor(client_id, seq)
+        last_sent = time.monotonic()
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                changes, last_seq, reset = changes_db.get_since(seq)
+                if reset:
+                    yield f'id: {last_seq}\nevent: reset\ndata: {{}}\n\n'
+                elif changes:
+                    yield f'id: {last_seq}\nevent: changes\ndata: [{",".join(changes)}]\n\n'
+                else:
+                    if time.monotonic() - last_sent >= STREAM_KEEPALIVE_SECONDS:
+                        yield ': keep-alive\n\n'
+                        last_sent = time.monotonic()
+                    time.sleep(STREAM_POLL_SECONDS)
+                    continue
+                
+                seq = last_seq
+                last_sent = time.monotonic()
+                changes_db.save_cursor(client_id, seq)
+        finally:
+            # Anonymous streams don't hold the log back once they're gone
+            if not named_client:
+                changes_db.remove_cursor(client_id)
+    
+    return Response(generate(since), mimetype='text/event-stream', headers={
+        'X-Accel-Buffering': 'no'
+    })
+
 # Routes for folders
-@app.route('/api/folders', methods=['GET'])
+@api.route('/api/folders', methods=['GET'])
+@etag_for('folders')
 def get_folders():
+    if wants_stream():
+        return stream_response(folders_db.iter_all_json())
     folders = folders_db.get_all()
     return jsonify(folders)
 
-@app.route('/api/folders', methods=['POST'])
+@api.route('/api/folders', methods=['POST'])
 def create_folder():
     folder = request.json
     if 'id' not in folder:
@@ -73,12 +404,12 @@ def create_folder():
     created_folder = folders_db.create(folder)
     return jsonify(created_folder), 201
 
-@app.route('/api/folders/<folder_id>', methods=['DELETE'])
+@api.route('/api/folders/<folder_id>', methods=['DELETE'])
 def delete_folder(folder_id):
     folders_db.delete(folder_id)
     return '', 204
 
-@app.route('/api/folders/<folder_id>/pages', methods=['POST'])
+@api.route('/api/folders/<folder_id>/pages', methods=['POST'])
 def add_page_to_folder(folder_id):
     page = request.json
     if 'id' not in page:
@@ -93,7 +424,7 @@ def add_page_to_folder(folder_id):
     else:
         return jsonify({"error": result}), 409
 
-@app.route('/api/folders/<folder_id>/pages/<page_id>', methods=['POST'])
+@api.route('/api/folders/<folder_id>/pages/<page_id>', methods=['POST'])
 def move_page_to_folder(folder_id, page_id):
     # Source folder is null in this case (could be from history)
     success, result = folders_db.move_page(None, page_id, folder_id)
@@ -103,7 +434,7 @@ def move_page_to_folder(folder_id, page_id):
     else:
         return jsonify({"error": result}), 409 if "already exists" in result else 404
 
-@app.route('/api/folders/<folder_id>/remove-page', methods=['POST'])
+@api.route('/api/folders/<folder_id>/remove-page', methods=['POST'])
 def alt_remove_page_from_folder(folder_id):
     data = request.json
     page_id = data.get('pageId')
@@ -111,12 +442,12 @@ def alt_remove_page_from_folder(folder_id):
     folders_db.remove_page(folder_id, page_id)
     return '', 204
 
-@app.route('/api/folders/<folder_id>/pages/<page_id>', methods=['DELETE'])
+@api.route('/api/folders/<folder_id>/pages/<page_id>', methods=['DELETE'])
 def remove_page_from_folder(folder_id, page_id):
     folders_db.remove_page(folder_id, page_id)
     return '', 204
 
-@app.route('/api/folders/<folder_id>/rename', methods=['POST'])
+@api.route('/api/folders/<folder_id>/rename', methods=['POST'])
 def rename_folder(folder_id):
     """
     Rename a folder and check for name collisions
@@ -135,7 +466,7 @@ def rename_folder(folder_id):
     else:
         return jsonify({"error": result}), 409
 
-@app.route('/api/folders/reorder', methods=['POST'])
+@api.route('/api/folders/reorder', methods=['POST'])
 def reorder_folders():
     """
     Update the order of folders and save their collapsed state
@@ -146,7 +477,7 @@ def reorder_folders():
     
     return jsonify({"success": success}), 200
 
-@app.route('/api/folders/<folder_id>/pages/reorder', methods=['POST'])
+@api.route('/api/folders/<folder_id>/pages/reorder', methods=['POST'])
 def reorder_pages_in_folder(folder_id):
     updated_pages = request.json
     
@@ -154,54 +485,81 @@ def reorder_pages_in_folder(folder_id):
     
     return jsonify({"success": success}), 200
 
-@app.route('/api/export-bookmarks', methods=['GET'])
+@api.route('/api/export-bookmarks', methods=['GET'])
+@etag_for('folders')
 def export_bookmarks():
-    folders = folders_db.get_all()
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M')
-    top_folder_name = f"WebHistoryManager Export - {timestamp}"
-
-    lines = [
-        '<!DOCTYPE NETSCAPE-Bookmark-file-1>',
-        '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">',
-        '<TITLE>Bookmarks</TITLE>',
-        '<H1>Bookmarks</H1>',
-        '<DL><p>',
-        f'    <DT><H3>{top_folder_name}</H3>',
-        '    <DL><p>'
-    ]
-
-    for folder in folders:
-        lines.append(f'        <DT><H3>{folder["name"]}</H3>')
-        lines.append('        <DL><p>')
-        for page in folder['pages']:
-            title = page.get('title', page['url'])
-            url = page['url']
-            add_date = int(datetime.now().timestamp())
-            lines.append(f'            <DT><A HREF="{url}" ADD_DATE="{add_date}">{title}</A>')
-        lines.append('        </DL><p>')
-    
-    lines.append('    </DL><p>')
-    lines.append('</DL><p>')
+    """Download the folders as a Netscape bookmarks file, streamed as it is built"""
+    return Response(
+        bookmark_export(),
+        mimetype='text/html',
+        headers={'Content-Disposition': 'attachment; filename="webhistory_bookmarks.html"'}
+    )
 
-    html_content = '\n'.join(lines)
-
-    return html_content, 200, {
-        'Content-Type': 'text/html; charset=utf-8',
-        'Content-Disposition': 'attachment; filename="webhistory_bookmarks.html"'
-    }
+@api.route('/api/export/history', methods=['GET'])
+def export_history_file():
+    """
+    Download history as csv, ndjson or parquet (?format=), optionally limited
+    to a from/to range of ISO times and gzipped with ?gzip=1. Rows are
+    streamed as they are read, so the download starts right away.
+    """
+    export_format = request.args.get('format', 'csv')
+    gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    try:
+        chunks = export_history(export_format, request.args.get('from'), request.args.get('to'), gzip)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+    
+    return Response(
+        chunks,
+        mimetype='application/gzip' if gzip else EXPORT_FORMATS[export_format][0],
+        headers={'Content-Disposition': f'attachment; filename="{export_filename(export_format, gzip)}"'}
+    )
 
-@app.route('/api/migrate', methods=['POST'])
+@api.route('/api/migrate', methods=['POST'])
 def migrate_data():
     """Endpoint to trigger migration from JSON to SQLite"""
     success = db_manager.migrate_from_json()
+    folders_db.invalidate_cache()
+    history_db.invalidate_frequent()
+    
+    # The journal doesn't hold imported rows, so restores past the import
+    # start from this snapshot, taken even after a partial import
+    backup_manager.perform_backup()
     
     if success:
         return jsonify({"success": True, "message": "Migration completed successfully"}), 200
     else:
         return jsonify({"success": False, "message": "Migration failed. Check server logs for details."}), 500
 
+@api.route('/api/import/browser', methods=['POST'])
+def import_browser():
+    """Start importing a Chrome or Firefox history database in the background"""
+    data = request.json or {}
+    path = data.get('path')
+    browser = data.get('browser')
+    
+    if not path:
+        return jsonify({"success": False, "message": "Path to the browser history file is required"}), 400
+    if browser and browser not in BROWSER_VISITS:
+        return jsonify({"success": False, "message": f"Browser must be one of: {', '.join(BROWSER_VISITS)}"}), 400
+    if not os.path.exists(path):
+        return jsonify({"success": False, "message": "Browser history file not found"}), 404
+    
+    job_id = import_jobs.start(path, browser)
+    return jsonify({"success": True, "jobId": job_id}), 202
+
+@api.route('/api/import/<job_id>', methods=['GET'])
+def get_import_job(job_id):
+    """Report the status of a browser import"""
+    job = import_jobs.get(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Import job not found"}), 404
+    return jsonify(job), 200
+
 # Backup management endpoints
-@app.route('/api/backup/create', methods=['POST'])
+@api.route('/api/backup/create', methods=['POST'])
 def create_backup():
     """Manually create a backup"""
     try:
@@ -210,46 +568,21 @@ def create_backup():
     except Exception as e:
         return jsonify({"success": False, "message": f"Backup failed: {str(e)}"}), 500
 
-@app.route('/api/backup/list', methods=['GET'])
+@api.route('/api/backup/list', methods=['GET'])
 def list_backups():
     """List available backups"""
     try:
-        config = backup_manager.load_backup_config()
-        backup_dir = os.path.abspath(config.get("backup_directory", "./backups"))
-        
-        if not os.path.exists(backup_dir):
-            return jsonify({"backups": []}), 200
-        
-        backups = []
-        for filename in os.listdir(backup_dir):
-            if filename.startswith("web_history_") and filename.endswith(".db"):
-                # Extract timestamp from filename
-                timestamp = filename.replace("web_history_", "").replace(".db", "")
-                
-                # Get file size and creation time
-                filepath = os.path.join(backup_dir, filename)
-                size = os.path.getsize(filepath)
-                created = os.path.getctime(filepath)
-                
-                backups.append({
-                    "timestamp": timestamp,
-                    "size": size,
-                    "created": datetime.fromtimestamp(created).isoformat(),
-                    "filename": filename
-                })
-        
-        # Sort by timestamp (newest first)
-        backups.sort(key=lambda x: x["timestamp"], reverse=True)
-        
-        return jsonify({"backups": backups}), 200
+        return jsonify({"backups": backup_manager.list_backups()}), 200
     except Exception as e:
         return jsonify({"success": False, "message": f"Error listing backups: {str(e)}"}), 500
 
-@app.route('/api/backup/restore/<timestamp>', methods=['POST'])
+@api.route('/api/backup/restore/<timestamp>', methods=['POST'])
 def restore_backup_api(timestamp):
     """Restore database from a backup"""
     try:
         success = backup_manager.restore_backup(timestamp)
+        folders_db.invalidate_cache()
+        history_db.invalidate_frequent()
         if success:
             return jsonify({"success": True, "message": "Database restored successfully"}), 200
         else:
@@ -257,13 +590,13 @@ def restore_backup_api(timestamp):
     except Exception as e:
         return jsonify({"success": False, "message": f"Restore error: {str(e)}"}), 500
 
-@app.route('/api/backup/config', methods=['GET'])
+@api.route('/api/backup/config', methods=['GET'])
 def get_backup_config():
     """Get backup configuration"""
     config = backup_manager.load_backup_config()
     return jsonify(config), 200
 
-@app.route('/api/backup/config', methods=['POST'])
+@api.route('/api/backup/config', methods=['POST'])
 def update_backup_config():
     """Update backup configuration"""
     try:
@@ -286,22 +619,210 @@ def update_backup_config():
     except Exception as e:
         return jsonify({"success": False, "message": f"Error updating config: {str(e)}"}), 500
     
+class BackgroundJobs:
+    """Runs the backup and compaction threads in exactly one process.
+
+    Every process serving the database tries to take a lock file. The one
+    that gets it starts the threads and holds the lock until it exits, when
+    another takes over within JOBS_RETRY_SECONDS.
+    """
+
+    def __init__(self, lock_file):
+        self.lock = ProcessLock(lock_file)
+        self._thread = None
+        self._guard = threading.Lock()
+
+    def start(self):
+        """Start competing for the jobs lock, if this process isn't already"""
+        with self._guard:
+            if self._thread:
+                return
+            self._thread = threading.Thread(target=self._run, name="background-jobs", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Wait for the lock, then start the jobs; the lock is never released"""
+        while not self.lock.acquire(blocking=False):
+            time.sleep(JOBS_RETRY_SECONDS)
+        print(f"Running background jobs in process {os.getpid()}")
+
+        # Start backup thread
+        backup_manager.start_backup_thread()
+
+        # Start rolling up visits past the retention period
+        history_compactor.start()
+
+# Create an instance for direct use
+background_jobs = BackgroundJobs(f"{db_manager.db_file}.jobs.lock")
+
+_backend_lock = threading.Lock()
+_backend_ready = False
+
+def initialize_backend(app):
+    """Initialize the database and start background jobs, once per process"""
+    global _backend_ready
+    if _backend_ready:
+        return
+    with _backend_lock:
+        if _backend_ready:
+            return
+        db_manager.initialize_db()
+        if app.config['BACKGROUND_JOBS']:
+            background_jobs.start()
+        _backend_ready = True
+
+def create_app(config=None):
+    """
+    Build the application. Nothing touches the database until the first
+    request, which initializes it and the background jobs. Besides Flask's
+    own settings, config may set BACKGROUND_JOBS, whether this process may
+    run backups and compaction (default True)
+    """
+    app = Flask(__name__)
+    app.json = TimedJSONProvider(app)
+    app.config.update(BACKGROUND_JOBS=True)
+    app.config.update(config or {})
+    CORS(app, expose_headers=["ETag"])  # Enable CORS for all routes
+    app.register_blueprint(api)
+
+    @app.before_request
+    def initialize():
+        initialize_backend(app)
+
+    return app
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, workers=1, config=None):
+    """
+    Serve the API on a threaded WSGI server, with a thread per request, in
+    one or more worker processes. With several, the listening socket is
+    opened here and shared by forked workers, each with connections of its
+    own, and workers that exit are replaced. Forking needs a POSIX system,
+    so elsewhere one process serves everything
+    """
+    if workers > 1 and not hasattr(os, 'fork'):
+        print("Several worker processes need os.fork; serving from one process")
+        workers = 1
+
+    def exit_worker(signum, frame):
+        # Leaving through sys.exit runs the atexit handlers, which write out
+        # the journal and the ingest queue. Another signal would interrupt
+        # them, so from here on signals are ignored.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        sys.exit(0)
+
+    if workers == 1:
+        app = create_app(config)
+        initialize_backend(app)
+        server = make_server(host, port, app, threaded=True)
+        print(f"Serving on http://{host}:{port}")
+        signal.signal(signal.SIGTERM, exit_worker)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            exit_worker(signal.SIGINT, None)
+        finally:
+            server.server_close()
+        return
+
+    # Migrations run here once, before any worker opens a connection
+    db_manager.initialize_db()
+
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    listener = socket.create_server((host, port), family=family, backlog=128)
+    # Every worker wakes for each connection, and those that lose the race
+    # to accept it must go straight back to waiting
+    listener.setblocking(False)
+
+    children = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    def spawn(number):
+        # Signals wait until the child has its own handlers in place
+        signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT, signal.SIGTERM})
+        pid = os.fork()
+        if pid:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGINT, signal.SIGTERM})
+            children[pid] = number
+            return
+
+        # Worker: Ctrl+C reaches the whole process group, but only the parent acts on it
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, exit_worker)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGINT, signal.SIGTERM})
+
+        app = create_app(config)
+        initialize_backend(app)
+        server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+        print(f"Worker {number} serving on http://{host}:{port} (process {os.getpid()})")
+        server.serve_forever()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for number in range(workers):
+        spawn(number)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        number = children.pop(pid, None)
+        if number is not None and not stopping:
+            print(f"Worker {number} (process {pid}) exited with status {status}; starting a new one")
+            time.sleep(WORKER_RESTART_SECONDS)
+            spawn(number)
+    listener.close()
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--migrate', action='store_true', help='Migrate data from JSON files to SQLite database')
     parser.add_argument('--restore', help='Restore backup from timestamp like 20250407_120653')
+    parser.add_argument('--until', type=datetime.fromisoformat,
+                        help='With --restore, replay journaled writes up to this ISO time like 2025-04-07T13:30:00')
+    parser.add_argument('--import-history', metavar='PATH', help="Import visits from Chrome's History or Firefox's places.sqlite file")
+    parser.add_argument('--browser', choices=sorted(BROWSER_VISITS), help='With --import-history, the browser the file came from (detected if omitted)')
+    parser.add_argument('--export-history', metavar='PATH', help='Export history to PATH, or to stdout with -')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv', help='With --export-history, the file format')
+    parser.add_argument('--from', dest='start', metavar='TIME', help='With --export-history, the first ISO time to include')
+    parser.add_argument('--to', dest='end', metavar='TIME', help='With --export-history, the ISO time to stop before')
+    parser.add_argument('--gzip', action='store_true', help='With --export-history, gzip the output')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='Address to serve on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to serve on')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes to serve with, each running a thread per request')
     args = parser.parse_args()
 
     if args.migrate:
         db_manager.initialize_db()
         success = db_manager.migrate_from_json()
+        backup_manager.perform_backup()
         print(f"Migration {'completed successfully' if success else 'failed'}")
     elif args.restore:
-        success = backup_manager.restore_backup(args.restore)
+        success = backup_manager.restore_backup(args.restore, until=args.until)
         print(f"Restore {'completed successfully' if success else 'failed'}")
+    elif args.import_history:
+        db_manager.initialize_db()
+        import_browser_history(args.import_history, args.browser)
+    elif args.export_history:
+        # Keep progress messages out of an export written to stdout
+        with redirect_stdout(sys.stderr if args.export_history == '-' else sys.stdout):
+            db_manager.initialize_db()
+        chunks = export_history(args.format, args.start, args.end, args.gzip)
+        if args.export_history == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+        else:
+            with open(args.export_history, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            print(f"Exported history to {args.export_history}")
     else:
-        # Start backup thread
-        backup_manager.start_backup_thread()
-        
-        # Start the application
-        app.run(debug=True)
\ No newline at end of file
+        serve(args.host, args.port, max(1, args.workers))
@@ -0,0 +1,178 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from process_lock import ProcessLock
+
+# Each archive file holds the raw visits of one UTC month, named like history_2025_03.db
+ARCHIVE_PREFIX = "history_"
+ARCHIVE_SUFFIX = ".db"
+
+# Archive files have the shape of the history table. url_id refers to urls in
+# the main database, which keeps every URL, so an archive is only readable
+# alongside it.
+ARCHIVE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS {schema}.history (
+        seq INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        url_id INTEGER NOT NULL,
+        visited_at INTEGER NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {schema}.idx_history_visited_at ON history(visited_at)"
+]
+
+# Archived visits in the shape of the history_pages view
+ARCHIVE_PAGES = """
+    SELECT h.seq, h.visited_at, h.id, u.url, u.title,
+           strftime('%Y-%m-%dT%H:%M:%fZ', h.visited_at / 1000.0, 'unixepoch') AS timestamp,
+           u.domain
+    FROM {schema}.history h
+    JOIN main.urls u ON u.id = h.url_id
+"""
+
+def month_name(visited_at):
+    """Archive name (YYYY_MM) of the UTC month holding an epoch-millisecond time"""
+    return datetime.fromtimestamp(visited_at / 1000, timezone.utc).strftime("%Y_%m")
+
+def month_bounds(name):
+    """Epoch-millisecond [start, end) of the month an archive covers"""
+    year, month = (int(part) for part in name.split("_"))
+    start = datetime(year, month, 1, tzinfo=timezone.utc)
+    end = datetime(year + month // 12, month % 12 + 1, 1, tzinfo=timezone.utc)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+class ArchiveStore:
+    """Monthly database files holding raw visits moved out of history.
+
+    The history_archives table of the main database lists each archive with
+    the time range it holds and a version that goes up whenever it is
+    written. Archives are attached to a connection only for the statements
+    that need them and detached straight after, so a connection never holds
+    more than one and the live file stays the size of the recent history.
+    """
+
+    def __init__(self, directory=None, lock_file="history_archives.lock"):
+        self.directory = directory
+
+        # Held while visits move between files, so backups see the main
+        # database and its archives at the same point, whichever process
+        # takes them
+        self.lock = ProcessLock(lock_file)
+
+    def configure(self, directory):
+        """Set the directory archive files live in"""
+        self.directory = os.path.abspath(directory) if directory else None
+
+    def path(self, name):
+        """File path of the archive for a month"""
+        return os.path.join(self.directory, f"{ARCHIVE_PREFIX}{name}{ARCHIVE_SUFFIX}")
+
+    def list(self, conn, start=None, end=None, newest_first=True):
+        """Catalog rows of archives holding visits in [start, end), in time order"""
+        order = "DESC" if newest_first else "ASC"
+        cursor = conn.execute(
+            f"""
+            SELECT name, first_visit, last_visit, visits, version
+            FROM history_archives
+            WHERE visits > 0 AND last_visit >= ? AND first_visit < ?
+            ORDER BY name {order}
+            """,
+            (start if start is not None else -2 ** 63, end if end is not None else 2 ** 63 - 1)
+        )
+        return [dict(row) for row in cursor]
+
+    def versions(self, conn):
+        """Current version of every archive, by name"""
+        return {row[0]: row[1] for row in conn.execute("SELECT name, version FROM history_archives")}
+
+    @contextmanager
+    def attached(self, conn, name, create=False):
+        """Attach one archive to a connection for the duration of the block.
+
+        Yields the schema name to qualify its tables with. A transaction
+        still open when the block exits is rolled back, as a database can't
+        be detached in the middle of one.
+        """
+        path = self.path(name)
+        if not create and not os.path.exists(path):
+            raise FileNotFoundError(f"History archive not found: {path}")
+        if create:
+            os.makedirs(self.directory, exist_ok=True)
+
+        schema = f"archive_{name}"
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        try:
+            if create:
+                for statement in ARCHIVE_SCHEMA:
+                    conn.execute(statement.format(schema=schema))
+            yield schema
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute(f"DETACH DATABASE {schema}")
+
+    def iter_rows(self, conn, columns, condition="", params=(), start=None, end=None):
+        """Yield archived visits with the given columns, newest first, one archive at a time.
+
+        Callers merge these rows with other cursors of `conn` that are still
+        open when an archive runs out, and SQLite won't detach a database
+        while any statement of its connection is unfinished. So each archive
+        is read through a connection of its own to the main database.
+        """
+        path = conn.execute("PRAGMA database_list").fetchone()[2]
+        for archive in self.list(conn, start, end):
+            source = sqlite3.connect(f"file:{path}?mode=ro", uri=True, factory=type(conn))
+            source.row_factory = conn.row_factory
+            try:
+                with self.attached(source, archive["name"]) as schema:
+                    cursor = source.execute(
+                        f"""
+                        SELECT {columns} FROM ({ARCHIVE_PAGES.format(schema=schema)})
+                        {condition}
+                        ORDER BY visited_at DESC, seq DESC
+                        """,
+                        params
+                    )
+                    try:
+                        yield from cursor
+                    finally:
+                        # An open statement would keep the archive from detaching
+                        cursor.close()
+            finally:
+                source.close()
+
+    def find(self, conn, entry_id, columns):
+        """Look up an archived visit by id in history_pages shape, or return None.
+
+        Each archive is probed through its own read-only connection and the
+        row joined up with its URL by hand, since ATTACH isn't allowed while
+        `conn` is inside a transaction.
+        """
+        for archive in self.list(conn):
+            path = self.path(archive["name"])
+            if not os.path.exists(path):
+                continue
+            source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                row = source.execute(
+                    "SELECT seq, visited_at, url_id FROM history WHERE id = ?", (entry_id,)
+                ).fetchone()
+            finally:
+                source.close()
+            if row:
+                seq, visited_at, url_id = row
+                return conn.execute(
+                    f"""
+                    SELECT {columns} FROM (
+                        SELECT ? AS seq, ? AS visited_at, ? AS id, url, title,
+                               strftime('%Y-%m-%dT%H:%M:%fZ', ? / 1000.0, 'unixepoch') AS timestamp,
+                               domain
+                        FROM urls WHERE id = ?
+                    )
+                    """,
+                    (seq, visited_at, entry_id, visited_at, url_id)
+                ).fetchone()
+        return None
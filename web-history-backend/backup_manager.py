@@ -1,21 +1,66 @@
 import os
 import json
-import shutil
 import threading
 import time
 import sqlite3
 import hashlib
+import zlib
 from datetime import datetime
+from itertools import islice
+
+# zstd compresses better and faster when available; zlib is the fallback
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from database_manager import db_manager, history_db, folders_db
+from archive import ARCHIVE_PREFIX, ARCHIVE_SUFFIX
+from process_lock import ProcessLock
+from metrics import metrics
+from journal import IMPORT_OP
 
 # File paths
 DATABASE_FILE = 'web_history.db'
 CONFIG_FILE = "backup_config.json"
 BACKUP_METADATA_FILE = "backup_metadata.json"
 INTERVAL_FALLBACK = 3600  # Default backup interval (1 hour)
+BACKUP_PAGES_PER_STEP = 1024  # Pages copied per backup step (4 MB with default page size)
+BACKUP_STEP_SLEEP = 0.01  # Pause between backup steps so other work gets a turn
+RESTORE_LOCK_TIMEOUT = 60  # Seconds a restore waits for other processes' writes to finish
+
+# Backup store layout, relative to the backup directory
+CATALOG_FILE = "catalog.json"
+MANIFEST_DIR = "manifests"
+CHUNK_DIR = "chunks"
+CHUNK_SIZE = 256 * 1024  # Snapshot chunk size; a multiple of every SQLite page size
+REPLAY_BATCH_SIZE = 5000  # Journal records replayed per transaction
+
+# Journaled operations that attach an archive, which can't happen inside a
+# shared transaction, so replay runs them in transactions of their own
+STANDALONE_OPERATIONS = {"history.archive_batch"}
+
+def compress_chunk(data):
+    """Compress a chunk, returning (compressed bytes, file extension)"""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(data), "zst"
+    return zlib.compress(data, 6), "zz"
+
+def decompress_chunk(data, extension):
+    """Decompress a chunk stored with the given file extension"""
+    if extension == "zst":
+        if zstandard is None:
+            raise RuntimeError("Backup chunk is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
 
 class BackupManager:
     def __init__(self, db_file=DATABASE_FILE):
         self.db_file = db_file
+        
+        # Backups, pruning and restores all rewrite the catalog, from
+        # whichever worker process they were started in
+        self._lock = ProcessLock(f"{db_file}.backup.lock")
     
     def load_backup_config(self):
         """Load backup configuration from file"""
@@ -48,7 +93,7 @@ class BackupManager:
                 pass
         return {
             "last_backup_time": 0,
-            "db_hash": None
+            "data_version": None
         }
     
     def save_backup_metadata(self, metadata):
@@ -56,22 +101,72 @@ class BackupManager:
         with open(BACKUP_METADATA_FILE, 'w') as f:
             json.dump(metadata, f, indent=2)
     
-    def calculate_db_hash(self):
-        """Calculate SHA-256 hash of database file to detect changes"""
+    def read_data_version(self, conn):
+        """Read the change counters that identify the current database contents"""
+        cursor = conn.execute("SELECT resource, version FROM data_versions ORDER BY resource")
+        return ",".join(f"{resource}:{version}" for resource, version in cursor)
+    
+    def get_data_version(self):
+        """Get the current data version without reading the database file"""
         if not os.path.exists(self.db_file):
             return None
         
-        hasher = hashlib.sha256()
-        with open(self.db_file, 'rb') as f:
-            buf = f.read(65536)  # Read in 64k chunks
-            while len(buf) > 0:
-                hasher.update(buf)
-                buf = f.read(65536)
-        return hasher.hexdigest()
+        conn = sqlite3.connect(self.db_file)
+        try:
+            return self.read_data_version(conn)
+        finally:
+            conn.close()
+    
+    def read_journal_lsn(self, conn):
+        """Read the position of the newest journal record held by a database"""
+        row = conn.execute("SELECT lsn FROM journal_state").fetchone()
+        return row[0] if row else 0
+    
+    def copy_database(self, backup_path):
+        """Copy the live database with the online backup API.
+        
+        The copy runs inside one read transaction, so it is a consistent
+        snapshot and, in WAL mode, writers carry on while it runs instead of
+        forcing the backup to restart. Returns the data version, journal
+        position and archive versions of the copy.
+        """
+        temp_path = backup_path + ".tmp"
+        source = sqlite3.connect(self.db_file, isolation_level=None)
+        target = sqlite3.connect(temp_path)
+        try:
+            source.execute("BEGIN")
+            data_version = self.read_data_version(source)
+            journal_lsn = self.read_journal_lsn(source)
+            archive_versions = db_manager.archives.versions(source)
+            
+            source.backup(
+                target,
+                pages=BACKUP_PAGES_PER_STEP,
+                progress=lambda status, remaining, total: time.sleep(BACKUP_STEP_SLEEP)
+            )
+            source.execute("COMMIT")
+        finally:
+            target.close()
+            source.close()
+        
+        os.replace(temp_path, backup_path)
+        return data_version, journal_lsn, archive_versions
+    
+    def copy_archive(self, name, backup_path):
+        """Copy one history archive with the online backup API"""
+        source = sqlite3.connect(f"file:{db_manager.archives.path(name)}?mode=ro", uri=True)
+        target = sqlite3.connect(backup_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
     
     def perform_backup(self):
         """Create a backup of the database if it has changed"""
         print("Checking for changes since last backup...")
+        started = time.perf_counter()
+        outcome = "failed"
         try:
             config = self.load_backup_config()
             interval = config.get("backup_interval_seconds", INTERVAL_FALLBACK)
@@ -83,38 +178,44 @@ class BackupManager:
             
             # Get last backup info
             metadata = self.get_backup_metadata()
-            current_hash = self.calculate_db_hash()
+            current_version = self.get_data_version()
             
-            if current_hash is None:
+            if current_version is None:
                 print(f"Database file {self.db_file} not found, skipping backup")
+                outcome = "skipped"
                 return interval
             
-            if current_hash != metadata.get("db_hash"):
-                # Database has changed, create a backup
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                backup_path = os.path.join(backup_dir, f"web_history_{timestamp}.db")
-                
-                # First make sure database is not in the middle of a transaction
-                try:
-                    conn = sqlite3.connect(self.db_file)
-                    conn.execute("PRAGMA wal_checkpoint(FULL)")
-                    conn.close()
-                except Exception as e:
-                    print(f"Warning: Could not checkpoint database: {e}")
-                
-                # Copy the database file
-                shutil.copy2(self.db_file, backup_path)
-                print(f"Created backup at {backup_path}")
+            if current_version != metadata.get("data_version"):
+                # Database has changed, take a snapshot and store its chunks.
+                # Archiving waits, so the archives match the snapshot's catalog of them
+                with self._lock, db_manager.archives.lock:
+                    timestamp = self.new_timestamp(backup_dir)
+                    snapshot_path = os.path.join(backup_dir, f"web_history_{timestamp}.db.snapshot")
+                    try:
+                        data_version, journal_lsn, archive_versions = self.copy_database(snapshot_path)
+                        archives, archive_stored = self.store_archives(backup_dir, archive_versions)
+                        entry = self.store_snapshot(backup_dir, timestamp, snapshot_path, journal_lsn, archives)
+                        entry["stored_size"] += archive_stored
+                    finally:
+                        if os.path.exists(snapshot_path):
+                            os.remove(snapshot_path)
+                    
+                    # Start a new journal segment with each snapshot
+                    db_manager.journal.rotate()
+                print(f"Created backup {timestamp}: {entry['size']} bytes, {entry['stored_size']} bytes of new chunks")
+                outcome = "created"
                 
                 # Update metadata
                 metadata["last_backup_time"] = time.time()
-                metadata["db_hash"] = current_hash
+                metadata["data_version"] = data_version
+                metadata.pop("db_hash", None)
                 self.save_backup_metadata(metadata)
                 
                 # Prune old backups if we exceed the maximum
                 self.prune_old_backups(backup_dir, max_backups)
             else:
                 print("No changes detected since last backup, skipping...")
+                outcome = "unchanged"
             
             return interval
         except Exception as e:
@@ -122,54 +223,450 @@ class BackupManager:
             import traceback
             traceback.print_exc()
             return INTERVAL_FALLBACK
+        finally:
+            size, stored = (entry["size"], entry["stored_size"]) if outcome == "created" else (0, 0)
+            metrics.observe_backup("backup", outcome, time.perf_counter() - started, size, stored)
+    
+    def get_backup_dir(self):
+        """Absolute path of the configured backup directory"""
+        config = self.load_backup_config()
+        return os.path.abspath(config.get("backup_directory", "./backups"))
+    
+    def load_catalog(self, backup_dir):
+        """Load the backup catalog, building it on first use"""
+        catalog_path = os.path.join(backup_dir, CATALOG_FILE)
+        try:
+            with open(catalog_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            catalog = {"backups": self.find_legacy_backups(backup_dir)}
+            if catalog["backups"]:
+                self.save_catalog(backup_dir, catalog)
+            return catalog
+    
+    def save_catalog(self, backup_dir, catalog):
+        """Atomically replace the backup catalog"""
+        catalog_path = os.path.join(backup_dir, CATALOG_FILE)
+        with open(catalog_path + ".tmp", "w") as f:
+            json.dump(catalog, f, indent=2)
+        os.replace(catalog_path + ".tmp", catalog_path)
+    
+    def find_legacy_backups(self, backup_dir):
+        """Catalog entries for whole-file backups made before the chunk store"""
+        if not os.path.isdir(backup_dir):
+            return []
+        
+        backups = []
+        for filename in os.listdir(backup_dir):
+            if filename.startswith("web_history_") and filename.endswith(".db"):
+                filepath = os.path.join(backup_dir, filename)
+                size = os.path.getsize(filepath)
+                backups.append({
+                    "timestamp": filename.replace("web_history_", "").replace(".db", ""),
+                    "format": "file",
+                    "filename": filename,
+                    "size": size,
+                    "stored_size": size,
+                    "created": datetime.fromtimestamp(os.path.getctime(filepath)).isoformat()
+                })
+        backups.sort(key=lambda x: x["timestamp"])
+        return backups
+    
+    def chunk_path(self, backup_dir, chunk):
+        """Location of a chunk file named like <sha256>.<extension>"""
+        return os.path.join(backup_dir, CHUNK_DIR, chunk[:2], chunk)
+    
+    def find_chunk(self, backup_dir, digest):
+        """Return the stored chunk name for a digest, if any"""
+        for extension in ("zst", "zz"):
+            chunk = f"{digest}.{extension}"
+            if os.path.exists(self.chunk_path(backup_dir, chunk)):
+                return chunk
+        return None
+    
+    def store_chunks(self, backup_dir, path):
+        """Split a file into chunks and store the new ones.
+        
+        Chunks are addressed by the SHA-256 of their contents, so pages that
+        haven't changed since an earlier backup are stored only once.
+        Returns (chunk names, size, bytes of new chunks stored).
+        """
+        chunks = []
+        size = 0
+        stored_size = 0
+        
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                
+                digest = hashlib.sha256(data).hexdigest()
+                chunk = self.find_chunk(backup_dir, digest)
+                if chunk is None:
+                    compressed, extension = compress_chunk(data)
+                    chunk = f"{digest}.{extension}"
+                    path = self.chunk_path(backup_dir, chunk)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path + ".tmp", "wb") as out:
+                        out.write(compressed)
+                    os.replace(path + ".tmp", path)
+                    stored_size += len(compressed)
+                chunks.append(chunk)
+        return chunks, size, stored_size
+    
+    def store_archives(self, backup_dir, versions):
+        """Store every history archive, skipping those unchanged since the last backup.
+        
+        An archive whose version matches the catalog's record of it reuses
+        the chunks stored then without being read. Returns the manifest
+        entries by archive name and the bytes of new chunks stored.
+        """
+        catalog = self.load_catalog(backup_dir)
+        previous = catalog.get("archives", {})
+        archives = {}
+        stored_size = 0
+        
+        for name, version in sorted(versions.items()):
+            known = previous.get(name)
+            if known and known["version"] == version and all(
+                os.path.exists(self.chunk_path(backup_dir, chunk)) for chunk in known["chunks"]
+            ):
+                archives[name] = known
+                continue
+            
+            copy_path = os.path.join(backup_dir, f"history_{name}.db.snapshot")
+            try:
+                self.copy_archive(name, copy_path)
+                chunks, size, stored = self.store_chunks(backup_dir, copy_path)
+            finally:
+                if os.path.exists(copy_path):
+                    os.remove(copy_path)
+            archives[name] = {"version": version, "size": size, "chunks": chunks}
+            stored_size += stored
+            print(f"Backed up archive {name}: {size} bytes, {stored} bytes of new chunks")
+        
+        catalog["archives"] = archives
+        self.save_catalog(backup_dir, catalog)
+        return archives, stored_size
+    
+    def new_timestamp(self, backup_dir):
+        """Name for a new backup: the current time, with a counter if a backup already has it.
+        
+        Backups are named to the second, so two in the same second would
+        otherwise share a manifest. The counter also goes past the catalog's
+        other backups from that second, as backups are ordered by name and
+        a name freed by pruning would sort before the ones kept. Call with the backup and archives locks held, which
+        keep other processes from taking the same name meanwhile.
+        """
+        base = datetime.now().strftime("%Y%m%d_%H%M%S")
+        same_second = [
+            entry["timestamp"] for entry in self.load_catalog(backup_dir)["backups"]
+            if entry["timestamp"].startswith(base)
+        ]
+        latest = max(same_second, default="")
+        timestamp = base
+        counter = 1
+        while timestamp <= latest or os.path.exists(os.path.join(backup_dir, MANIFEST_DIR, f"web_history_{timestamp}.json")):
+            counter += 1
+            timestamp = f"{base}_{counter:02d}"
+        return timestamp
+    
+    def store_snapshot(self, backup_dir, timestamp, snapshot_path, journal_lsn, archives=None):
+        """Split a snapshot into chunks, store the new ones and record a manifest"""
+        chunks, size, stored_size = self.store_chunks(backup_dir, snapshot_path)
+        
+        manifest_name = f"web_history_{timestamp}.json"
+        os.makedirs(os.path.join(backup_dir, MANIFEST_DIR), exist_ok=True)
+        with open(os.path.join(backup_dir, MANIFEST_DIR, manifest_name), "w") as f:
+            json.dump({
+                "timestamp": timestamp,
+                "size": size,
+                "chunk_size": CHUNK_SIZE,
+                "journal_lsn": journal_lsn,
+                "chunks": chunks,
+                "archives": archives or {}
+            }, f)
+        
+        entry = {
+            "timestamp": timestamp,
+            "format": "chunked",
+            "filename": manifest_name,
+            "size": size,
+            "stored_size": stored_size,
+            "journal_lsn": journal_lsn,
+            "created": datetime.now().isoformat()
+        }
+        catalog = self.load_catalog(backup_dir)
+        catalog["backups"].append(entry)
+        self.save_catalog(backup_dir, catalog)
+        return entry
+    
+    def load_manifest(self, backup_dir, entry):
+        """Load the manifest of a chunked backup"""
+        with open(os.path.join(backup_dir, MANIFEST_DIR, entry["filename"]), "r") as f:
+            return json.load(f)
+    
+    def manifest_chunks(self, manifest):
+        """Every chunk a manifest uses, for the database and its archives"""
+        chunks = set(manifest["chunks"])
+        for archive in manifest.get("archives", {}).values():
+            chunks.update(archive["chunks"])
+        return chunks
+    
+    def list_backups(self):
+        """List backups from the catalog, newest first"""
+        backup_dir = self.get_backup_dir()
+        with self._lock:
+            catalog = self.load_catalog(backup_dir)
+        return sorted(catalog["backups"], key=lambda x: x["timestamp"], reverse=True)
     
     def prune_old_backups(self, backup_dir, max_backups):
         """Remove old backups if we exceed the maximum number of backups"""
         try:
-            backup_files = [f for f in os.listdir(backup_dir) if f.startswith("web_history_") and f.endswith(".db")]
-            if len(backup_files) <= max_backups:
-                return
-            
-            # Sort by date (oldest first)
-            backup_files.sort()
-            
-            # Remove oldest backups
-            for i in range(len(backup_files) - max_backups):
-                old_file = os.path.join(backup_dir, backup_files[i])
-                os.remove(old_file)
-                print(f"Removed old backup: {old_file}")
+            with self._lock:
+                catalog = self.load_catalog(backup_dir)
+                backups = sorted(catalog["backups"], key=lambda x: x["timestamp"])
+                if len(backups) <= max_backups:
+                    return
+                
+                expired = backups[:len(backups) - max_backups]
+                kept = backups[len(backups) - max_backups:]
+                catalog["backups"] = kept
+                self.save_catalog(backup_dir, catalog)
+                
+                # Chunks still used by a kept backup must stay
+                live_chunks = set()
+                for entry in kept:
+                    if entry["format"] == "chunked":
+                        live_chunks.update(self.manifest_chunks(self.load_manifest(backup_dir, entry)))
+                for archive in catalog.get("archives", {}).values():
+                    live_chunks.update(archive["chunks"])
+                
+                for entry in expired:
+                    if entry["format"] == "chunked":
+                        for chunk in self.manifest_chunks(self.load_manifest(backup_dir, entry)) - live_chunks:
+                            os.remove(self.chunk_path(backup_dir, chunk))
+                        os.remove(os.path.join(backup_dir, MANIFEST_DIR, entry["filename"]))
+                    else:
+                        os.remove(os.path.join(backup_dir, entry["filename"]))
+                    print(f"Removed old backup: {entry['timestamp']}")
+                
+                # Journal segments older than every kept snapshot can't be replayed any more
+                positions = [entry.get("journal_lsn") for entry in kept]
+                if None not in positions:
+                    db_manager.journal.prune(min(positions))
         except Exception as e:
             print(f"Error pruning old backups: {e}")
     
-    def restore_backup(self, timestamp):
-        """Restore from a backup file"""
-        config = self.load_backup_config()
-        backup_dir = os.path.abspath(config.get("backup_directory", "./backups"))
-        backup_file = f"web_history_{timestamp}.db"
-        backup_path = os.path.join(backup_dir, backup_file)
+    def iter_chunk_data(self, backup_dir, chunks):
+        """Yield the decompressed contents of stored chunks in order"""
+        for chunk in chunks:
+            with open(self.chunk_path(backup_dir, chunk), "rb") as f:
+                yield decompress_chunk(f.read(), chunk.rsplit(".", 1)[1])
+    
+    def iter_backup_data(self, backup_dir, entry):
+        """Yield the contents of a backup as a stream of byte blocks"""
+        if entry["format"] == "chunked":
+            yield from self.iter_chunk_data(backup_dir, self.load_manifest(backup_dir, entry)["chunks"])
+        else:
+            with open(os.path.join(backup_dir, entry["filename"]), "rb") as f:
+                while True:
+                    data = f.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    yield data
+    
+    def restore_backup(self, timestamp, until=None):
+        """Restore the database from a backup.
         
-        if not os.path.exists(backup_path):
-            print(f"Backup not found: {backup_file}")
-            return False
+        With `until` (a datetime), journaled writes made after the snapshot
+        are replayed up to that moment. Journal records after the restored
+        point are set aside either way.
+        """
+        started = time.perf_counter()
+        restored = self._restore_backup(timestamp, until)
+        metrics.observe_backup("restore", "restored" if restored else "failed", time.perf_counter() - started)
+        return restored
+    
+    def _restore_backup(self, timestamp, until):
+        backup_dir = self.get_backup_dir()
+        with self._lock:
+            catalog = self.load_catalog(backup_dir)
+            entry = next((b for b in catalog["backups"] if b["timestamp"] == timestamp), None)
+            
+            if entry is None:
+                print(f"Backup not found: {timestamp}")
+                return False
+            
+            if until is not None and entry.get("journal_lsn") is None:
+                print(f"Backup {timestamp} predates the journal, so it can't be rolled forward")
+                return False
+            
+            try:
+                # Check if current database exists
+                if os.path.exists(self.db_file):
+                    # Create a backup of current state just in case
+                    timestamp_now = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    current_backup = f"{self.db_file}.{timestamp_now}.bak"
+                    self.copy_database(current_backup)
+                    print(f"Created backup of current database at {current_backup}")
+            
+                # Rebuild the snapshot next to the database before touching it
+                restore_path = self.db_file + ".restore"
+                with open(restore_path, "wb") as f:
+                    for data in self.iter_backup_data(backup_dir, entry):
+                        f.write(data)
+                
+                # Bring it up to date with a new epoch before it goes live, so
+                # no process ever serves it under the old one
+                db_manager.prepare_replacement(restore_path)
+            
+                # Copy it into the live database rather than renaming it over
+                # the file: other processes keep WAL connections open on it,
+                # and the backup API writes under SQLite's own locking, so
+                # they simply see the restored pages
+                source = sqlite3.connect(restore_path)
+                target = sqlite3.connect(self.db_file, timeout=RESTORE_LOCK_TIMEOUT)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+                    source.close()
+                os.remove(restore_path)
+                
+                if entry["format"] == "chunked":
+                    self.restore_archives(backup_dir, self.load_manifest(backup_dir, entry).get("archives", {}))
+                else:
+                    self.restore_archives(backup_dir, {})
+            
+                # Counters restart from the backup's values, so the next check must back up
+                metadata = self.get_backup_metadata()
+                metadata["data_version"] = None
+                self.save_backup_metadata(metadata)
+            
+                # Older backups may predate the latest migrations
+                db_manager.initialize_db()
+                print(f"Restored database from backup {timestamp}")
+                
+                with db_manager.get_connection() as conn:
+                    lsn = self.read_journal_lsn(conn)
+                if until is not None:
+                    lsn = self.replay_journal(lsn, until)
+                db_manager.journal.truncate_after(lsn)
+                
+                history_db.invalidate_frequent()
+                folders_db.invalidate_cache()
+                return True
+            except Exception as e:
+                print(f"Restore failed: {e}")
+                import traceback
+                traceback.print_exc()
+                return False
+    
+    def restore_archives(self, backup_dir, archives):
+        """Put the history archives back as they were when a backup was taken.
         
-        try:
-            # Check if current database exists
-            if os.path.exists(self.db_file):
-                # Create a backup of current state just in case
-                timestamp_now = datetime.now().strftime("%Y%m%d_%H%M%S")
-                current_backup = f"{self.db_file}.{timestamp_now}.bak"
-                shutil.copy2(self.db_file, current_backup)
-                print(f"Created backup of current database at {current_backup}")
-            
-            # Copy the backup file to the current database location
-            shutil.copy2(backup_path, self.db_file)
-            print(f"Restored database from {backup_file}")
-            return True
-        except Exception as e:
-            print(f"Restore failed: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+        The archive files there now are moved aside into a replaced_<time>
+        directory first, including ones the backup doesn't know about: the
+        restored database still holds the visits those were filled with.
+        """
+        if db_manager.config is None:
+            db_manager.load_config()
+        store = db_manager.archives
+        
+        with store.lock:
+            if os.path.isdir(store.directory):
+                aside = os.path.join(store.directory, f"replaced_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+                for filename in os.listdir(store.directory):
+                    if filename.startswith(ARCHIVE_PREFIX) and filename.endswith(ARCHIVE_SUFFIX):
+                        os.makedirs(aside, exist_ok=True)
+                        os.replace(os.path.join(store.directory, filename), os.path.join(aside, filename))
+            
+            for name, archive in archives.items():
+                os.makedirs(store.directory, exist_ok=True)
+                path = store.path(name)
+                with open(path + ".restore", "wb") as f:
+                    for data in self.iter_chunk_data(backup_dir, archive["chunks"]):
+                        f.write(data)
+                os.replace(path + ".restore", path)
+            
+            catalog = self.load_catalog(backup_dir)
+            catalog["archives"] = archives
+            self.save_catalog(backup_dir, catalog)
+        
+        if archives:
+            print(f"Restored {len(archives)} history archives")
+    
+    def replay_journal(self, after_lsn, until):
+        """Apply journaled writes after `after_lsn` up to `until`; returns the last LSN applied"""
+        operations = {
+            "history.add": history_db.add,
+            "history.add_batch": history_db.add_batch,
+            "history.compact_batch": history_db.compact_batch,
+            "history.archive_batch": history_db.archive_batch,
+            "folders.create": folders_db.create,
+            "folders.delete": folders_db.delete,
+            "folders.add_page": folders_db.add_page,
+            "folders.remove_page": folders_db.remove_page,
+            "folders.move_page": folders_db.move_page,
+            "folders.rename": folders_db.rename,
+            "folders.update_order": folders_db.update_order,
+            "folders.update_page_order": folders_db.update_page_order
+        }
+        
+        started = time.perf_counter()
+        last_lsn = after_lsn
+        applied = 0
+        records = db_manager.journal.read(after_lsn, until.timestamp())
+        
+        while True:
+            batch = list(islice(records, REPLAY_BATCH_SIZE))
+            if not batch:
+                break
+            
+            # A gap means a segment is missing; stop at the last consistent point.
+            # So does an import, whose rows the journal doesn't hold.
+            contiguous = []
+            for record in batch:
+                if record[0] != last_lsn + len(contiguous) + 1 or record[2] == IMPORT_OP:
+                    break
+                contiguous.append(record)
+            
+            # Group records into runs that share a transaction
+            runs = []
+            for record in contiguous:
+                if record[2] in STANDALONE_OPERATIONS or not runs or runs[-1][-1][2] in STANDALONE_OPERATIONS:
+                    runs.append([])
+                runs[-1].append(record)
+            
+            for run in runs:
+                if run[0][2] in STANDALONE_OPERATIONS:
+                    lsn, _, op, args = run[0]
+                    with db_manager.journal.replaying(lsn):
+                        operations[op](*args)
+                    continue
+                with db_manager.transaction() as conn:
+                    for lsn, _, op, args in run:
+                        with db_manager.journal.replaying(lsn):
+                            operations[op](*args)
+                    conn.execute("UPDATE journal_state SET lsn = ?", (run[-1][0],))
+            
+            last_lsn += len(contiguous)
+            applied += len(contiguous)
+            if len(contiguous) < len(batch):
+                stopped = batch[len(contiguous)]
+                if stopped[0] == last_lsn + 1 and stopped[2] == IMPORT_OP:
+                    print(f"Journal record {last_lsn + 1} is an import, which can't be replayed; stopping there. "
+                          f"Restore the backup taken after it to go further")
+                else:
+                    print(f"Journal is missing record {last_lsn + 1}, stopping replay there")
+                break
+        
+        elapsed = time.perf_counter() - started
+        print(f"Replayed {applied} journal records up to {until.isoformat()} in {elapsed:.2f}s")
+        return last_lsn
     
     def backup_files_periodically(self):
         """Run backup periodically based on the configured interval"""
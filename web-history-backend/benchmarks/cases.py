@@ -0,0 +1,253 @@
+"""Times the database layer against the dataset in the current directory.
+
+run.py starts this in a working directory holding the generated JSON files
+and the backend's schema, migrations and configs. The dataset is loaded
+through migrate_from_json, which is itself the first case. Read-only cases
+run next, then writes, backups and finally moving old visits into archives
+and rollups, after which the history reads are timed again over the tiers.
+Library output goes to stdout and progress to stderr.
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from benchmarks.stats import summarize, peak_rss_mb
+from benchmarks.datagen import iso
+
+from database_manager import (
+    db_manager, history_db, folders_db, encode_cursor, retention_cutoff, DAY_MS
+)
+from backup_manager import backup_manager
+
+# Timing settings
+DEFAULT_BUDGET_SECONDS = 3.0   # Stop repeating a case after this long...
+MAX_ITERATIONS = 1000          # ...or after this many iterations
+GET_ALL_LIMIT = 1000000        # history.get_all holds every visit in memory; skipped above this
+BATCH_VISITS = 100             # Visits per add_batch call, as the extension batches them
+TIER_BATCH = 5000              # Visits per compact_batch and archive_batch call
+ARCHIVE_DAYS = 180             # Visits older than this are archived...
+RETENTION_DAYS = 90            # ...and those older than this rolled up
+
+def drain(iterable):
+    """Consume an iterator without keeping what it yields"""
+    collections.deque(iterable, maxlen=0)
+
+class Bench:
+    """Times operations and collects their figures by case name"""
+
+    def __init__(self, budget=DEFAULT_BUDGET_SECONDS, max_iterations=MAX_ITERATIONS):
+        self.budget = budget
+        self.max_iterations = max_iterations
+        self.results = {}
+
+    def measure(self, name, operation, iterations=None, setup=None):
+        """Time operation(i) until the budget or the iteration limit runs out.
+
+        `setup(i)`, when given, runs untimed before each call.
+        """
+        print(f"  {name}...", end="", file=sys.stderr, flush=True)
+        rss_before = peak_rss_mb()
+        samples = []
+        started = time.perf_counter()
+        limit = self.max_iterations if iterations is None else min(iterations, self.max_iterations)
+        for i in range(limit):
+            if setup is not None:
+                setup(i)
+            begin = time.perf_counter_ns()
+            operation(i)
+            samples.append(time.perf_counter_ns() - begin)
+            if time.perf_counter() - started > self.budget:
+                break
+
+        result = summarize(samples)
+        result["peak_rss_mb"] = peak_rss_mb()
+        if rss_before is not None:
+            result["rss_growth_mb"] = round(result["peak_rss_mb"] - rss_before, 1)
+        self.results[name] = result
+        print(f" {result['iterations']}x, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms", file=sys.stderr)
+        return result
+
+    def skip(self, name, reason):
+        """Record a case that was left out"""
+        self.results[name] = {"skipped": reason}
+        print(f"  {name}: skipped, {reason}", file=sys.stderr)
+
+def sample_history(count, rng):
+    """Ids and URLs of up to `count` random raw visits"""
+    with db_manager.get_connection() as conn:
+        low, high = conn.execute("SELECT MIN(seq), MAX(seq) FROM history").fetchone()
+        rows = []
+        for _ in range(count):
+            row = conn.execute(
+                "SELECT id, url, title FROM history_pages WHERE seq >= ? ORDER BY seq LIMIT 1",
+                (rng.randint(low, high),)
+            ).fetchone()
+            rows.append(dict(row))
+    return rows
+
+def position_at(days_ago):
+    """Cursor just past every visit at the moment `days_ago` days back"""
+    return encode_cursor(int(time.time() * 1000) - days_ago * DAY_MS, 2 ** 62)
+
+def week_bounds(days_ago):
+    """ISO [start, end) of the week ending `days_ago` days back"""
+    end = int(time.time() * 1000) - days_ago * DAY_MS
+    return iso(end - 7 * DAY_MS), iso(end)
+
+def new_visit(number, sample, rng):
+    """A visit like the extension sends: mostly revisits, some new pages"""
+    now = int(time.time() * 1000)
+    if rng.random() < 0.7:
+        page = rng.choice(sample)
+        url, title = page["url"], page["title"]
+    else:
+        url, title = f"https://bench.example.com/page/{number}", f"Benchmark page {number}"
+    return {"id": f"{now}-bench{number}", "url": url, "title": title, "timestamp": iso(now)}
+
+def history_reads(bench, visits, suffix=""):
+    """Time the HistoryDB read methods"""
+    mid_cursor = position_at(182)
+    week_start, week_end = week_bounds(182)
+
+    bench.measure(f"history.get_page{suffix}", lambda i: history_db.get_page(100))
+    bench.measure(f"history.get_page.deep{suffix}", lambda i: history_db.get_page(100, before=mid_cursor))
+    bench.measure(f"history.get_page.after{suffix}", lambda i: history_db.get_page(100, after=mid_cursor))
+    bench.measure(f"history.get_page.range{suffix}", lambda i: history_db.get_page(100, start=week_start, end=week_end))
+    bench.measure(f"history.iter_range.week{suffix}", lambda i: drain(history_db.iter_range(week_start, week_end)))
+    bench.measure(f"history.iter_range{suffix}", lambda i: drain(history_db.iter_range()), iterations=3)
+    bench.measure(f"history.iter_all_json{suffix}", lambda i: drain(history_db.iter_all_json()), iterations=3)
+    if visits <= GET_ALL_LIMIT:
+        bench.measure(f"history.get_all{suffix}", lambda i: history_db.get_all(), iterations=3)
+    else:
+        bench.skip(f"history.get_all{suffix}", f"holds every visit in memory; run only up to {GET_ALL_LIMIT} visits")
+
+def run(budget, max_iterations, seed):
+    """Run every case and return the results"""
+    rng = random.Random(seed)
+    bench = Bench(budget, max_iterations)
+    with open("dataset.json") as f:
+        dataset = json.load(f)
+    visits = dataset["visits"]
+
+    db_manager.initialize_db()
+    db_manager.load_config()
+
+    # Loading the dataset is the migration benchmark
+    migrated = []
+    bench.measure("db.migrate_from_json", lambda i: migrated.append(db_manager.migrate_from_json()), iterations=1)
+    if not all(migrated):
+        raise RuntimeError("Loading the dataset with migrate_from_json failed; see the log")
+    # Most of a fresh load may still sit in the write-ahead log
+    db_bytes = sum(
+        os.path.getsize(path) for path in (db_manager.db_file, f"{db_manager.db_file}-wal") if os.path.exists(path)
+    )
+
+    sample = sample_history(500, rng)
+    folders = folders_db.get_all()
+    folder_ids = [folder["id"] for folder in folders]
+
+    print("Reads", file=sys.stderr)
+    history_reads(bench, visits)
+    bench.measure("history.get_frequent.cold", lambda i: history_db.get_frequent(100),
+                  setup=lambda i: history_db.invalidate_frequent())
+    bench.measure("history.get_frequent", lambda i: history_db.get_frequent(100))
+    bench.measure("history.iter_frequent_json", lambda i: drain(history_db.iter_frequent_json()), iterations=3)
+    bench.measure("folders.get_all.cold", lambda i: folders_db.get_all(),
+                  setup=lambda i: folders_db.invalidate_cache())
+    bench.measure("folders.get_all", lambda i: folders_db.get_all())
+    bench.measure("folders.load_tree", lambda i: folders_db.load_tree())
+    bench.measure("folders.iter_pages", lambda i: drain(folders_db.iter_pages()))
+    bench.measure("folders.iter_all_json", lambda i: drain(folders_db.iter_all_json()))
+
+    print("Writes", file=sys.stderr)
+    counter = iter(range(10 ** 9))
+    bench.measure("history.add", lambda i: history_db.add(new_visit(next(counter), sample, rng)))
+    bench.measure("history.add_batch", lambda i: history_db.add_batch(
+        [new_visit(next(counter), sample, rng) for _ in range(BATCH_VISITS)]
+    ))
+
+    created = []
+    bench.measure("folders.create", lambda i: created.append(
+        folders_db.create({"id": f"bench-folder-{i}", "name": f"Benchmark folder {i}"})["id"]
+    ))
+    bench.measure("folders.rename", lambda i: folders_db.rename(created[i % len(created)], f"Renamed folder {i}"))
+
+    # Pages added here are moved around and removed again below; each entry is [folder id, page id]
+    added = []
+
+    def add_page(i):
+        page = rng.choice(sample)
+        folder_id = rng.choice(folder_ids)
+        ok, _ = folders_db.add_page(folder_id, {"id": f"bench-page-{i}", "url": page["url"], "title": page["title"]})
+        if ok:
+            added.append([folder_id, f"bench-page-{i}"])
+
+    bench.measure("folders.add_page", add_page)
+
+    def move_page(i):
+        entry = added[i % len(added)]
+        target = rng.choice(folder_ids)
+        ok, _ = folders_db.move_page(entry[0], entry[1], target)
+        if ok:
+            entry[0] = target
+
+    bench.measure("folders.move_page", move_page)
+    bench.measure("folders.move_page.from_history", lambda i: folders_db.move_page(
+        None, rng.choice(sample)["id"], rng.choice(folder_ids)
+    ))
+
+    largest = max(folders, key=lambda folder: len(folder["pages"]))
+    largest_pages = [{"id": page["page_id"]} for page in largest["pages"]]
+    bench.measure("folders.update_page_order", lambda i: folders_db.update_page_order(
+        largest["id"], largest_pages[::-1] if i % 2 else largest_pages
+    ))
+    order = [{"id": folder_id} for folder_id in folder_ids + created]
+    bench.measure("folders.update_order", lambda i: folders_db.update_order(order[::-1] if i % 2 else order))
+    bench.measure("folders.remove_page", lambda i: folders_db.remove_page(*added[i]), iterations=len(added))
+    bench.measure("folders.delete", lambda i: folders_db.delete(created[i]), iterations=len(created))
+
+    print("Backups", file=sys.stderr)
+    bench.measure("backup.perform_backup.full", lambda i: backup_manager.perform_backup(), iterations=1)
+    bench.measure("backup.perform_backup.incremental", lambda i: backup_manager.perform_backup(), iterations=10,
+                  setup=lambda i: history_db.add_batch([new_visit(next(counter), sample, rng) for _ in range(BATCH_VISITS)]))
+
+    print("Archives and rollups", file=sys.stderr)
+    archive_cutoff = retention_cutoff(ARCHIVE_DAYS)
+    bench.measure("history.archive_batch", lambda i: history_db.archive_batch(archive_cutoff, TIER_BATCH))
+    retention = retention_cutoff(RETENTION_DAYS)
+    bench.measure("history.compact_batch", lambda i: history_db.compact_batch(retention, TIER_BATCH))
+
+    # Finish what the budget left, so the tiers look like a compacted database
+    while history_db.archive_batch(archive_cutoff, TIER_BATCH):
+        pass
+    while history_db.compact_batch(retention, TIER_BATCH):
+        pass
+
+    # Reads again once old visits live in rollups and archives
+    print("Reads over tiers", file=sys.stderr)
+    history_reads(bench, visits, ".tiered")
+
+    return {
+        "dataset": dataset,
+        "db_bytes": db_bytes,
+        "peak_rss_mb": peak_rss_mb(),
+        "cases": bench.results
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the database layer in the current directory")
+    parser.add_argument("--output", required=True, help="File to write the results to")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="Seconds to repeat each case for")
+    parser.add_argument("--max-iterations", type=int, default=MAX_ITERATIONS)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    results = run(args.budget, args.max_iterations, args.seed)
+    results["finished"] = datetime.now(timezone.utc).isoformat()
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,278 @@
+"""Synthetic browsing data in the JSON files migrate_from_json reads.
+
+Sites and pages are picked with Zipf-like popularity, so a few sites and
+pages take most visits and the rest form a long tail, the way real history
+looks. Visits spread over SPAN_DAYS with more on weekdays and in the
+daytime, and folders hold a skewed number of pages each. The same seed
+always gives the same data.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import string
+from array import array
+from datetime import datetime, timezone
+
+# Shape of the generated data
+SPAN_DAYS = 365                  # Visits go back this far from yesterday
+VISITS_PER_URL = 3.5             # Average visits to each distinct URL
+VISITS_PER_DOMAIN = 40           # Average visits to each site
+SITE_SKEW = 1.1                  # Zipf exponent of site popularity
+PAGE_SKEW = 0.9                  # Zipf exponent of page popularity
+QUERY_SHARE = 0.12               # URLs carrying a query string
+UNICODE_SHARE = 0.03             # Titles with accents or CJK characters
+MAX_FOLDER_PAGES = 300
+WRITE_BATCH = 10000              # Records encoded per write
+
+# Visits by hour of day and day of week (Monday first), relative
+HOUR_WEIGHTS = [1, 0.5, 0.3, 0.2, 0.2, 0.3, 0.8, 2, 4, 6, 7, 7, 6, 7, 7, 7, 6, 5, 5, 5, 5, 4, 3, 2]
+WEEKDAY_WEIGHTS = [1.1, 1.15, 1.15, 1.1, 1.0, 0.75, 0.75]
+
+# Well-known sites head the popularity ranking
+POPULAR_SITES = [
+    ("www.google.com", "Google Search"),
+    ("github.com", "GitHub"),
+    ("stackoverflow.com", "Stack Overflow"),
+    ("www.youtube.com", "YouTube"),
+    ("en.wikipedia.org", "Wikipedia"),
+    ("mail.google.com", "Gmail"),
+    ("news.ycombinator.com", "Hacker News"),
+    ("www.reddit.com", "Reddit"),
+    ("docs.python.org", "Python documentation"),
+    ("developer.mozilla.org", "MDN Web Docs"),
+    ("www.amazon.com", "Amazon.com"),
+    ("calendar.google.com", "Google Calendar"),
+    ("www.linkedin.com", "LinkedIn"),
+    ("medium.com", "Medium"),
+    ("www.nytimes.com", "The New York Times"),
+    ("pypi.org", "PyPI"),
+    ("www.npmjs.com", "npm"),
+    ("angular.dev", "Angular"),
+    ("chatgpt.com", "ChatGPT"),
+    ("www.bbc.com", "BBC"),
+]
+
+TLDS = [("com", 60), ("org", 10), ("net", 8), ("io", 6), ("dev", 4), ("de", 3), ("co.uk", 3), ("fr", 2), ("jp", 2), ("app", 2)]
+
+WORDS = """
+about account api app archive article async blog board build cache career chart cloud code
+compare config course css data database debug deploy design dev docs download editor error event
+example feature file forum game garden getting-started git guide health help history home hotel
+index install issue java job kitchen learn library list login map market media menu model movie
+music network news notes order overview package page photo plan post price product profile project
+python query react recipe release report review rust search security server settings shop sport
+started store story style support table team test thread ticket tips tools travel tutorial update
+upload user video view weather wiki work world
+""".split()
+
+UNICODE_WORDS = ["café", "naïve", "Zürich", "São Paulo", "東京", "日本語", "München", "résumé", "Ελληνικά", "Москва"]
+
+FOLDER_NAMES = [
+    "Reading list", "Work", "Recipes", "Travel", "Python", "Angular", "Research", "Shopping",
+    "Music", "News", "Tutorials", "Design", "Finance", "Health", "Projects", "Later", "Reference",
+    "Tools", "Gaming", "Home"
+]
+
+def zipf_cum_weights(count, skew):
+    """Cumulative Zipf weights over `count` ranks, for random.choices"""
+    return list(itertools.accumulate(1.0 / (rank + 1) ** skew for rank in range(count)))
+
+def iso(visited_at):
+    """ISO UTC timestamp of epoch milliseconds, as the extension sends them"""
+    moment = datetime.fromtimestamp(visited_at / 1000, timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{visited_at % 1000:03d}Z"
+
+def sizes_for(visits):
+    """Number of (urls, domains, folders) generated alongside `visits`"""
+    urls = max(100, int(visits / VISITS_PER_URL))
+    domains = min(max(len(POPULAR_SITES) + 30, visits // VISITS_PER_DOMAIN), 50000)
+    folders = 100 if visits <= 10000 else 300 if visits <= 100000 else 500
+    return urls, domains, folders
+
+class DataGenerator:
+    """Writes history.json, folders.json and frequency.json for a number of visits"""
+
+    def __init__(self, visits, folders=None, seed=42, now=None):
+        self.visits = visits
+        self.url_count, self.domain_count, default_folders = sizes_for(visits)
+        self.folder_count = folders if folders is not None else default_folders
+        self.rng = random.Random(seed)
+        self.now = int((now or datetime.now(timezone.utc).timestamp()) * 1000)
+
+        self.domains = []
+        self.urls = []
+        self.titles = []
+
+    def make_domains(self):
+        """Site host names and display names, most popular first"""
+        rng = self.rng
+        self.domains = list(POPULAR_SITES[:self.domain_count])
+        tlds = [tld for tld, _ in TLDS]
+        tld_weights = [weight for _, weight in TLDS]
+        seen = {host for host, _ in self.domains}
+        while len(self.domains) < self.domain_count:
+            name = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 11)))
+            host = f"{rng.choice(['', '', 'www.', 'blog.', 'docs.'])}{name}.{rng.choices(tlds, tld_weights)[0]}"
+            if host not in seen:
+                seen.add(host)
+                self.domains.append((host, name.capitalize()))
+
+    def make_urls(self):
+        """Distinct URLs and their titles, most visited first"""
+        rng = self.rng
+        domain_weights = zipf_cum_weights(len(self.domains), SITE_SKEW)
+        seen = set()
+        while len(self.urls) < self.url_count:
+            host, site = self.domains[rng.choices(range(len(self.domains)), cum_weights=domain_weights)[0]]
+            words = rng.sample(WORDS, rng.randint(1, 4))
+            path = "/".join(words[:rng.randint(1, len(words))])
+            if rng.random() < 0.4:
+                path += f"/{rng.randint(1, 99999)}"
+            url = f"https://{host}/{path}"
+            if rng.random() < QUERY_SHARE:
+                url += f"?q={'+'.join(rng.sample(WORDS, 2))}"
+            if url in seen:
+                continue
+            seen.add(url)
+
+            title = " ".join(word.replace("-", " ").capitalize() for word in words)
+            if rng.random() < UNICODE_SHARE:
+                title += f" {rng.choice(UNICODE_WORDS)}"
+            self.urls.append(url)
+            self.titles.append(f"{title} - {site}")
+
+    def day_counts(self):
+        """Visits on each day of the span, oldest first, summing to exactly `visits`"""
+        # The span ends yesterday, so no visit lies in the future
+        start_day = self.now // 86400000 - SPAN_DAYS
+        weights = [WEEKDAY_WEIGHTS[(start_day + day + 3) % 7] for day in range(SPAN_DAYS)]
+        total = sum(weights)
+        counts = []
+        carry = 0.0
+        for weight in weights:
+            exact = self.visits * weight / total + carry
+            counts.append(int(exact))
+            carry = exact - int(exact)
+        counts[-1] += self.visits - sum(counts)
+        return start_day, counts
+
+    def iter_visits(self):
+        """Yield (visited_at, url index) for every visit, oldest first"""
+        rng = self.rng
+        page_weights = zipf_cum_weights(len(self.urls), PAGE_SKEW)
+        ranks = list(range(len(self.urls)))
+        start_day, counts = self.day_counts()
+        for day, count in enumerate(counts):
+            day_start = (start_day + day) * 86400000
+            hours = rng.choices(range(24), HOUR_WEIGHTS, k=count)
+            times = sorted(day_start + hour * 3600000 + rng.randrange(3600000) for hour in hours)
+            yield from zip(times, rng.choices(ranks, cum_weights=page_weights, k=count))
+
+    def write_array(self, path, records):
+        """Stream encoded records into a JSON array file"""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("[")
+            first = True
+            while True:
+                batch = list(itertools.islice(records, WRITE_BATCH))
+                if not batch:
+                    break
+                f.write(("" if first else ",\n") + ",\n".join(batch))
+                first = False
+            f.write("]\n")
+
+    def write(self, directory):
+        """Write the three JSON files into `directory` and return what was generated"""
+        self.make_domains()
+        self.make_urls()
+        counts = array("I", bytes(4 * len(self.urls)))
+        last_visits = array("q", bytes(8 * len(self.urls)))
+        rng = self.rng
+
+        def history_records():
+            for visited_at, index in self.iter_visits():
+                counts[index] += 1
+                last_visits[index] = visited_at
+                suffix = "".join(rng.choice(string.ascii_lowercase + string.digits) for _ in range(6))
+                yield json.dumps({
+                    "id": f"{visited_at}-{suffix}",
+                    "url": self.urls[index],
+                    "title": self.titles[index],
+                    "timestamp": iso(visited_at)
+                }, ensure_ascii=False)
+
+        self.write_array(os.path.join(directory, "history.json"), history_records())
+
+        visited = [index for index in range(len(self.urls)) if counts[index]]
+        with open(os.path.join(directory, "frequency.json"), "w", encoding="utf-8") as f:
+            f.write("{")
+            for position, index in enumerate(visited):
+                url = self.urls[index]
+                f.write(("" if position == 0 else ",\n") + json.dumps(url) + ": " + json.dumps({
+                    "count": counts[index],
+                    "title": self.titles[index],
+                    "domain": url.split("/")[2],
+                    "lastVisit": iso(last_visits[index])
+                }, ensure_ascii=False))
+            f.write("}\n")
+
+        page_total = 0
+
+        def folder_records():
+            nonlocal page_total
+            names = {}
+            for number in range(self.folder_count):
+                base = rng.choice(FOLDER_NAMES)
+                names[base] = names.get(base, 0) + 1
+                name = base if names[base] == 1 else f"{base} {names[base]}"
+                size = min(MAX_FOLDER_PAGES, int(rng.paretovariate(1.2) * 5), len(visited))
+                pages = []
+                for page_number, index in enumerate(rng.sample(visited, size)):
+                    added = last_visits[index] + rng.randrange(3600000)
+                    pages.append({
+                        "id": str(added + page_number),
+                        "url": self.urls[index],
+                        "title": self.titles[index],
+                        "timestamp": iso(min(added, self.now))
+                    })
+                page_total += len(pages)
+                yield json.dumps({
+                    "id": f"folder-{number}",
+                    "name": name,
+                    "isCollapsed": rng.random() < 0.3,
+                    "pages": pages
+                }, ensure_ascii=False)
+
+        self.write_array(os.path.join(directory, "folders.json"), folder_records())
+
+        return {
+            "visits": self.visits,
+            "urls": len(visited),
+            "domains": len(self.domains),
+            "folders": self.folder_count,
+            "folder_pages": page_total,
+            "json_bytes": sum(
+                os.path.getsize(os.path.join(directory, name))
+                for name in ("history.json", "folders.json", "frequency.json")
+            )
+        }
+
+def parse_count(text):
+    """Parse counts like 10k or 1M"""
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic history JSON files")
+    parser.add_argument("directory", help="Where to write history.json, folders.json and frequency.json")
+    parser.add_argument("--visits", type=parse_count, default=10000, help="Number of visits, like 100k or 1M")
+    parser.add_argument("--folders", type=int, help="Number of folders (scales with visits if omitted)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    summary = DataGenerator(args.visits, args.folders, args.seed).write(args.directory)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,681 @@
+"""Drives the HTTP API with many simulated browsers running the extension.
+
+From web-history-backend:
+
+    python -m benchmarks.loadgen --clients 10,50,100,200          # server in a subprocess
+    python -m benchmarks.loadgen --clients 100 --workers 4 --speed 10
+    python -m benchmarks.loadgen --clients 50 --in-process
+    python -m benchmarks.loadgen --clients 50 --url http://127.0.0.1:5000 --server-log server.log
+
+Each simulated browser behaves like background.js: page loads are buffered
+and posted to /api/history/batch in batches of 20 or after 5 seconds, the
+folder menu polls /api/folders every minute with If-None-Match, pages are
+added to folders from the context menu, and where the dashboard is open,
+pages are dragged between folders while it refreshes /api/history. Actions
+arrive at random with the average rates of --mix, scaled by --speed, and
+don't wait for each other, so a slow server builds up a backlog the way
+real browsers would.
+
+Every client count in --clients is a stage of --duration seconds. Unless
+--url is given, a server is started on generated data: in a subprocess
+with --workers processes, or with --in-process in a thread of this
+process, which then competes with the clients for the GIL. The report
+shows throughput, latency percentiles and histograms per endpoint, the
+error rate and how often the server logged "database is locked", and
+names the stage where the server saturated.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import shutil
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from benchmarks.datagen import DataGenerator, zipf_cum_weights, iso, parse_count, PAGE_SKEW
+from benchmarks.run import prepare, BACKEND_DIR, RESULTS_DIR
+from benchmarks.stats import summarize, percentile
+
+# File descriptors are raised to the hard limit for many connections; Windows has no resource module
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Extension behaviour, as in background.js
+VISIT_BATCH_SIZE = 20
+VISIT_FLUSH_DELAY_SECONDS = 5
+VISIT_BUFFER_LIMIT = 500
+
+# Average actions per simulated browser per minute
+DEFAULT_MIX = {
+    "visit": 4,         # Page loads, posted in batches
+    "poll": 1,          # Folder menu refreshes
+    "add": 0.1,         # Pages added to a folder from the context menu
+    "move": 0.2,        # Pages dragged into or between folders on the dashboard
+    "dashboard": 0.5    # Dashboard refreshes of history, frequent pages and folders
+}
+
+# Load settings
+DEFAULT_CLIENTS = "10,50,100"
+DEFAULT_DURATION_SECONDS = 30
+DEFAULT_VISITS = "100k"           # Visits generated for a server started here
+MAX_CONNECTIONS = 2               # Connections each browser opens to the server at most
+KEEPALIVE_SECONDS = 15            # Idle connections are closed after this long
+REQUEST_TIMEOUT_SECONDS = 30
+DRAIN_SECONDS = 30                # Time requests still running at the end of a stage get to finish
+SERVER_START_SECONDS = 60
+URL_POOL_LIMIT = 20000            # Distinct URLs the browsers visit at most
+
+# Saturation is reached at the first stage where any of these holds
+DEFAULT_SLO_MS = 1000             # p99 latency is above this
+ERROR_LIMIT = 0.01                # More than this share of requests fail
+EFFICIENCY_LIMIT = 0.9            # Requests per browser fall below this share of the first stage's
+
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+LOCKED_MESSAGE = b"database is locked"
+
+def parse_mix(text):
+    """Parse a mix like visit=4,poll=1 over the defaults"""
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, text.split(",")):
+        name, _, rate = item.partition("=")
+        if name.strip() not in mix:
+            raise argparse.ArgumentTypeError(f"Unknown action {name!r}; expected {', '.join(mix)}")
+        mix[name.strip()] = float(rate)
+    return mix
+
+class HttpClient:
+    """A small keep-alive HTTP/1.1 client over asyncio streams, limited to a number of connections"""
+
+    def __init__(self, host, port, max_connections=MAX_CONNECTIONS, timeout=REQUEST_TIMEOUT_SECONDS):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle = []
+        self._expiry = {}
+
+    async def request(self, method, path, body=None, headers=None):
+        """Send a request and return (status, headers, body); waiting for a free connection counts toward the timeout"""
+        return await asyncio.wait_for(self._request(method, path, body, headers or {}), self.timeout)
+
+    async def _request(self, method, path, body, headers):
+        async with self._slots:
+            # A reused connection the server has since closed fails before any response; retry on a new one
+            while self._idle:
+                connection = self._idle.pop()
+                self._expiry.pop(connection).cancel()
+                try:
+                    return await self._exchange(connection, method, path, body, headers)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    continue
+            connection = await asyncio.open_connection(self.host, self.port)
+            return await self._exchange(connection, method, path, body, headers)
+
+    async def _exchange(self, connection, method, path, body, headers):
+        reader, writer = connection
+        try:
+            data = b"" if body is None else json.dumps(body).encode()
+            lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(data)}"]
+            if body is not None:
+                lines.append("Content-Type: application/json")
+            lines.extend(f"{name}: {value}" for name, value in headers.items())
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            if not status_line:
+                raise ConnectionError("Connection closed by the server")
+            version, status = status_line.split()[:2]
+            status = int(status)
+            response_headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                response_headers[name.strip().lower()] = value.strip()
+
+            keep_alive = version == b"HTTP/1.1" and response_headers.get("connection", "").lower() != "close"
+            if status in (204, 304) or method == "HEAD":
+                content = b""
+            elif "chunked" in response_headers.get("transfer-encoding", ""):
+                chunks = []
+                while True:
+                    size = int((await reader.readline()).split(b";")[0], 16)
+                    if size == 0:
+                        await reader.readline()
+                        break
+                    chunks.append(await reader.readexactly(size))
+                    await reader.readline()
+                content = b"".join(chunks)
+            elif "content-length" in response_headers:
+                content = await reader.readexactly(int(response_headers["content-length"]))
+            else:
+                content = await reader.read()
+                keep_alive = False
+        except BaseException:
+            writer.close()
+            raise
+
+        if keep_alive:
+            self._idle.append(connection)
+            self._expiry[connection] = asyncio.get_running_loop().call_later(KEEPALIVE_SECONDS, self._expire, connection)
+        else:
+            writer.close()
+        return status, response_headers, content
+
+    def _expire(self, connection):
+        """Close a connection that stayed idle, as browsers do"""
+        if connection in self._expiry:
+            del self._expiry[connection]
+            self._idle.remove(connection)
+            connection[1].close()
+
+    def close(self):
+        """Close every idle connection"""
+        for connection in self._idle:
+            self._expiry.pop(connection).cancel()
+            connection[1].close()
+        self._idle.clear()
+
+class Recorder:
+    """Latency, status and error figures of every request, by endpoint"""
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+        self.statuses = collections.defaultdict(collections.Counter)
+        self.errors = collections.defaultdict(collections.Counter)
+        self.locked = collections.Counter()
+        self.bytes = collections.Counter()
+
+    async def call(self, http, endpoint, method, path, body=None, headers=None):
+        """Make a request through `http` and record it under `endpoint`; returns None when it failed"""
+        started = time.perf_counter_ns()
+        try:
+            status, response_headers, content = await http.request(method, path, body, headers)
+        except (asyncio.TimeoutError, OSError, asyncio.IncompleteReadError, ValueError) as e:
+            self.samples[endpoint].append(time.perf_counter_ns() - started)
+            self.errors[endpoint]["timeout" if isinstance(e, asyncio.TimeoutError) else type(e).__name__] += 1
+            return None
+
+        self.samples[endpoint].append(time.perf_counter_ns() - started)
+        self.statuses[endpoint][status] += 1
+        self.bytes[endpoint] += len(content)
+        if status >= 500:
+            self.errors[endpoint][f"HTTP {status}"] += 1
+            if LOCKED_MESSAGE in content:
+                self.locked[endpoint] += 1
+        return status, response_headers, content
+
+    def summary(self, seconds):
+        """Figures of every endpoint, plus all of them together under "all" """
+        endpoints = {}
+        for endpoint in sorted(self.samples):
+            endpoints[endpoint] = self._figures(self.samples[endpoint], seconds, self.statuses[endpoint],
+                                                self.errors[endpoint], self.locked[endpoint], self.bytes[endpoint])
+        endpoints["all"] = self._figures(
+            [sample for samples in self.samples.values() for sample in samples], seconds,
+            sum(self.statuses.values(), collections.Counter()), sum(self.errors.values(), collections.Counter()),
+            sum(self.locked.values()), sum(self.bytes.values())
+        )
+        return endpoints
+
+    @staticmethod
+    def _figures(samples, seconds, statuses, errors, locked, received):
+        result = summarize(samples)
+        ordered = sorted(samples)
+        result["p90_ms"] = round(percentile(ordered, 0.90) / 1e6, 4) if ordered else None
+        result["requests_per_sec"] = round(len(samples) / seconds, 2)
+        result["errors"] = sum(errors.values())
+        result["error_rate"] = round(result["errors"] / len(samples), 4) if samples else 0
+        result["error_kinds"] = dict(errors)
+        result["locked_responses"] = locked
+        result["statuses"] = {str(status): count for status, count in sorted(statuses.items())}
+        result["bytes_received"] = received
+
+        histogram = collections.Counter()
+        for sample in samples:
+            ms = sample / 1e6
+            histogram[next((f"<={bound}" for bound in HISTOGRAM_BUCKETS_MS if ms <= bound), "inf")] += 1
+        result["histogram_ms"] = {
+            label: histogram[label] for label in [f"<={bound}" for bound in HISTOGRAM_BUCKETS_MS] + ["inf"]
+        }
+        return result
+
+class Browser:
+    """One simulated browser with the extension installed"""
+
+    def __init__(self, number, http, recorder, mix, urls, rng):
+        self.number = number
+        self.http = http
+        self.recorder = recorder
+        self.mix = mix
+        self.urls = urls
+        self.rng = rng
+        self.buffer = []
+        self.flush_timer = None
+        self.folders = []
+        self.folders_etag = None
+        self.tasks = set()
+
+    def spawn(self, coroutine):
+        """Start an action without waiting for it, as the extension's fetches don't"""
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def page(self):
+        """A page the browser loads: popular pages most of the time"""
+        url, title = self.urls.pick(self.rng)
+        now = int(time.time() * 1000)
+        suffix = "".join(self.rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(6))
+        return {"id": f"{now}-{suffix}", "url": url, "title": title, "timestamp": iso(now)}
+
+    async def run(self, until):
+        """Act at the mix's rates until the loop time `until`"""
+        loop = asyncio.get_running_loop()
+        actions = [
+            self.every("visit", self.load_page, until),
+            self.every("add", self.add_to_folder, until),
+            self.every("move", self.drag_page, until),
+            self.every("dashboard", self.refresh_dashboard, until)
+        ]
+        if self.mix["poll"] > 0:
+            actions.append(self.poll_folders(until))
+        await asyncio.gather(*actions)
+        if self.flush_timer:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+
+        # Requests under way finish within the drain time, or count as timed out
+        if self.tasks:
+            await asyncio.wait(set(self.tasks), timeout=max(0, until + DRAIN_SECONDS - loop.time()))
+
+    async def every(self, action, step, until):
+        """Take a step at random intervals averaging the action's rate"""
+        rate = self.mix[action] / 60
+        if rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            if loop.time() >= until:
+                return
+            step()
+
+    async def poll_folders(self, until):
+        """Refresh the folder menu once a poll interval, from a random starting point"""
+        loop = asyncio.get_running_loop()
+        interval = 60 / self.mix["poll"]
+        await asyncio.sleep(self.rng.uniform(0, interval))
+        while loop.time() < until:
+            self.spawn(self.fetch_folders())
+            await asyncio.sleep(interval)
+
+    def load_page(self):
+        """Queue a visit, flushing on size or after a short delay like queueVisit"""
+        self.buffer.append(self.page())
+        if len(self.buffer) >= VISIT_BATCH_SIZE:
+            self.flush_visits()
+        elif not self.flush_timer:
+            self.flush_timer = asyncio.get_running_loop().call_later(VISIT_FLUSH_DELAY_SECONDS, self.flush_visits)
+
+    def flush_visits(self):
+        if self.flush_timer:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        if self.buffer:
+            batch, self.buffer = self.buffer, []
+            self.spawn(self.post_visits(batch))
+
+    async def post_visits(self, batch):
+        response = await self.recorder.call(self.http, "POST /api/history/batch", "POST", "/api/history/batch", batch)
+        if response is None or response[0] >= 500:
+            # Kept for the next flush, like the extension does
+            self.buffer = (batch + self.buffer)[-VISIT_BUFFER_LIMIT:]
+            if not self.flush_timer:
+                self.flush_timer = asyncio.get_running_loop().call_later(VISIT_FLUSH_DELAY_SECONDS, self.flush_visits)
+
+    async def fetch_folders(self):
+        """Load the folder list, asking only for changes since the last one"""
+        headers = {"If-None-Match": self.folders_etag} if self.folders_etag else {}
+        response = await self.recorder.call(self.http, "GET /api/folders", "GET", "/api/folders", headers=headers)
+        if response and response[0] == 200:
+            self.folders_etag = response[1].get("etag")
+            self.folders = json.loads(response[2])
+
+    async def known_folders(self):
+        """Folders the browser has seen, loading them first if it hasn't yet"""
+        if not self.folders:
+            await self.fetch_folders()
+        return self.folders
+
+    def add_to_folder(self):
+        async def add():
+            folders = await self.known_folders()
+            if folders:
+                await self.add_page(self.rng.choice(folders)["id"], self.page())
+        self.spawn(add())
+
+    async def add_page(self, folder_id, page):
+        await self.recorder.call(self.http, "POST /api/folders/<id>/pages", "POST", f"/api/folders/{folder_id}/pages",
+                                 {"id": self.page()["id"], "url": page["url"], "title": page["title"]})
+
+    def drag_page(self):
+        """Drag a page into a folder from the history list, or from another folder like the dashboard does"""
+        async def drag():
+            folders = await self.known_folders()
+            if not folders:
+                return
+            target = self.rng.choice(folders)
+            sources = [folder for folder in folders if folder["pages"] and folder["id"] != target["id"]]
+            if not sources or self.rng.random() < 0.5:
+                await self.add_page(target["id"], self.page())
+                return
+            source = self.rng.choice(sources)
+            page = self.rng.choice(source["pages"])
+            removed = await self.recorder.call(
+                self.http, "POST /api/folders/<id>/remove-page", "POST", f"/api/folders/{source['id']}/remove-page",
+                {"pageId": page["page_id"]}
+            )
+            if removed and removed[0] < 400:
+                source["pages"].remove(page)
+                await self.add_page(target["id"], page)
+        self.spawn(drag())
+
+    def refresh_dashboard(self):
+        """Reload the dashboard's lists, sometimes scrolling to older history"""
+        async def refresh():
+            history, _, _ = await asyncio.gather(
+                self.recorder.call(self.http, "GET /api/history", "GET", "/api/history"),
+                self.recorder.call(self.http, "GET /api/history/frequent", "GET", "/api/history/frequent"),
+                self.recorder.call(self.http, "GET /api/folders (dashboard)", "GET", "/api/folders")
+            )
+            if history and history[0] == 200 and self.rng.random() < 0.3:
+                cursor = json.loads(history[2]).get("nextCursor")
+                if cursor:
+                    await self.recorder.call(self.http, "GET /api/history?before", "GET", f"/api/history?before={cursor}")
+        self.spawn(refresh())
+
+class UrlPool:
+    """URLs and titles the browsers visit, picked with Zipf-like popularity"""
+
+    def __init__(self, visits, seed):
+        generator = DataGenerator(min(visits, int(URL_POOL_LIMIT * 3.5)), seed=seed)
+        generator.make_domains()
+        generator.make_urls()
+        self.pages = list(zip(generator.urls, generator.titles))
+        self.weights = zipf_cum_weights(len(self.pages), PAGE_SKEW)
+
+    def pick(self, rng):
+        return rng.choices(self.pages, cum_weights=self.weights)[0]
+
+class ServerLog:
+    """Counts "database is locked" in a server's log as it grows"""
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = self._size()
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.path)
+        except (OSError, TypeError):
+            return 0
+
+    def count_new(self):
+        """Occurrences written since the last call, or None without a log"""
+        if not self.path or not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        self.offset += len(data)
+        return data.count(LOCKED_MESSAGE)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_until_up(host, port, process=None, log_path=None):
+    """Wait for the server to answer, failing if its process exits first"""
+    deadline = time.monotonic() + SERVER_START_SECONDS
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"The server exited with status {process.returncode}; see {log_path}")
+        try:
+            with socket.create_connection((host, port), timeout=1) as s:
+                s.sendall(f"GET /api/database/stats HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+                if s.recv(12).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"The server didn't answer within {SERVER_START_SECONDS}s; see {log_path}")
+
+def start_server(args):
+    """Start the server under test; returns (host, port, log path, stop function)"""
+    if args.url:
+        parts = urlsplit(args.url)
+        return parts.hostname, parts.port or 80, args.server_log, lambda: None
+
+    visits = parse_count(args.visits)
+    directory = tempfile.mkdtemp(prefix="web-history-load-", dir=args.workdir)
+    print(f"Generating {visits} visits in {directory}", file=sys.stderr)
+    prepare(directory, visits, None, args.seed)
+    log_path = os.path.join(directory, "server.log")
+    app_path = os.path.join(BACKEND_DIR, "app.py")
+
+    def remove_directory():
+        if args.keep:
+            print(f"Kept {directory}", file=sys.stderr)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if args.in_process:
+        return start_in_process(directory, log_path, remove_directory)
+
+    port = free_port()
+    with open(log_path, "ab") as log:
+        subprocess.run([sys.executable, app_path, "--migrate"], cwd=directory, stdout=log, stderr=log, check=True)
+        process = subprocess.Popen(
+            [sys.executable, app_path, "--port", str(port), "--workers", str(args.workers)],
+            cwd=directory, stdout=log, stderr=log
+        )
+
+    def stop():
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        remove_directory()
+
+    try:
+        wait_until_up("127.0.0.1", port, process, log_path)
+    except BaseException:
+        stop()
+        raise
+    print(f"Serving with {args.workers} worker(s) on port {port}", file=sys.stderr)
+    return "127.0.0.1", port, log_path, stop
+
+def start_in_process(directory, log_path, remove_directory):
+    """Serve the app from a thread of this process, logging to log_path"""
+    import logging
+
+    os.chdir(directory)
+    sys.path.insert(0, BACKEND_DIR)
+    # The server's prints and tracebacks go to its log; this module reports on sys.__stderr__
+    log = open(log_path, "a", buffering=1)
+    sys.stdout = sys.stderr = log
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    from werkzeug.serving import make_server
+    from app import create_app
+    from database_manager import db_manager
+
+    db_manager.initialize_db()
+    db_manager.migrate_from_json()
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name="load-server", daemon=True)
+    thread.start()
+    print(f"Serving in process on port {server.server_port}", file=sys.__stderr__)
+
+    def stop():
+        server.shutdown()
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+        log.close()
+        os.chdir(BACKEND_DIR)
+        remove_directory()
+
+    return "127.0.0.1", server.server_port, log_path, stop
+
+async def run_stage(host, port, clients, args, urls, seed):
+    """Run `clients` browsers for the stage's duration and return the recorder and elapsed seconds"""
+    recorder = Recorder()
+    loop = asyncio.get_running_loop()
+    rng = random.Random(seed)
+    browsers = [
+        Browser(number, HttpClient(host, port, args.connections), recorder, args.scaled_mix, urls,
+                random.Random(rng.random()))
+        for number in range(clients)
+    ]
+    started = loop.time()
+    await asyncio.gather(*(browser.run(started + args.duration) for browser in browsers))
+    elapsed = loop.time() - started
+    for browser in browsers:
+        browser.http.close()
+        for task in browser.tasks:
+            task.cancel()
+    return recorder, min(elapsed, args.duration)
+
+def saturation(stages, slo_ms):
+    """Index of the first stage past the saturation point, with the reason, or (None, None)"""
+    base = stages[0]["endpoints"]["all"]["requests_per_sec"] / stages[0]["clients"] if stages else 0
+    for index, stage in enumerate(stages):
+        figures = stage["endpoints"]["all"]
+        if figures["error_rate"] > ERROR_LIMIT:
+            return index, f"{figures['error_rate']:.1%} of requests failed"
+        if figures["p99_ms"] is not None and figures["p99_ms"] > slo_ms:
+            return index, f"p99 latency {figures['p99_ms']:.0f} ms is above {slo_ms} ms"
+        per_client = figures["requests_per_sec"] / stage["clients"]
+        if base and per_client < base * EFFICIENCY_LIMIT:
+            return index, f"requests per browser fell to {per_client / base:.0%} of the first stage's"
+    return None, None
+
+def report(results, out=sys.stdout):
+    """Print every stage's figures and where the server saturated"""
+    for stage in results["stages"]:
+        figures = stage["endpoints"]["all"]
+        locked = "unknown" if stage["locked_logged"] is None else stage["locked_logged"]
+        print(f"\n{stage['clients']} browsers for {stage['seconds']:.0f}s: {figures['requests_per_sec']} requests/sec, "
+              f"{figures['errors']} errors ({figures['error_rate']:.2%}), \"database is locked\" logged {locked} times",
+              file=out)
+        print(f"  {'endpoint':<36} {'requests':>8} {'req/sec':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+              f"{'max ms':>9} {'errors':>7}", file=out)
+        for endpoint, row in stage["endpoints"].items():
+            if not row["iterations"]:
+                continue
+            print(f"  {endpoint:<36} {row['iterations']:>8} {row['requests_per_sec']:>8} {row['p50_ms']:>9.1f} "
+                  f"{row['p90_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f} {row['errors']:>7}", file=out)
+
+        histogram = figures["histogram_ms"]
+        widest = max(histogram.values()) or 1
+        print("  Latency of all requests:", file=out)
+        for label, count in histogram.items():
+            if count:
+                print(f"    {label + ' ms':>10} {count:>8} {'#' * max(1, round(40 * count / widest))}", file=out)
+
+    print("\n  browsers   req/sec    p50 ms    p99 ms   errors   locked", file=out)
+    for stage in results["stages"]:
+        figures = stage["endpoints"]["all"]
+        locked = "-" if stage["locked_logged"] is None else stage["locked_logged"]
+        print(f"  {stage['clients']:>8} {figures['requests_per_sec']:>9} {figures['p50_ms'] or 0:>9.1f} "
+              f"{figures['p99_ms'] or 0:>9.1f} {figures['error_rate']:>8.2%} {locked:>8}", file=out)
+
+    index, reason = results["saturation"]["stage"], results["saturation"]["reason"]
+    if index is None:
+        print("\nNo stage saturated the server; try more browsers or a higher --speed", file=out)
+    elif index == 0:
+        print(f"\nSaturated already at {results['stages'][0]['clients']} browsers: {reason}", file=out)
+    else:
+        print(f"\nSaturated between {results['stages'][index - 1]['clients']} and "
+              f"{results['stages'][index]['clients']} browsers: {reason}", file=out)
+
+def raise_file_limit():
+    """Allow as many open connections as the hard limit does"""
+    if resource is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 65536, hard))
+
+def main(args):
+    raise_file_limit()
+    clients = [parse_count(count) for count in args.clients.split(",")]
+    args.scaled_mix = {action: rate * args.speed for action, rate in args.mix.items()}
+    urls = UrlPool(parse_count(args.visits), args.seed)
+    host, port, log_path, stop = start_server(args)
+    server_log = ServerLog(log_path)
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "target": args.url or ("in-process" if args.in_process else f"{args.workers} worker(s)"),
+        "settings": {
+            "duration": args.duration, "speed": args.speed, "mix_per_minute": args.mix,
+            "connections": args.connections, "visits": None if args.url else args.visits, "seed": args.seed
+        },
+        "stages": []
+    }
+    try:
+        for number, count in enumerate(clients):
+            print(f"Running {count} browsers for {args.duration}s", file=sys.__stderr__)
+            recorder, seconds = asyncio.run(run_stage(host, port, count, args, urls, args.seed + number))
+            results["stages"].append({
+                "clients": count,
+                "seconds": seconds,
+                "locked_logged": server_log.count_new(),
+                "endpoints": recorder.summary(seconds)
+            })
+    finally:
+        stop()
+
+    index, reason = saturation(results["stages"], args.slo_ms)
+    results["saturation"] = {"stage": index, "reason": reason, "slo_ms": args.slo_ms}
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    report(results)
+    print(f"\nResults written to {output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the HTTP API with simulated extension clients")
+    parser.add_argument("--clients", default=DEFAULT_CLIENTS, help="Comma-separated browser counts, one stage each")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION_SECONDS, help="Seconds each stage runs for")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="Actions per browser per minute, like visit=4,poll=1,add=0.1,move=0.2,dashboard=0.5")
+    parser.add_argument("--speed", type=float, default=1.0, help="Multiply every rate of the mix by this")
+    parser.add_argument("--connections", type=int, default=MAX_CONNECTIONS, help="Connections per browser at most")
+    parser.add_argument("--slo-ms", type=float, default=DEFAULT_SLO_MS, help="p99 latency above which the server counts as saturated")
+    parser.add_argument("--url", help="Load a server already running at this URL instead of starting one")
+    parser.add_argument("--server-log", help="With --url, the server's log to count \"database is locked\" in")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes of the server started here")
+    parser.add_argument("--in-process", action="store_true", help="Serve from a thread of this process instead")
+    parser.add_argument("--visits", default=DEFAULT_VISITS, help="Visits generated for the server started here, like 100k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/load_<time>.json)")
+    parser.add_argument("--workdir", help="Where to create the server's working directory")
+    parser.add_argument("--keep", action="store_true", help="Keep the server's working directory")
+    main(parser.parse_args())
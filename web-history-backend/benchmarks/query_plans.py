@@ -0,0 +1,248 @@
+"""Checks the query plan of every statement the database layer runs.
+
+From web-history-backend:
+
+    python -m benchmarks.query_plans
+    python -m benchmarks.query_plans --visits 100k --verbose
+
+A working directory is filled with generated data as for run.py, then
+every benchmark case runs once, followed by search, the change feed,
+analytics, exports, compaction and a restore. Just before each statement
+runs, it is explained with EXPLAIN QUERY PLAN on its own connection and
+with its own parameters, so the planner sees the same attached archives
+and data as the statement does. Full scans and temporary B-trees fail the
+check unless ALLOWED lists them with the reason they are fine, and the
+exit status is then 1.
+"""
+import argparse
+import collections
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+from datetime import datetime, timedelta
+
+from benchmarks.datagen import parse_count
+from benchmarks.run import prepare, BACKEND_DIR, BENCHMARK_DIR
+
+DEFAULT_VISITS = "20k"
+
+# Statements that are never planned
+UNPLANNED = re.compile(r"^\s*(PRAGMA|BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|ATTACH|DETACH|CREATE|DROP|ALTER|VACUUM|ANALYZE)\b", re.I)
+
+# Frames of the hook itself, skipped when looking for the caller
+HOOK_FILES = (os.path.abspath(__file__), os.path.join(BACKEND_DIR, "metrics.py"))
+
+# Archive schemas are named after their month; every month plans alike
+ARCHIVE_SCHEMA = re.compile(r"\barchive_[0-9_]+")
+
+# Plan steps that read a whole table or index, or sort into a temporary B-tree
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?!\(subquery)(?!.*VIRTUAL TABLE INDEX)")
+TEMP_BTREE = re.compile(r"USE TEMP B-TREE")
+
+# Scans and sorts that are fine, as (statement pattern, plan step pattern, reason)
+ALLOWED = [
+    # Tables of a row or a few
+    (r"FROM (journal_state|import_checkpoint|database_epoch)\b|^UPDATE (journal_state|data_versions)\b",
+     r"^SCAN (journal_state|import_checkpoint|data_versions|database_epoch)$", "single-row bookkeeping tables"),
+    (r"sqlite_sequence", r"^SCAN sqlite_sequence$", "one row per AUTOINCREMENT table"),
+    (r"FROM sqlite_master", r"^SCAN sqlite_master$", "the schema, read once per import"),
+    (r"FROM history_archives", r"^SCAN history_archives", "one row per archived month"),
+    (r"^DELETE FROM change_cursors", r"^SCAN change_cursors$", "one row per connected client"),
+    (r"FROM folders WHERE name = \?", r"^SCAN folders$", "renames only; folders number in the hundreds"),
+
+    # Reads meant to cover everything
+    (r"FROM folders f LEFT JOIN folder_pages p", r"^SCAN f USING INDEX idx_folders_order$",
+     "the whole folder tree, in order"),
+    (r"FROM folders f LEFT JOIN folder_pages p", r"TEMP B-TREE FOR (RIGHT PART|LAST TERM) OF ORDER BY",
+     "sorts one folder's pages at a time; a LEFT JOIN can't take their order from the index"),
+    (r"FROM history_(daily_)?pages (WHERE .*)?ORDER BY visited_at DESC, seq DESC",
+     r"^SCAN (h|d) USING INDEX idx_history_(visited_at|daily_order)$",
+     "history streamed or paged in index order, stopping at the LIMIT if there is one"),
+    (r"FROM archive_\?\.history h JOIN main\.urls u",
+     r"^SCAN h USING INDEX idx_history_visited_at$", "archives streamed in index order"),
+    (r"FROM frequent_pages ORDER BY frecency DESC", r"^SCAN f USING INDEX idx_frequency_frecency$",
+     "frequent pages in index order, stopping at the LIMIT if there is one"),
+    (r"^SELECT (last_seen, url_id, visits FROM history_daily|visited_at, url_id, \? FROM archive_\?\.history)$",
+     r"^SCAN (history_daily|archive_[0-9_]+\.history)$", "analytics loads every visit into its columns"),
+    (r"^SELECT MIN\(visited_at\), MAX\(visited_at\), COUNT\(\*\) FROM archive_\?\.history$",
+     r"^SCAN archive_[0-9_]+\.history USING COVERING INDEX idx_history_visited_at$",
+     "recounts the archive a batch was just moved to, for its catalog row"),
+
+    # Sorts of bounded or computed results
+    (r"^INSERT INTO history_daily .* FROM history WHERE seq IN \(SELECT seq FROM temp\.compact_visits\)",
+     r"TEMP B-TREE FOR GROUP BY", "groups one compaction batch"),
+    (r"MATCH \?.* ORDER BY score LIMIT", r"TEMP B-TREE FOR ORDER BY", "ranks full-text matches by bm25"),
+]
+
+def statement_key(sql):
+    """Normalized statement text, with archive schemas folded"""
+    from metrics import normalize_sql
+    return ARCHIVE_SCHEMA.sub("archive_?", normalize_sql(sql))
+
+def caller():
+    """File, line and function of the backend code that ran the statement, or None if a benchmark did"""
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename in HOOK_FILES:
+            continue
+        if frame.filename.startswith(BENCHMARK_DIR):
+            return None
+        return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+    return None
+
+class PlanCollector:
+    """Explains statements as they are about to run and keeps their plans"""
+
+    def __init__(self):
+        self.plans = collections.defaultdict(set)
+        self.callers = collections.defaultdict(set)
+        self.counts = collections.Counter()
+        self.errors = {}
+
+    def __call__(self, connection, sql, parameters):
+        if UNPLANNED.match(sql):
+            return
+        where = caller()
+        if where is None:
+            return
+        key = statement_key(sql)
+        self.counts[key] += 1
+        self.callers[key].add(where)
+        # A plain cursor, so explaining doesn't come back through the hook. It
+        # is closed at once, or it would keep archives from being detached.
+        cursor = sqlite3.Cursor(connection)
+        try:
+            rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        except sqlite3.Error as e:
+            self.errors.setdefault(key, str(e))
+            return
+        finally:
+            cursor.close()
+        self.plans[key].add(format_plan(rows))
+
+def format_plan(rows):
+    """Indent plan steps under their parents like the sqlite3 shell does"""
+    depth = {0: -1}
+    lines = []
+    for row in rows:
+        node, parent, detail = row[0], row[1], row[3]
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return "\n".join(lines)
+
+def problems(key, plan):
+    """Plan steps that aren't allowed, each with the allowance that covers it or None"""
+    found = []
+    for step in plan.splitlines():
+        step = step.strip()
+        if FULL_SCAN.search(step) or TEMP_BTREE.search(step):
+            allowance = next(
+                (entry for entry in ALLOWED if re.search(entry[0], key) and re.search(entry[1], step)),
+                None
+            )
+            found.append((step, allowance))
+    return found
+
+def workload(seed):
+    """Run everything that reaches the database, once"""
+    from benchmarks import cases
+    from database_manager import db_manager, history_db, search_db, changes_db
+    from analytics import visit_columns, AnalyticsUnavailable
+    from export import export_history, export_bookmarks
+    from compaction import history_compactor
+    from backup_manager import backup_manager
+    from browser_import import import_jobs
+
+    cases.run(budget=0, max_iterations=1, seed=seed)
+
+    for scope in ("all", "history", "folders"):
+        search_db.search("python guide", scope)
+    seq = changes_db.latest_seq()
+    changes_db.get_since(0)
+    changes_db.save_cursor("query-plans", seq)
+    changes_db.remove_cursor("query-plans")
+    changes_db.trim()
+
+    try:
+        visit_columns.refresh()
+        visit_columns.timeline()
+        visit_columns.heatmap()
+        visit_columns.domains_by_period()
+    except AnalyticsUnavailable as e:
+        print(f"Skipping analytics: {e}", file=sys.stderr)
+
+    collections.deque(export_history("ndjson"), maxlen=0)
+    week_ago = (datetime.now() - timedelta(days=7)).isoformat()
+    collections.deque(export_history("csv", start=week_ago), maxlen=0)
+    collections.deque(export_bookmarks(), maxlen=0)
+    import_jobs.get("query-plans")
+    db_manager.get_etag("history", "folders", "frequency")
+
+    history_compactor.run_once()
+    history_db.add_batch([{"id": "query-plans-1", "url": "https://example.com/", "title": "Example",
+                           "timestamp": datetime.now().isoformat()}])
+    backup_manager.perform_backup()
+    latest = backup_manager.list_backups()[0]["timestamp"]
+    backup_manager.restore_backup(latest, until=datetime.now())
+
+def main(args):
+    directory = tempfile.mkdtemp(prefix="web-history-plans-", dir=args.workdir)
+    log_path = os.path.join(directory, "workload.log")
+    try:
+        print(f"Generating {args.visits} visits in {directory}", file=sys.stderr)
+        prepare(directory, parse_count(args.visits), None, args.seed)
+        os.chdir(directory)
+        sys.path.insert(0, BACKEND_DIR)
+
+        from metrics import metrics
+        collector = PlanCollector()
+        metrics.statement_hook = collector
+        print("Running the workload", file=sys.stderr)
+        with open(log_path, "w") as log, redirect_stdout(log), redirect_stderr(log):
+            workload(args.seed)
+        metrics.statement_hook = None
+    finally:
+        os.chdir(BACKEND_DIR)
+        if args.keep:
+            print(f"Kept {directory}", file=sys.stderr)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    failures = 0
+    used = set()
+    for key in sorted(collector.plans):
+        for plan in sorted(collector.plans[key]):
+            found = problems(key, plan)
+            disallowed = [step for step, allowance in found if allowance is None]
+            used.update(id(allowance) for _, allowance in found if allowance is not None)
+            if disallowed:
+                failures += 1
+            if disallowed or args.verbose:
+                print(f"\n{'FAIL' if disallowed else 'ok'} ({collector.counts[key]} runs, "
+                      f"{', '.join(sorted(collector.callers[key]))})")
+                print(f"  {key}")
+                print("\n".join(f"    {line}" for line in plan.splitlines()))
+                for step, allowance in found:
+                    print(f"    -> {step}: {'allowed, ' + allowance[2] if allowance else 'not allowed'}")
+
+    for key, error in sorted(collector.errors.items()):
+        print(f"\nCouldn't explain ({error}): {key}")
+    for entry in ALLOWED:
+        if id(entry) not in used:
+            print(f"\nUnused allowance: {entry[0]!r} / {entry[1]!r}")
+
+    print(f"\n{len(collector.plans)} statements checked, {failures} plans with disallowed scans or sorts")
+    return 1 if failures or collector.errors else 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the query plans of the database layer")
+    parser.add_argument("--visits", default=DEFAULT_VISITS, help="Visits generated for the check, like 20k")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true", help="Show every plan, not only failing ones")
+    parser.add_argument("--workdir", help="Where to create the working directory")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory")
+    sys.exit(main(parser.parse_args()))
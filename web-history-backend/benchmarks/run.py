@@ -0,0 +1,194 @@
+"""Runs the benchmark suite at one or more dataset sizes and compares with a baseline.
+
+From web-history-backend:
+
+    python -m benchmarks.run                          # 10k and 100k visits
+    python -m benchmarks.run --sizes 10k,100k,1M,10M
+    python -m benchmarks.run --save-baseline          # store the results as the baseline
+
+Each size gets a fresh working directory with generated data and runs in a
+process of its own, so peak RSS is per size. Results are written as JSON,
+and when a baseline exists every case whose p50 latency, or every size whose
+peak RSS, grew by more than the threshold is reported as a regression and
+the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.datagen import DataGenerator, parse_count
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARK_DIR)
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+
+# Regression settings
+DEFAULT_SIZES = "10k,100k"
+REGRESSION_THRESHOLD = 0.25   # Growth in p50 latency or peak RSS reported as a regression
+NOISE_FLOOR_MS = 0.05         # Latency differences smaller than this are never reported
+NOISE_FLOOR_MB = 5.0          # Nor are RSS differences smaller than this
+
+def size_label(visits):
+    """Short name of a dataset size, like 100k or 1M"""
+    if visits >= 1000000 and visits % 1000000 == 0:
+        return f"{visits // 1000000}M"
+    if visits >= 1000 and visits % 1000 == 0:
+        return f"{visits // 1000}k"
+    return str(visits)
+
+def load_json(path, default=None):
+    """Load a JSON file, or return `default` if it doesn't exist"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+def prepare(directory, visits, folders, seed):
+    """Fill a working directory with the backend's schema and configs and generated data"""
+    shutil.copy(os.path.join(BACKEND_DIR, "schema.sql"), directory)
+    shutil.copytree(os.path.join(BACKEND_DIR, "migrations"), os.path.join(directory, "migrations"))
+
+    # Tuning comes from the backend's configs, but every path stays inside the directory
+    database_config = load_json(os.path.join(BACKEND_DIR, "database_config.json"), {})
+    database_config.update(journal_directory="./backups/journal", archive_directory="./archive")
+    backup_config = load_json(os.path.join(BACKEND_DIR, "backup_config.json"), {})
+    backup_config.update(backup_directory="./backups")
+    for name, config in (("database_config.json", database_config), ("backup_config.json", backup_config)):
+        with open(os.path.join(directory, name), "w") as f:
+            json.dump(config, f, indent=2)
+
+    started = time.perf_counter()
+    dataset = DataGenerator(visits, folders, seed).write(directory)
+    dataset["generate_seconds"] = round(time.perf_counter() - started, 1)
+    with open(os.path.join(directory, "dataset.json"), "w") as f:
+        json.dump(dataset, f, indent=2)
+    return dataset
+
+def run_size(visits, args):
+    """Generate a dataset, time every case against it and return the results"""
+    label = size_label(visits)
+    directory = tempfile.mkdtemp(prefix=f"web-history-bench-{label}-", dir=args.workdir)
+    try:
+        print(f"[{label}] Generating data in {directory}", file=sys.stderr)
+        dataset = prepare(directory, visits, args.folders, args.seed)
+        print(f"[{label}] {dataset['visits']} visits, {dataset['urls']} URLs, {dataset['folders']} folders "
+              f"generated in {dataset['generate_seconds']}s", file=sys.stderr)
+
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+        command = [
+            sys.executable, "-m", "benchmarks.cases", "--output", "results.json",
+            "--budget", str(args.budget), "--max-iterations", str(args.max_iterations), "--seed", str(args.seed)
+        ]
+        log_path = os.path.join(directory, "bench.log")
+        with open(log_path, "w") as log:
+            code = subprocess.call(command, cwd=directory, env=env, stdout=log)
+        if code:
+            raise RuntimeError(f"Benchmarks at {label} failed with status {code}; see {log_path}")
+        return load_json(os.path.join(directory, "results.json"))
+    finally:
+        if args.keep:
+            print(f"[{label}] Kept {directory}", file=sys.stderr)
+        else:
+            shutil.rmtree(directory, ignore_errors=True)
+
+def compare(results, baseline, threshold):
+    """List every regression against a baseline as (size, case, metric, baseline, current)"""
+    regressions = []
+    for label, run in results["runs"].items():
+        base_run = baseline.get("runs", {}).get(label)
+        if not base_run:
+            continue
+
+        base_rss, rss = base_run.get("peak_rss_mb"), run.get("peak_rss_mb")
+        if base_rss and rss and rss > base_rss * (1 + threshold) and rss - base_rss > NOISE_FLOOR_MB:
+            regressions.append((label, "(process)", "peak_rss_mb", base_rss, rss))
+
+        for name, case in run["cases"].items():
+            base = base_run["cases"].get(name)
+            if not base or "skipped" in case or "skipped" in base:
+                continue
+            before, after = base["p50_ms"], case["p50_ms"]
+            if after > before * (1 + threshold) and after - before > NOISE_FLOOR_MS:
+                regressions.append((label, name, "p50_ms", before, after))
+    return regressions
+
+def report(results, baseline):
+    """Print a table of every case, with the change from the baseline where there is one"""
+    for label, run in results["runs"].items():
+        base_cases = (baseline or {}).get("runs", {}).get(label, {}).get("cases", {})
+        print(f"\n{label} visits: peak RSS {run['peak_rss_mb']} MiB, database {run['db_bytes'] / 1048576:.1f} MiB")
+        print(f"  {'case':<42} {'runs':>5} {'ops/sec':>11} {'p50 ms':>10} {'p99 ms':>10} {'vs baseline':>12}")
+        for name, case in run["cases"].items():
+            if "skipped" in case:
+                print(f"  {name:<42} skipped")
+                continue
+            change = ""
+            base = base_cases.get(name)
+            if base and "skipped" not in base and base["p50_ms"]:
+                change = f"{(case['p50_ms'] / base['p50_ms'] - 1) * 100:+.0f}%"
+            print(f"  {name:<42} {case['iterations']:>5} {case['ops_per_sec']:>11,.1f} "
+                  f"{case['p50_ms']:>10.3f} {case['p99_ms']:>10.3f} {change:>12}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the database layer at several dataset sizes")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated visit counts, like 10k,100k,1M,10M")
+    parser.add_argument("--folders", type=int, help="Number of folders (scales with visits if omitted)")
+    parser.add_argument("--budget", type=float, default=3.0, help="Seconds to repeat each case for")
+    parser.add_argument("--max-iterations", type=int, default=1000, help="Most times any case is repeated")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the data generator")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline results to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative growth in p50 latency or peak RSS reported as a regression")
+    parser.add_argument("--workdir", help="Where to create the working directories (they need room for the data)")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directories")
+    args = parser.parse_args()
+
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version
+        },
+        "settings": {"budget": args.budget, "max_iterations": args.max_iterations, "seed": args.seed},
+        "runs": {}
+    }
+    for visits in [parse_count(size) for size in args.sizes.split(",")]:
+        results["runs"][size_label(visits)] = run_size(visits, args)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    baseline = None if args.save_baseline else load_json(args.baseline)
+    report(results, baseline)
+
+    if args.save_baseline:
+        shutil.copy(output, args.baseline)
+        print(f"\nSaved as the baseline in {args.baseline}")
+    elif baseline is None:
+        print(f"\nNo baseline at {args.baseline}; store one with --save-baseline")
+    else:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions beyond {args.threshold:.0%} against {args.baseline}:")
+            for label, name, metric, before, after in regressions:
+                print(f"  [{label}] {name} {metric}: {before} -> {after}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.baseline}")
@@ -0,0 +1,36 @@
+import math
+import sys
+
+# Peak RSS comes from getrusage, which Windows doesn't have
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(samples_ns):
+    """Throughput and latency figures for a list of durations in nanoseconds"""
+    ordered = sorted(samples_ns)
+    total = sum(ordered)
+    return {
+        "iterations": len(ordered),
+        "ops_per_sec": round(len(ordered) / (total / 1e9), 3) if total else None,
+        "mean_ms": round(total / len(ordered) / 1e6, 4) if ordered else None,
+        "p50_ms": round(percentile(ordered, 0.50) / 1e6, 4) if ordered else None,
+        "p99_ms": round(percentile(ordered, 0.99) / 1e6, 4) if ordered else None,
+        "max_ms": round(ordered[-1] / 1e6, 4) if ordered else None
+    }
+
+def peak_rss_mb():
+    """Highest resident set size this process has reached, in MiB, or None where unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
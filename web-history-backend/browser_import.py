@@ -0,0 +1,290 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from urllib.request import pathname2url
+
+from backup_manager import backup_manager
+from database_manager import db_manager, history_db, DAY_MS
+from journal import IMPORT_OP
+
+# Seconds between 1601-01-01, where Chrome's timestamps start, and the Unix epoch
+CHROME_EPOCH_OFFSET = 11644473600
+
+# Visits from each browser as (id, url, title, visited_at). Chrome counts
+# microseconds since 1601 and Firefox microseconds since 1970; both become
+# epoch milliseconds like the history table. Subframe and embedded loads are
+# left out, as the extension never reports them either.
+BROWSER_VISITS = {
+    "chrome": """
+        SELECT 'chrome-' || v.id AS id,
+               u.url,
+               COALESCE(u.title, '') AS title,
+               v.visit_time / 1000 - {offset} * 1000 AS visited_at
+        FROM source.visits v
+        JOIN source.urls u ON u.id = v.url
+        WHERE u.url LIKE 'http%' AND (v.transition & 255) NOT IN (3, 4)
+    """.format(offset=CHROME_EPOCH_OFFSET),
+    "firefox": """
+        SELECT 'firefox-' || v.id AS id,
+               p.url,
+               COALESCE(p.title, '') AS title,
+               v.visit_date / 1000 AS visited_at
+        FROM source.moz_historyvisits v
+        JOIN source.moz_places p ON p.id = v.place_id
+        WHERE p.url LIKE 'http%' AND v.visit_type NOT IN (4, 8)
+    """
+}
+
+# Tables that identify each browser's history database
+BROWSER_TABLES = {
+    "chrome": {"urls", "visits"},
+    "firefox": {"moz_places", "moz_historyvisits"}
+}
+
+def source_uri(path, immutable=False):
+    """Read-only URI for a browser database"""
+    uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+    return uri + "&immutable=1" if immutable else uri
+
+def copy_source(path, target_path):
+    """Copy a browser database, read-only, so it can be read while the browser runs.
+
+    Browsers keep their history locked while open. The online backup API
+    picks up recent writes still in Firefox's WAL; if the file is locked,
+    it is read as-is instead.
+    """
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source = sqlite3.connect(source_uri(path), uri=True)
+            source.backup(target)
+        except sqlite3.OperationalError:
+            source = sqlite3.connect(source_uri(path, immutable=True), uri=True)
+            source.backup(target)
+        source.close()
+    finally:
+        target.close()
+
+def detect_browser(conn):
+    """Work out which browser an attached source database belongs to"""
+    tables = {row[0] for row in conn.execute("SELECT name FROM source.sqlite_master WHERE type = 'table'")}
+    for browser, required in BROWSER_TABLES.items():
+        if required <= tables:
+            return browser
+    raise ValueError("Not a Chrome History or Firefox places.sqlite database")
+
+def drop_archived(conn, start, end):
+    """Remove visits in [start, end) that an archive already holds from temp.browser_visits.
+
+    Archives can only be attached outside a transaction, so this runs
+    before anything is written and commits after each archive, which
+    leaves only the temp table changed.
+    """
+    for archive in db_manager.archives.list(conn, start, end):
+        with db_manager.archives.attached(conn, archive["name"]) as schema:
+            conn.execute(
+                f"""
+                DELETE FROM temp.browser_visits
+                WHERE id IN (SELECT id FROM {schema}.history)
+                   OR EXISTS (
+                       SELECT 1 FROM {schema}.history h
+                       JOIN main.urls u ON u.id = h.url_id
+                       WHERE h.visited_at = browser_visits.visited_at AND u.url = browser_visits.url
+                   )
+                """
+            )
+            conn.commit()
+
+def import_browser_history(path, browser=None):
+    """Copy every visit from a browser history database into history and frequency.
+
+    The source is attached to the database and copied with set-based
+    INSERT ... SELECT statements. Visits already stored, whether from an
+    earlier import or reported by the extension at the same moment, are
+    skipped, including those since archived or rolled up into
+    history_daily. Returns a summary dict.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Browser history file not found: {path}")
+
+    started = time.perf_counter()
+    temp_dir = tempfile.mkdtemp(prefix="web_history_import_")
+    copy_path = os.path.join(temp_dir, "source.sqlite")
+    try:
+        copy_source(path, copy_path)
+
+        with db_manager.get_connection() as conn:
+            conn.execute("ATTACH DATABASE ? AS source", (copy_path,))
+            try:
+                browser = browser or detect_browser(conn)
+                if browser not in BROWSER_VISITS:
+                    raise ValueError(f"Unsupported browser: {browser}")
+
+                # Store every URL once, filling in titles we don't have yet
+                conn.execute("DROP TABLE IF EXISTS temp.browser_visits")
+                conn.execute(
+                    f"""
+                    CREATE TEMP TABLE browser_visits AS
+                    SELECT * FROM ({BROWSER_VISITS[browser]})
+                    """
+                )
+                found, first, last = conn.execute(
+                    "SELECT COUNT(*), MIN(visited_at), MAX(visited_at) FROM temp.browser_visits"
+                ).fetchone()
+                if found:
+                    drop_archived(conn, first, last + 1)
+                conn.execute(
+                    """
+                    INSERT INTO main.urls (url, title, domain)
+                    SELECT url, MAX(title), url_domain(url)
+                    FROM temp.browser_visits
+                    WHERE true
+                    GROUP BY url
+                    ON CONFLICT(url) DO UPDATE SET title = excluded.title
+                    WHERE COALESCE(urls.title, '') = '' AND excluded.title != ''
+                    """
+                )
+
+                # Resolve URL ids, then drop the visits we already have
+                conn.execute("DROP TABLE IF EXISTS temp.browser_history")
+                conn.execute(
+                    """
+                    CREATE TEMP TABLE browser_history AS
+                    SELECT v.id, u.id AS url_id, v.visited_at
+                    FROM temp.browser_visits v
+                    JOIN main.urls u ON u.url = v.url
+                    """
+                )
+                conn.execute("DROP TABLE temp.browser_visits")
+                conn.execute(
+                    """
+                    DELETE FROM temp.browser_history
+                    WHERE id IN (SELECT id FROM main.history)
+                       OR EXISTS (
+                           SELECT 1 FROM main.history h
+                           WHERE h.url_id = browser_history.url_id AND h.visited_at = browser_history.visited_at
+                       )
+                       OR EXISTS (
+                           SELECT 1 FROM main.history_daily d
+                           WHERE d.url_id = browser_history.url_id AND d.day = browser_history.visited_at / ?
+                             AND browser_history.visited_at BETWEEN d.first_seen AND d.last_seen
+                       )
+                    """,
+                    (DAY_MS,)
+                )
+
+                conn.execute(
+                    """
+                    INSERT INTO main.history (id, url_id, visited_at)
+                    SELECT id, url_id, visited_at FROM temp.browser_history
+                    ORDER BY visited_at
+                    """
+                )
+                inserted = conn.execute("SELECT changes()").fetchone()[0]
+
+                # One upsert per URL carries the new visits into the frecency scores
+                conn.execute(
+                    """
+                    INSERT INTO main.frequency (url_id, count, frecency, last_visit)
+                    SELECT url_id, COUNT(*), frecency_sum(frecency_weight(visited_at)), MAX(visited_at)
+                    FROM temp.browser_history
+                    WHERE true
+                    GROUP BY url_id
+                    ON CONFLICT(url_id) DO UPDATE SET
+                        count = count + excluded.count,
+                        frecency = frecency_add(frecency, excluded.frecency),
+                        last_visit = MAX(COALESCE(last_visit, 0), excluded.last_visit)
+                    """
+                )
+
+                conn.execute("DROP TABLE temp.browser_history")
+
+                # The visits aren't journaled one by one, so replay stops here
+                db_manager.journal.record(conn, IMPORT_OP, [browser])
+                conn.commit()
+                db_manager.journal.committed(conn)
+            finally:
+                # A database can't be detached mid-transaction
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.execute("DETACH DATABASE source")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    # Scores changed outside HistoryDB, so the in-memory ranking reloads
+    history_db.invalidate_frequent()
+
+    # Restores past the import start from this snapshot
+    backup_manager.perform_backup()
+
+    elapsed = time.perf_counter() - started
+    print(f"Imported {inserted} of {found} {browser} visits in {elapsed:.1f}s")
+    return {
+        "browser": browser,
+        "found": found,
+        "inserted": inserted,
+        "skipped": found - inserted,
+        "seconds": round(elapsed, 3)
+    }
+
+class ImportJobs:
+    """Runs browser imports on background threads and tracks their status.
+
+    Status is kept in the import_jobs table rather than in memory, so a job
+    can be polled through any worker process, not just the one running it.
+    """
+
+    def start(self, path, browser=None):
+        """Start an import and return its job id"""
+        job_id = uuid.uuid4().hex
+        with db_manager.get_connection() as conn:
+            conn.execute(
+                "INSERT INTO import_jobs (id, path, status, started) VALUES (?, ?, 'running', ?)",
+                (job_id, path, datetime.now().isoformat())
+            )
+
+        thread = threading.Thread(target=self._run, args=(job_id, path, browser), name=f"import-{job_id[:8]}", daemon=True)
+        thread.start()
+        return job_id
+
+    def get(self, job_id):
+        """Return a job's status, or None if it is unknown"""
+        with db_manager.get_connection() as conn:
+            row = conn.execute(
+                "SELECT id, path, status, started, finished, result, error FROM import_jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        if job["finished"] is None:
+            del job["finished"]
+        return job
+
+    def _run(self, job_id, path, browser):
+        """Run one import and record how it ended"""
+        result = error = None
+        try:
+            result = import_browser_history(path, browser)
+            status = "completed"
+        except Exception as e:
+            print(f"Browser import failed: {e}")
+            status = "failed"
+            error = str(e)
+
+        with db_manager.get_connection() as conn:
+            conn.execute(
+                "UPDATE import_jobs SET status = ?, finished = ?, result = ?, error = ? WHERE id = ?",
+                (status, datetime.now().isoformat(), json.dumps(result) if result else None, error, job_id)
+            )
+
+# Create an instance for direct use
+import_jobs = ImportJobs()
@@ -0,0 +1,158 @@
+import atexit
+import threading
+import time
+
+from database_manager import db_manager, history_db, retention_cutoff
+
+# Compaction settings
+BATCH_PAUSE_SECONDS = 0.05   # Gap between batches so visit writes get the lock in between
+VACUUM_STEP_PAGES = 2000     # Free pages returned to the OS per incremental vacuum step
+
+class HistoryCompactor:
+    """Background job that keeps the history table down to the retention period.
+
+    Every compaction_interval_seconds, visits older than
+    history_archive_days are first moved, unchanged, into monthly archive
+    files through HistoryDB.archive_batch. Visits older than
+    history_retention_days are then rolled up into history_daily through
+    HistoryDB.compact_batch. Both work in transactions of
+    compaction_batch_size visits. With archiving set to fewer days than
+    retention, every raw visit is kept and nothing is rolled up. Once a run
+    has moved anything, the freed pages are handed back to the OS with
+    incremental vacuum, a step at a time. Setting either period to 0 days
+    turns that step off.
+    """
+
+    def __init__(self, db_manager, history_db):
+        self.db_manager = db_manager
+        self.history_db = history_db
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Counters
+        self.runs = 0
+        self.archived = 0
+        self.compacted = 0
+        self.batches = 0
+        self.vacuumed_pages = 0
+        self.failed_runs = 0
+        self.last_run = None
+        self.last_run_ms = 0.0
+        self.last_cutoff = None
+
+    def settings(self):
+        """Current (retention_days, archive_days, interval_seconds, batch_size) from the database config"""
+        config = self.db_manager.config or self.db_manager.load_config()
+        return (
+            int(config['history_retention_days']),
+            int(config['history_archive_days']),
+            int(config['compaction_interval_seconds']),
+            int(config['compaction_batch_size'])
+        )
+
+    def start(self):
+        """Start the compaction thread if it isn't running yet"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="history-compactor", daemon=True)
+            self._thread.start()
+            print("History compaction thread started")
+
+    def stop(self):
+        """Stop the compaction thread after its current batch"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self):
+        """Archive and roll up every visit past its period, then vacuum. Returns visits moved."""
+        retention_days, archive_days, _, batch_size = self.settings()
+        started = time.perf_counter()
+
+        archived = 0
+        if archive_days > 0:
+            archived = self.move_batches(self.history_db.archive_batch, retention_cutoff(archive_days), batch_size)
+            self.archived += archived
+
+        compacted = 0
+        if retention_days > 0:
+            self.last_cutoff = retention_cutoff(retention_days)
+            compacted = self.move_batches(self.history_db.compact_batch, self.last_cutoff, batch_size)
+            self.compacted += compacted
+
+        if archived or compacted:
+            self.vacuum()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.runs += 1
+        self.last_run = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self.last_run_ms = elapsed_ms
+        if archived:
+            print(f"Archived {archived} visits older than {archive_days} days")
+        if compacted:
+            print(f"Rolled up {compacted} visits older than {retention_days} days")
+        return archived + compacted
+
+    def move_batches(self, move_batch, cutoff, batch_size):
+        """Call a batch method until it runs out of visits before the cutoff"""
+        moved = 0
+        while not self._stop.is_set():
+            count = move_batch(cutoff, batch_size)
+            moved += count
+            self.batches += 1 if count else 0
+            if count == 0:
+                break
+            self._stop.wait(BATCH_PAUSE_SECONDS)
+        return moved
+
+    def vacuum(self):
+        """Return the pages compaction freed to the OS in short steps"""
+        if self.db_manager.enable_incremental_vacuum():
+            print("Enabled incremental vacuum on the history database")
+            return
+        while not self._stop.is_set():
+            free = self.db_manager.incremental_vacuum(VACUUM_STEP_PAGES)
+            self.vacuumed_pages += min(free, VACUUM_STEP_PAGES)
+            if free <= VACUUM_STEP_PAGES:
+                return
+            self._stop.wait(BATCH_PAUSE_SECONDS)
+
+    def stats(self):
+        """Return retention settings and compaction counters"""
+        retention_days, archive_days, interval, batch_size = self.settings()
+        return {
+            "retention_days": retention_days,
+            "archive_days": archive_days,
+            "interval_seconds": interval,
+            "batch_size": batch_size,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "runs": self.runs,
+            "failed_runs": self.failed_runs,
+            "batches": self.batches,
+            "archived": self.archived,
+            "compacted": self.compacted,
+            "vacuumed_pages": self.vacuumed_pages,
+            "last_run": self.last_run,
+            "last_run_ms": round(self.last_run_ms, 3),
+            "last_cutoff": self.last_cutoff
+        }
+
+    def _run(self):
+        """Compaction loop: one run at startup, then one per interval"""
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.failed_runs += 1
+                print(f"Error compacting history: {e}")
+            self._stop.wait(self.settings()[2])
+
+# Create an instance for direct use
+history_compactor = HistoryCompactor(db_manager, history_db)
+
+# Let a batch in progress finish when the process exits
+atexit.register(history_compactor.stop)
@@ -1,13 +1,68 @@
 import sqlite3
 import json
 import os
+import base64
+import html
+import re
+import queue
+import threading
+import uuid
+import time
+import atexit
+import itertools
+import heapq
 from contextlib import contextmanager
 from datetime import datetime
 from urllib.parse import urlparse
 
+from json_stream import encode_rows, iter_json_array, iter_json_object
+from frecency import TopFrecency, TOP_K, register_functions, seed_score, visit_seconds, visit_weight, logaddexp
+from journal import Journal, FLUSH_INTERVAL_MS, IMPORT_OP
+from archive import ArchiveStore, ARCHIVE_PAGES, month_bounds, month_name
+from metrics import metrics, InstrumentedConnection
+
 # Database configuration
 DATABASE_FILE = 'web_history.db'
 SCHEMA_FILE = 'schema.sql'
+MIGRATIONS_DIR = 'migrations'
+CONFIG_FILE = 'database_config.json'
+
+# Connection pool and pragma defaults, overridden by CONFIG_FILE
+DEFAULT_CONFIG = {
+    "pool_size": 8,
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size_kib": 65536,
+    "mmap_size_bytes": 268435456,
+    "temp_store": "MEMORY",
+    "busy_timeout_ms": 5000,
+    "journal_directory": "./backups/journal",
+    "journal_flush_ms": FLUSH_INTERVAL_MS,
+    "history_retention_days": 0,
+    "compaction_interval_seconds": 3600,
+    "compaction_batch_size": 5000,
+    "archive_directory": "./archive",
+    "history_archive_days": 0,
+    "metrics_enabled": True,
+    "slow_query_ms": 0,
+    "slow_query_log": "./slow_queries.log"
+}
+
+# Change feed settings
+CHANGE_CURSOR_EXPIRY_DAYS = 7     # Forget clients that haven't read the feed for this long
+CHANGE_TRIM_INTERVAL = 60         # Seconds between trims of the change log
+
+# JSON import settings
+IMPORT_CHUNK_ROWS = 50000         # Records written per committed chunk
+IMPORT_TABLES = ('urls', 'history', 'folders', 'folder_pages', 'frequency')
+NETLOC_PATTERN = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)')
+
+# Visits are rolled up per UTC day once they are older than the retention period
+DAY_MS = 86400000
+
+# Page size limits for paginated history queries
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
 # Old file paths for migration
 HISTORY_FILE = 'history.json'
@@ -18,6 +73,46 @@ class DatabaseManager:
     def __init__(self, db_file=DATABASE_FILE):
         self.db_file = db_file
         self.conn = None
+        self.config = None
+        
+        # Idle connections ready for reuse, most recently used first
+        self._pool = queue.LifoQueue()
+        self._pool_lock = threading.Lock()
+        self.pool_hits = 0
+        self.pool_misses = 0
+        
+        # Changes whenever the database file is replaced wholesale, so ETags
+        # from before a restore never match data_versions counted afresh.
+        # Read from the file, so every process serving it agrees.
+        self.epoch = None
+        
+        # Identity of the file pooled connections are open on; when another
+        # file takes its place, the generation moves on and they are dropped
+        self._file_id = None
+        self._generation = 0
+        
+        # Log of every write, replayed on top of a snapshot for point-in-time restores
+        self.journal = Journal()
+        
+        # Monthly files that old raw visits are moved into
+        self.archives = ArchiveStore(lock_file=f"{db_file}.archive.lock")
+        
+        # Connection shared by every block on a thread inside transaction()
+        self._local = threading.local()
+    
+    def load_config(self):
+        """Load connection pool and pragma settings from the config file"""
+        config = dict(DEFAULT_CONFIG)
+        try:
+            with open(CONFIG_FILE, 'r') as f:
+                config.update(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        self.config = config
+        self.journal.configure(config['journal_directory'], config['journal_flush_ms'])
+        self.archives.configure(config['archive_directory'])
+        metrics.configure(config['metrics_enabled'], config['slow_query_ms'], config['slow_query_log'])
+        return config
     
     def initialize_db(self):
         """Initialize the database with schema if it doesn't exist"""
@@ -28,35 +123,251 @@ class DatabaseManager:
         
         # Set connection to return rows as dictionaries
         conn.row_factory = sqlite3.Row
+        register_sql_functions(conn)
         
         # Create schema if database is new
         if not db_exists:
             print(f"Creating new database {self.db_file}")
+            
+            # Pages freed by history compaction are returned to the OS in steps
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
             with open(SCHEMA_FILE, 'r') as f:
                 schema = f.read()
                 conn.executescript(schema)
                 conn.commit()
         
+        # Bring existing databases up to the current schema version
+        self.apply_migrations(conn)
+        
+        # An import that was killed mid-way left its indexes and triggers dropped
+        row = conn.execute("SELECT state FROM import_checkpoint").fetchone()
+        if row:
+            print("Restoring indexes and triggers dropped by an interrupted migration")
+            self.restore_import_objects(conn, json.loads(row['state']))
+            conn.commit()
+        
         conn.close()
         print(f"Database initialized: {self.db_file}")
     
-    @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_file)
+    def apply_migrations(self, conn):
+        """Apply numbered SQL migrations newer than the database's user_version"""
+        if not os.path.isdir(MIGRATIONS_DIR):
+            return
+        
+        current_version = conn.execute("PRAGMA user_version").fetchone()[0]
+        
+        # Migration files are named like 001_description.sql
+        for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+            if not filename.endswith('.sql'):
+                continue
+            version = int(filename.split('_', 1)[0])
+            if version <= current_version:
+                continue
+            
+            print(f"Applying migration {filename}")
+            with open(os.path.join(MIGRATIONS_DIR, filename), 'r') as f:
+                script = f.read()
+            
+            # Run the migration and the version bump in one transaction
+            conn.executescript(
+                f"BEGIN;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;"
+            )
+            current_version = version
+    
+    def connect(self):
+        """Open a new connection with the configured pragmas applied"""
+        config = self.config or self.load_config()
+        
+        # Pooled connections move between request threads, one at a time;
+        # instrumented ones report every statement to the metrics
+        factory = InstrumentedConnection if metrics.enabled else sqlite3.Connection
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, factory=factory)
         conn.row_factory = sqlite3.Row
+        register_sql_functions(conn)
+        
+        conn.execute(f"PRAGMA journal_mode = {config['journal_mode']}")
+        conn.execute(f"PRAGMA synchronous = {config['synchronous']}")
+        conn.execute(f"PRAGMA cache_size = {-int(config['cache_size_kib'])}")
+        conn.execute(f"PRAGMA mmap_size = {int(config['mmap_size_bytes'])}")
+        conn.execute(f"PRAGMA temp_store = {config['temp_store']}")
+        conn.execute(f"PRAGMA busy_timeout = {int(config['busy_timeout_ms'])}")
         
         # Enable foreign key support
         conn.execute("PRAGMA foreign_keys = ON")
         
+        # Let INSERT OR REPLACE fire delete triggers so the search index stays in sync
+        conn.execute("PRAGMA recursive_triggers = ON")
+        return conn
+    
+    @contextmanager
+    def get_connection(self):
+        """Context manager that lends out a pooled database connection.
+        
+        Writes are committed when the block exits and rolled back if it
+        raises; read-only blocks never open a transaction, so nothing is
+        committed for them.
+        """
+        shared = getattr(self._local, 'conn', None)
+        if shared is not None:
+            yield shared
+            return
+        
+        started = time.perf_counter()
+        self.check_file()
+        generation = self._generation
+        try:
+            conn = self._pool.get_nowait()
+            opened = False
+            with self._pool_lock:
+                self.pool_hits += 1
+        except queue.Empty:
+            conn = self.connect()
+            opened = True
+            with self._pool_lock:
+                self.pool_misses += 1
+        if metrics.enabled:
+            metrics.observe_checkout(time.perf_counter() - started, opened)
+        
         try:
             yield conn
+            if conn.in_transaction:
+                conn.commit()
+            self.journal.committed(conn)
+        except BaseException:
+            conn.rollback()
+            self.journal.aborted(conn)
+            raise
         finally:
+            # Keep the connection for the next caller unless the pool is full
+            # or the file it was opened on has since been replaced
+            if generation == self._generation and self._pool.qsize() < self.config['pool_size']:
+                self._pool.put(conn)
+            else:
+                conn.close()
+    
+    @contextmanager
+    def transaction(self):
+        """Run every get_connection() block on this thread in one transaction"""
+        with self.get_connection() as conn:
+            self._local.conn = conn
+            try:
+                yield conn
+            finally:
+                self._local.conn = None
+    
+    def close_all(self):
+        """Close every idle pooled connection"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            conn.close()
+    
+    def check_file(self):
+        """Notice when the database file was replaced, such as by hand.
+        
+        Connections to the old file are closed rather than pooled again, and
+        the epoch is read from the new one.
+        """
+        try:
+            stat = os.stat(self.db_file)
+        except FileNotFoundError:
+            return
+        file_id = (stat.st_dev, stat.st_ino)
+        if file_id == self._file_id:
+            return
+        
+        with self._pool_lock:
+            if file_id == self._file_id:
+                return
+            if self._file_id is not None:
+                self._generation += 1
+                self.close_all()
+            
+            conn = sqlite3.connect(self.db_file)
+            try:
+                self.epoch = conn.execute("SELECT epoch FROM database_epoch").fetchone()[0]
+                self._file_id = file_id
+            except sqlite3.OperationalError:
+                # Not migrated yet; look again on the next checkout
+                self.epoch = uuid.uuid4().hex[:8]
+            finally:
+                conn.close()
+    
+    def prepare_replacement(self, path):
+        """Migrate a database file that is about to replace the current one and give it a new epoch"""
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        register_sql_functions(conn)
+        try:
+            self.apply_migrations(conn)
+            conn.execute("UPDATE database_epoch SET epoch = lower(hex(randomblob(4)))")
             conn.commit()
+        finally:
             conn.close()
     
+    def get_etag(self, *resources):
+        """Build an ETag from the change counters of the given resources"""
+        with self.get_connection() as conn:
+            # The epoch is read alongside, as a restore in another process
+            # changes it without replacing the file
+            cursor = conn.execute(
+                f"""
+                SELECT resource, version, (SELECT epoch FROM database_epoch) AS epoch
+                FROM data_versions WHERE resource IN ({','.join('?' * len(resources))})
+                """,
+                resources
+            )
+            versions = {}
+            for row in cursor:
+                versions[row['resource']] = row['version']
+                self.epoch = row['epoch']
+        
+        parts = [f"{resource}{versions.get(resource, 0)}" for resource in resources]
+        return f"{self.epoch}-{'.'.join(parts)}"
+    
+    def enable_incremental_vacuum(self):
+        """Switch the file to incremental auto-vacuum if it isn't already.
+        
+        Databases created before this setting existed need one full VACUUM
+        for it to take effect. Returns True if that VACUUM was run.
+        """
+        with self.get_connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            return True
+    
+    def incremental_vacuum(self, pages):
+        """Return up to `pages` free pages to the OS; returns how many were free before"""
+        with self.get_connection() as conn:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free:
+                conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            return free
+    
+    def pool_stats(self):
+        """Return connection pool usage counters"""
+        return {
+            "hits": self.pool_hits,
+            "misses": self.pool_misses,
+            "idle": self._pool.qsize(),
+            "pool_size": (self.config or self.load_config())['pool_size']
+        }
+    
     def migrate_from_json(self):
-        """Migrate data from JSON files to SQLite database"""
+        """Migrate data from JSON files to SQLite database.
+        
+        The files are parsed as streams and written IMPORT_CHUNK_ROWS records
+        at a time, each chunk committed together with a checkpoint, so memory
+        use stays flat and an interrupted import picks up where it stopped
+        when run again. Indexes and triggers on the imported tables are
+        dropped for the load and recreated once at the end, or as soon as
+        the import fails, since the server keeps writing to the database
+        between attempts.
+        """
         print("Starting migration from JSON files to SQLite...")
         
         # Check if files exist
@@ -67,108 +378,29 @@ class DatabaseManager:
         try:
             # Connect to database
             with self.get_connection() as conn:
-                # Migrate history
-                print("Migrating history...")
-                with open(HISTORY_FILE, 'r') as f:
-                    history = json.load(f)
-                    
-                for idx, page in enumerate(history):
-                    # Parse domain from URL
-                    url = page.get('url', '')
-                    try:
-                        domain = urlparse(url).netloc
-                    except:
-                        domain = ''
-                    
-                    # Ensure timestamp is a string
-                    timestamp = page.get('timestamp', '')
-                    if isinstance(timestamp, dict) and '$date' in timestamp:
-                        timestamp = timestamp['$date']
-                    
-                    conn.execute(
-                        """
-                        INSERT OR REPLACE INTO history (id, url, title, timestamp, domain)
-                        VALUES (?, ?, ?, ?, ?)
-                        """,
-                        (
-                            page.get('id', str(idx)),
-                            url,
-                            page.get('title', ''),
-                            timestamp,
-                            domain
-                        )
-                    )
-                
-                # Migrate folders
-                print("Migrating folders...")
-                with open(FOLDERS_FILE, 'r') as f:
-                    folders = json.load(f)
+                checkpoint = self.begin_import(conn)
                 
-                for idx, folder in enumerate(folders):
-                    folder_id = folder.get('id', str(idx))
+                try:
+                    # Migrate history
+                    with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
+                        self.import_stage(conn, checkpoint, 'history', f, enumerate(iter_json_array(f)), self.import_history)
                     
-                    # Insert folder
-                    conn.execute(
-                        """
-                        INSERT OR REPLACE INTO folders (id, name, is_collapsed, display_order)
-                        VALUES (?, ?, ?, ?)
-                        """,
-                        (
-                            folder_id,
-                            folder.get('name', f'Folder {idx}'),
-                            folder.get('isCollapsed', False),
-                            idx
-                        )
-                    )
+                    # Migrate folders
+                    with open(FOLDERS_FILE, 'r', encoding='utf-8') as f:
+                        self.import_stage(conn, checkpoint, 'folders', f, enumerate(iter_json_array(f)), self.import_folders)
                     
-                    # Insert pages in this folder
-                    pages = folder.get('pages', [])
-                    for page_idx, page in enumerate(pages):
-                        # Ensure timestamp is a string
-                        timestamp = page.get('timestamp', '')
-                        if isinstance(timestamp, dict) and '$date' in timestamp:
-                            timestamp = timestamp['$date']
-                        
-                        conn.execute(
-                            """
-                            INSERT OR REPLACE INTO folder_pages 
-                            (folder_id, page_id, url, title, timestamp, display_order)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                            """,
-                            (
-                                folder_id,
-                                page.get('id', str(page_idx)),
-                                page.get('url', ''),
-                                page.get('title', ''),
-                                timestamp,
-                                page_idx
-                            )
-                        )
-                
-                # Migrate frequency data
-                print("Migrating frequency data...")
-                with open(FREQUENCY_FILE, 'r') as f:
-                    frequency = json.load(f)
-                
-                for url, data in frequency.items():
-                    try:
-                        domain = urlparse(url).netloc
-                    except:
-                        domain = data.get('domain', '')
-                    
-                    conn.execute(
-                        """
-                        INSERT OR REPLACE INTO frequency (url, title, count, domain)
-                        VALUES (?, ?, ?, ?)
-                        """,
-                        (
-                            url,
-                            data.get('title', url),
-                            data.get('count', 1),
-                            domain
-                        )
-                    )
+                    # Migrate frequency data
+                    with open(FREQUENCY_FILE, 'r', encoding='utf-8') as f:
+                        self.import_stage(conn, checkpoint, 'frequency', f, iter_json_object(f), self.import_frequency)
+                except BaseException:
+                    # The committed chunks stay for the next attempt, which
+                    # drops the indexes and triggers again
+                    conn.rollback()
+                    self.restore_import_objects(conn, checkpoint)
+                    conn.commit()
+                    raise
                 
+                self.finish_import(conn, checkpoint)
                 print("Migration completed successfully")
                 return True
                 
@@ -177,143 +409,869 @@ class DatabaseManager:
             import traceback
             traceback.print_exc()
             return False
+    
+    def begin_import(self, conn):
+        """Load the checkpoint of an interrupted import, or start a new one, and drop the indexes and triggers"""
+        files = {
+            name: [os.path.getsize(name), os.path.getmtime(name)]
+            for name in (HISTORY_FILE, FOLDERS_FILE, FREQUENCY_FILE)
+        }
+        
+        row = conn.execute("SELECT state FROM import_checkpoint").fetchone()
+        if row:
+            checkpoint = json.loads(row['state'])
+            if checkpoint['files'] == files:
+                print(f"Resuming interrupted migration: {checkpoint['stages']}")
+            else:
+                # The source files changed, so earlier progress no longer applies
+                print("Source files changed since the interrupted migration, starting over")
+                checkpoint.update(files=files, stages={})
+        else:
+            # Their definitions are kept in the checkpoint so an interrupted
+            # import can still restore them
+            cursor = conn.execute(
+                f"""
+                SELECT type, name, sql FROM sqlite_master
+                WHERE type IN ('index', 'trigger') AND sql IS NOT NULL
+                  AND tbl_name IN ({','.join('?' * len(IMPORT_TABLES))})
+                """,
+                IMPORT_TABLES
+            )
+            checkpoint = {'files': files, 'stages': {}, 'dropped': [dict(row) for row in cursor]}
+        
+        # Indexes and triggers would be updated once per row; rebuilding them
+        # after the load is much cheaper
+        for item in checkpoint['dropped']:
+            conn.execute(f'DROP {item["type"].upper()} IF EXISTS "{item["name"]}"')
+        
+        # Imported rows aren't journaled one by one, so replay stops here
+        self.save_import_checkpoint(conn, checkpoint)
+        self.journal.record(conn, IMPORT_OP, ["json"])
+        conn.commit()
+        self.journal.committed(conn)
+        return checkpoint
+    
+    def save_import_checkpoint(self, conn, checkpoint):
+        """Store import progress in the current transaction"""
+        conn.execute(
+            "INSERT OR REPLACE INTO import_checkpoint (id, state) VALUES (1, ?)",
+            (json.dumps(checkpoint),)
+        )
+    
+    def import_stage(self, conn, checkpoint, stage, f, records, write):
+        """Write one file's records in committed chunks, skipping those already imported"""
+        done = checkpoint['stages'].get(stage, 0)
+        if done == 'complete':
+            print(f"Skipping {stage}, already migrated")
+            return
+        
+        print(f"Migrating {stage}...")
+        total_bytes = os.fstat(f.fileno()).st_size or 1
+        started = time.perf_counter()
+        count = done
+        records = itertools.islice(records, done, None)
+        
+        while True:
+            chunk = list(itertools.islice(records, IMPORT_CHUNK_ROWS))
+            if not chunk:
+                break
+            
+            write(conn, chunk)
+            count += len(chunk)
+            checkpoint['stages'][stage] = count
+            self.save_import_checkpoint(conn, checkpoint)
+            conn.commit()
+            
+            elapsed = time.perf_counter() - started
+            progress = min(f.buffer.tell() / total_bytes, 1.0)
+            print(f"  {stage}: {count} records, {progress:.0%} of file ({(count - done) / elapsed:,.0f} records/sec)")
+        
+        checkpoint['stages'][stage] = 'complete'
+        self.save_import_checkpoint(conn, checkpoint)
+        conn.commit()
+    
+    def import_history(self, conn, chunk):
+        """Insert a chunk of (index, page) history records"""
+        titles = {}
+        rows = []
+        for idx, page in chunk:
+            url = page.get('url', '')
+            titles[url] = page.get('title') or titles.get(url, '')
+            rows.append((page.get('id', str(idx)), url, epoch_ms(import_timestamp(page))))
+        
+        self.import_urls(conn, [(url, title, url_domain(url)) for url, title in titles.items()])
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO history (id, url_id, visited_at)
+            VALUES (?, (SELECT id FROM urls WHERE url = ?), ?)
+            """,
+            rows
+        )
+    
+    def import_urls(self, conn, rows):
+        """Insert (url, title, domain) rows, keeping titles already known"""
+        conn.executemany(
+            """
+            INSERT INTO urls (url, title, domain) VALUES (?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET title = excluded.title
+            WHERE excluded.title != '' AND excluded.title IS NOT urls.title
+            """,
+            rows
+        )
+    
+    def import_folders(self, conn, chunk):
+        """Insert a chunk of (index, folder) records along with their pages"""
+        folders = []
+        pages = []
+        for idx, folder in chunk:
+            folder_id = folder.get('id', str(idx))
+            folders.append((folder_id, folder.get('name', f'Folder {idx}'), folder.get('isCollapsed', False), idx))
+            
+            for page_idx, page in enumerate(folder.get('pages', [])):
+                pages.append((
+                    folder_id,
+                    page.get('id', str(page_idx)),
+                    page.get('url', ''),
+                    page.get('title', ''),
+                    import_timestamp(page),
+                    page_idx
+                ))
+        
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO folders (id, name, is_collapsed, display_order)
+            VALUES (?, ?, ?, ?)
+            """,
+            folders
+        )
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO folder_pages 
+            (folder_id, page_id, url, title, timestamp, display_order)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            pages
+        )
+    
+    def import_frequency(self, conn, chunk):
+        """Insert a chunk of (url, data) frequency records"""
+        self.import_urls(conn, [
+            (url, data.get('title', ''), url_domain(url, data.get('domain', ''))) for url, data in chunk
+        ])
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO frequency (url_id, count, frecency)
+            VALUES ((SELECT id FROM urls WHERE url = ?), ?, ?)
+            """,
+            [(url, data.get('count', 1), seed_score(data.get('count', 1))) for url, data in chunk]
+        )
+    
+    def finish_import(self, conn, checkpoint):
+        """Restore the database after a completed import and forget its checkpoint"""
+        print("Rebuilding indexes...")
+        started = time.perf_counter()
+        self.restore_import_objects(conn, checkpoint)
+        conn.execute("DELETE FROM import_checkpoint")
+        conn.commit()
+        print(f"Rebuilt indexes in {time.perf_counter() - started:.1f}s")
+    
+    def restore_import_objects(self, conn, checkpoint):
+        """Recreate the indexes and triggers an import dropped and bring derived data up to date"""
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')")}
+        missing = [item for item in checkpoint['dropped'] if item['name'] not in existing]
+        if not missing:
+            return
+        for item in missing:
+            conn.execute(item['sql'])
+        
+        # The search index triggers were off during the load
+        print("Updating search index...")
+        conn.execute("INSERT INTO urls_fts(urls_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO folder_pages_fts(folder_pages_fts) VALUES ('rebuild')")
+        
+        # So were the version counters and the change log: bump every ETag and
+        # leave a gap in the log so connected clients reload in full
+        conn.execute("UPDATE data_versions SET version = version + 1")
+        conn.execute("DELETE FROM changes")
+        cursor = conn.execute("UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = 'changes'")
+        if cursor.rowcount == 0:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('changes', 1)")
+
+def url_domain(url, default=''):
+    """Domain (netloc) of a URL, with a regex fast path for the common case"""
+    match = NETLOC_PATTERN.match(url)
+    if match:
+        return match.group(1)
+    try:
+        return urlparse(url).netloc
+    except:
+        return default
+
+def epoch_ms(timestamp):
+    """Convert an ISO timestamp to integer epoch milliseconds; naive times are local"""
+    if timestamp is None:
+        return None
+    return int(round(visit_seconds(timestamp) * 1000))
+
+def register_sql_functions(conn):
+    """Make the Python helpers the schema relies on available to SQL"""
+    register_functions(conn)
+    conn.create_function("epoch_ms", 1, epoch_ms, deterministic=True)
+    conn.create_function("url_domain", 1, url_domain, deterministic=True)
+
+def import_timestamp(page):
+    """Timestamp of an imported record as a string"""
+    timestamp = page.get('timestamp', '')
+    if isinstance(timestamp, dict) and '$date' in timestamp:
+        timestamp = timestamp['$date']
+    return timestamp
+
+# Frequent pages in the shape the frontend expects; ids are stable per URL
+FREQUENT_QUERY = """
+    SELECT id, url, title, visitCount, timestamp
+    FROM frequent_pages
+    ORDER BY frecency DESC
+"""
+
+# History entries in the shape the frontend expects
+HISTORY_COLUMNS = "id, url, title, timestamp, domain"
+
+# Raw visits, then the daily rollups of visits past the retention period
+HISTORY_TIERS = ('history_pages', 'history_daily_pages')
+
+def parse_daily_id(entry_id):
+    """(url_id, day) of a rolled-up history entry id like day-12-20188, or None"""
+    parts = str(entry_id).split('-')
+    if len(parts) != 3 or parts[0] != 'day' or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    return int(parts[1]), int(parts[2])
+
+def retention_cutoff(days, now=None):
+    """Epoch milliseconds before which visits are rolled up: the start of the UTC day `days` ago"""
+    now_ms = int((now if now is not None else time.time()) * 1000)
+    return (now_ms - days * DAY_MS) // DAY_MS * DAY_MS
+
+def encode_cursor(visited_at, seq):
+    """Encode a (visited_at, seq) position as an opaque pagination cursor"""
+    raw = json.dumps([visited_at, seq]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a pagination cursor back into a (visited_at, seq) tuple"""
+    try:
+        visited_at, seq = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(visited_at, int) or not isinstance(seq, int):
+        raise ValueError("Invalid cursor")
+    return visited_at, seq
+
+def parse_time_bound(value):
+    """Epoch milliseconds of an ISO time range bound; naive times are local"""
+    if value is None or value == '':
+        return None
+    try:
+        return int(datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp() * 1000)
+    except ValueError:
+        raise ValueError(f"Invalid time: {value}")
 
 # Database operations for history
 class HistoryDB:
     def __init__(self, db_manager):
         self.db_manager = db_manager
+        
+        # Best-ranked pages by frecency, loaded on first use
+        self._top = TopFrecency()
+        self._top_loaded = False
+        self._top_stamp = None
+        self._top_lock = threading.Lock()
+    
+    def iter_tiers(self, conn, start=None, end=None):
+        """Iterators over raw visits, daily rollups and archives, each ordered newest first.
+        
+        `start` and `end` limit them to visits in [start, end), in epoch
+        milliseconds.
+        """
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("visited_at >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("visited_at < ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        
+        cursors = [
+            conn.execute(
+                f"SELECT {HISTORY_COLUMNS} FROM {view} {where} ORDER BY visited_at DESC, seq DESC",
+                params
+            )
+            for view in HISTORY_TIERS
+        ]
+        archived = self.db_manager.archives.iter_rows(conn, HISTORY_COLUMNS, where, params, start, end)
+        return cursors + [archived]
     
     def get_all(self):
         """Get all history entries"""
         with self.db_manager.get_connection() as conn:
+            # Fixed-width UTC timestamps sort the same as the times they spell
+            rows = heapq.merge(*self.iter_tiers(conn), key=lambda row: row['timestamp'], reverse=True)
+            return [dict(row) for row in rows]
+    
+    def iter_all_json(self):
+        """Stream all history entries as encoded JSON objects, newest first"""
+        with self.db_manager.get_connection() as conn:
+            tiers = self.iter_tiers(conn)
+            rows = heapq.merge(*tiers, key=lambda row: row['timestamp'], reverse=True)
+            yield from encode_rows(tiers[0], rows)
+    
+    def iter_range(self, start=None, end=None, batch_size=MAX_PAGE_SIZE):
+        """Stream history entries in [start, end) as lists of at most `batch_size` rows, newest first.
+        
+        `start` and `end` are optional ISO times. The rows come straight off
+        the tiers' cursors, so memory use doesn't depend on the range.
+        """
+        start = parse_time_bound(start)
+        end = parse_time_bound(end)
+        with self.db_manager.get_connection() as conn:
+            rows = heapq.merge(*self.iter_tiers(conn, start, end), key=lambda row: row['timestamp'], reverse=True)
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    return
+                yield batch
+    
+    def tier_rows(self, conn, conditions, params, descending, limit, start=None, end=None):
+        """Up to `limit` entries from every tier in (visited_at, seq) order.
+        
+        Each tier walks its own time index to at most `limit` rows, so
+        merging them costs no more than reading one page from each. Only
+        archives overlapping [start, end) are attached, one at a time, and
+        only until the page is full of entries past the next one's range.
+        """
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = 'DESC' if descending else 'ASC'
+        
+        def read(source):
             cursor = conn.execute(
-                "SELECT * FROM history ORDER BY timestamp DESC"
+                f"""
+                SELECT {HISTORY_COLUMNS}, visited_at, seq FROM {source}
+                {where}
+                ORDER BY visited_at {order}, seq {order}
+                LIMIT ?
+                """,
+                (*params, limit)
             )
-            return [dict(row) for row in cursor]
+            rows.extend(dict(row) for row in cursor)
+            rows.sort(key=lambda row: (row['visited_at'], row['seq']), reverse=descending)
+            del rows[limit:]
+        
+        rows = []
+        for view in HISTORY_TIERS:
+            read(view)
+        
+        archives = self.db_manager.archives
+        for archive in archives.list(conn, start, end, newest_first=descending):
+            if len(rows) == limit:
+                edge = rows[-1]['visited_at']
+                if edge > archive['last_visit'] if descending else edge < archive['first_visit']:
+                    break
+            with archives.attached(conn, archive['name']) as schema:
+                read(f"({ARCHIVE_PAGES.format(schema=schema)})")
+        return rows
+    
+    def get_page(self, limit=DEFAULT_PAGE_SIZE, before=None, after=None, start=None, end=None):
+        """Get one page of history, newest first, using keyset pagination.
+        
+        `before` returns entries older than the cursor and `after` returns
+        entries newer than it. Both walk idx_history_visited_at, whose
+        entries are ordered by (visited_at, seq), and the matching indexes
+        of the other tiers, so deep pages cost the same as the first one.
+        Daily rollups have negative seq values, so positions never collide.
+        `start` and `end` are optional ISO times limiting the page to
+        visits in [start, end).
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        start = parse_time_bound(start)
+        end = parse_time_bound(end)
+        
+        conditions = []
+        params = []
+        if start is not None:
+            conditions.append("visited_at >= ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("visited_at < ?")
+            params.append(end)
+        
+        with self.db_manager.get_connection() as conn:
+            if after:
+                # Walk forwards from the cursor, then flip back to newest first
+                position = decode_cursor(after)
+                conditions.append("(visited_at, seq) > (?, ?)")
+                params.extend(position)
+                start = position[0] if start is None else max(start, position[0])
+                items = self.tier_rows(conn, conditions, params, False, limit, start, end)[::-1]
+                has_older = True
+            else:
+                if before:
+                    position = decode_cursor(before)
+                    conditions.append("(visited_at, seq) < (?, ?)")
+                    params.extend(position)
+                    end = position[0] + 1 if end is None else min(end, position[0] + 1)
+                rows = self.tier_rows(conn, conditions, params, True, limit + 1, start, end)
+                items = rows[:limit]
+                has_older = len(rows) > limit
+            
+            next_cursor = None
+            if items and has_older:
+                next_cursor = encode_cursor(items[-1]['visited_at'], items[-1]['seq'])
+            
+            # The newest entry on the page is where polling for newer ones resumes
+            if items:
+                prev_cursor = encode_cursor(items[0]['visited_at'], items[0]['seq'])
+            else:
+                prev_cursor = after
+            
+            # Positions only live in the cursors
+            for item in items:
+                del item['visited_at'], item['seq']
+            
+            return {
+                'items': items,
+                'nextCursor': next_cursor,
+                'prevCursor': prev_cursor
+            }
     
     def add(self, page):
         """Add a new page to history"""
         with self.db_manager.get_connection() as conn:
-            # Parse domain
-            try:
-                domain = urlparse(page['url']).netloc
-            except:
-                domain = ''
+            # Fill in defaults up front so the journal replays the same visit
+            page = dict(page)
+            page.setdefault('id', str(datetime.now().timestamp() * 1000))
+            page.setdefault('timestamp', datetime.now().isoformat())
+            
+            # Insert into history and update frequency
+            updated = self.insert_visits(conn, [page])
+            self.db_manager.journal.record(conn, 'history.add', [page])
+        
+        self.update_top(updated)
+        return page
+    
+    def add_batch(self, pages):
+        """Add many pages to history in a single transaction.
+        
+        Visits whose id is already stored (for example from a retried batch)
+        are skipped, and the frequency counters for the whole batch are folded
+        into one aggregated upsert per distinct URL.
+        """
+        with self.db_manager.get_connection() as conn:
+            # Drop duplicate ids within the batch and ids we already have
+            unique = {}
+            for page in pages:
+                unique.setdefault(page['id'], page)
+            
+            ids = list(unique.keys())
+            existing = set()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor = conn.execute(
+                    f"SELECT id FROM history WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                existing.update(row['id'] for row in cursor)
+            
+            new_pages = [
+                dict(page, timestamp=page.get('timestamp', datetime.now().isoformat()))
+                for page_id, page in unique.items() if page_id not in existing
+            ]
             
-            # Insert into history
+            updated = self.insert_visits(conn, new_pages)
+            if new_pages:
+                self.db_manager.journal.record(conn, 'history.add_batch', [new_pages])
+        
+        self.update_top(updated)
+        return len(new_pages), len(pages) - len(new_pages)
+    
+    def compact_batch(self, cutoff_ms, limit):
+        """Roll up to `limit` of the oldest visits before `cutoff_ms` into history_daily.
+        
+        Visits are added to their URL's row for their UTC day and then
+        deleted from history, all in one transaction. Frequency already
+        counts every visit, so it is left as it is. Returns the number of
+        visits rolled up.
+        """
+        with self.db_manager.get_connection() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS compact_visits (seq INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.compact_visits")
             conn.execute(
                 """
-                INSERT INTO history (id, url, title, timestamp, domain)
-                VALUES (?, ?, ?, ?, ?)
+                INSERT INTO temp.compact_visits (seq)
+                SELECT seq FROM history
+                WHERE visited_at < ?
+                ORDER BY visited_at
+                LIMIT ?
                 """,
-                (
-                    page.get('id', str(datetime.now().timestamp() * 1000)),
-                    page['url'],
-                    page.get('title', ''),
-                    page.get('timestamp', datetime.now().isoformat()),
-                    domain
-                )
+                (cutoff_ms, limit)
             )
+            moved = conn.execute("SELECT changes()").fetchone()[0]
+            if not moved:
+                return 0
             
-            # Update frequency
-            self.update_frequency(conn, page)
+            conn.execute(
+                f"""
+                INSERT INTO history_daily (url_id, day, visits, first_seen, last_seen)
+                SELECT url_id, visited_at / {DAY_MS}, COUNT(*), MIN(visited_at), MAX(visited_at)
+                FROM history
+                WHERE seq IN (SELECT seq FROM temp.compact_visits)
+                GROUP BY url_id, visited_at / {DAY_MS}
+                ON CONFLICT(url_id, day) DO UPDATE SET
+                    visits = visits + excluded.visits,
+                    first_seen = MIN(first_seen, excluded.first_seen),
+                    last_seen = MAX(last_seen, excluded.last_seen)
+                """
+            )
+            conn.execute("DELETE FROM history WHERE seq IN (SELECT seq FROM temp.compact_visits)")
+            conn.execute("DELETE FROM temp.compact_visits")
+            self.db_manager.journal.record(conn, 'history.compact_batch', [cutoff_ms, limit])
+        
+        return moved
+    
+    def archive_batch(self, cutoff_ms, limit):
+        """Move up to `limit` of the oldest visits before `cutoff_ms` into their monthly archive.
+        
+        Each batch stays within the month of the oldest visit, so it writes
+        one archive. Visits are copied and then deleted in one transaction
+        spanning both files. With the main database in WAL mode a crash can
+        commit one side without the other, so copies skip ids the archive
+        already has and the next batch finishes the move. Returns the number
+        of visits moved.
+        """
+        archives = self.db_manager.archives
+        with archives.lock, self.db_manager.get_connection() as conn:
+            row = conn.execute("SELECT MIN(visited_at) FROM history").fetchone()
+            if row[0] is None or row[0] >= cutoff_ms:
+                return 0
+            name = month_name(row[0])
+            upper = min(cutoff_ms, month_bounds(name)[1])
             
-            return page
+            with archives.attached(conn, name, create=True) as schema:
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_visits (seq INTEGER PRIMARY KEY)")
+                conn.execute("DELETE FROM temp.archive_visits")
+                conn.execute(
+                    """
+                    INSERT INTO temp.archive_visits (seq)
+                    SELECT seq FROM history
+                    WHERE visited_at < ?
+                    ORDER BY visited_at
+                    LIMIT ?
+                    """,
+                    (upper, limit)
+                )
+                moved = conn.execute("SELECT changes()").fetchone()[0]
+                
+                conn.execute(
+                    f"""
+                    INSERT OR IGNORE INTO {schema}.history (seq, id, url_id, visited_at)
+                    SELECT seq, id, url_id, visited_at FROM main.history
+                    WHERE seq IN (SELECT seq FROM temp.archive_visits)
+                    """
+                )
+                # history hands out the seq of its newest visit again once that
+                # visit has moved, so the archive may hold a seq already. Those
+                # visits are copied under new ones rather than left behind.
+                conn.execute(
+                    f"""
+                    INSERT INTO {schema}.history (id, url_id, visited_at)
+                    SELECT id, url_id, visited_at FROM main.history h
+                    WHERE seq IN (SELECT seq FROM temp.archive_visits)
+                      AND NOT EXISTS (SELECT 1 FROM {schema}.history a WHERE a.id = h.id)
+                    ORDER BY seq
+                    """
+                )
+                
+                # Archived visits are still history, so the moves aren't logged as deletes
+                last_change = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+                conn.execute("DELETE FROM main.history WHERE seq IN (SELECT seq FROM temp.archive_visits)")
+                conn.execute("DELETE FROM changes WHERE seq > ?", (last_change,))
+                conn.execute("DELETE FROM temp.archive_visits")
+                
+                first, last, count = conn.execute(
+                    f"SELECT MIN(visited_at), MAX(visited_at), COUNT(*) FROM {schema}.history"
+                ).fetchone()
+                conn.execute(
+                    """
+                    INSERT INTO history_archives (name, first_visit, last_visit, visits, version)
+                    VALUES (?, ?, ?, ?, 1)
+                    ON CONFLICT(name) DO UPDATE SET
+                        first_visit = excluded.first_visit,
+                        last_visit = excluded.last_visit,
+                        visits = excluded.visits,
+                        version = version + 1
+                    """,
+                    (name, first, last, count)
+                )
+                self.db_manager.journal.record(conn, 'history.archive_batch', [cutoff_ms, limit])
+                conn.commit()
+        
+        return moved
     
-    def update_frequency(self, conn, page):
-        """Update the frequency counter for a URL"""
-        url = page['url']
+    def upsert_urls(self, conn, pages):
+        """Store the URLs of some visits and return their ids by URL.
+        
+        A URL's title follows its latest visit that reported one.
+        """
+        titles = {}
+        for page in pages:
+            titles[page['url']] = page.get('title') or titles.get(page['url'], '')
         
-        # Get existing frequency
-        cursor = conn.execute(
-            "SELECT count FROM frequency WHERE url = ?",
-            (url,)
+        conn.executemany(
+            """
+            INSERT INTO urls (url, title, domain) VALUES (?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET title = excluded.title
+            WHERE excluded.title != '' AND excluded.title IS NOT urls.title
+            """,
+            [(url, title, url_domain(url)) for url, title in titles.items()]
         )
-        row = cursor.fetchone()
         
-        if row:
-            # Update existing frequency
-            conn.execute(
-                "UPDATE frequency SET count = count + 1, title = ? WHERE url = ?",
-                (page.get('title', url), url)
+        urls = list(titles)
+        ids = {}
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            cursor = conn.execute(
+                f"SELECT id, url FROM urls WHERE url IN ({','.join('?' * len(chunk))})",
+                chunk
             )
-        else:
-            # Insert new frequency entry
-            try:
-                domain = urlparse(url).netloc
-            except:
-                domain = ''
+            ids.update((row['url'], row['id']) for row in cursor)
+        return ids
+    
+    def insert_visits(self, conn, pages):
+        """Insert visits that have ids and timestamps and count them in frequency.
+        
+        Returns the updated frequency rows.
+        """
+        if not pages:
+            return []
+        
+        url_ids = self.upsert_urls(conn, pages)
+        rows = []
+        frequency = {}
+        for page in pages:
+            url_id = url_ids[page['url']]
+            visited_at = epoch_ms(page['timestamp'])
+            rows.append((page['id'], url_id, visited_at))
             
-            conn.execute(
-                """
-                INSERT INTO frequency (url, title, count, domain)
-                VALUES (?, ?, ?, ?)
+            # Aggregate visits per URL
+            entry = frequency.get(url_id)
+            if entry:
+                entry[1] += 1
+                entry[2] = logaddexp(entry[2], visit_weight(visited_at))
+                entry[3] = max(entry[3], visited_at)
+            else:
+                frequency[url_id] = [url_id, 1, visit_weight(visited_at), visited_at]
+        
+        conn.executemany(
+            "INSERT INTO history (id, url_id, visited_at) VALUES (?, ?, ?)",
+            rows
+        )
+        return self.upsert_frequency(conn, [tuple(entry) for entry in frequency.values()])
+    
+    def upsert_frequency(self, conn, entries):
+        """Add visits to frequency rows and return the updated rows.
+        
+        Each entry is (url_id, count, frecency, last_visit) where frecency is
+        the log-space weight of just the new visits and last_visit is in
+        epoch milliseconds.
+        """
+        conn.executemany(
+            """
+            INSERT INTO frequency (url_id, count, frecency, last_visit)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(url_id) DO UPDATE SET
+                count = count + excluded.count,
+                frecency = frecency_add(frecency, excluded.frecency),
+                last_visit = MAX(COALESCE(last_visit, 0), excluded.last_visit)
+            """,
+            entries
+        )
+        
+        url_ids = [entry[0] for entry in entries]
+        updated = []
+        for start in range(0, len(url_ids), 500):
+            chunk = url_ids[start:start + 500]
+            cursor = conn.execute(
+                f"""
+                SELECT id, url, title, visitCount, timestamp, frecency
+                FROM frequent_pages
+                WHERE url_id IN ({','.join('?' * len(chunk))})
                 """,
-                (
-                    url,
-                    page.get('title', url),
-                    1,
-                    domain
-                )
+                chunk
             )
+            updated.extend(dict(row) for row in cursor)
+        return updated
+    
+    def update_top(self, rows):
+        """Feed committed frequency changes into the in-memory ranking"""
+        with self._top_lock:
+            if self._top_loaded:
+                self._top.update(rows)
+    
+    def invalidate_frequent(self):
+        """Reload the ranking on next use, after frequency was changed in bulk"""
+        with self._top_lock:
+            self._top_loaded = False
+    
+    def get_frequent(self, limit=DEFAULT_PAGE_SIZE):
+        """Get the pages with the best frecency score, served from memory"""
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        
+        # Writes from other processes, the CLI included, never reach update(),
+        # so the ranking is only good while the frequency version stands still
+        stamp = self.db_manager.get_etag('frequency')
+        
+        with self._top_lock:
+            if not self._top_loaded or stamp != self._top_stamp:
+                with self.db_manager.get_connection() as conn:
+                    cursor = conn.execute(
+                        """
+                        SELECT id, url, title, visitCount, timestamp, frecency
+                        FROM frequent_pages
+                        ORDER BY frecency DESC
+                        LIMIT ?
+                        """,
+                        (TOP_K,)
+                    )
+                    self._top.load([dict(row) for row in cursor])
+                self._top_loaded = True
+                self._top_stamp = stamp
+            top = self._top.top(limit)
+        
+        return [
+            {key: row[key] for key in ('id', 'url', 'title', 'visitCount', 'timestamp')}
+            for row in top
+        ]
     
-    def get_frequent(self):
-        """Get pages ordered by visit frequency"""
+    def iter_frequent_json(self):
+        """Stream every page ordered by frecency as encoded JSON objects"""
         with self.db_manager.get_connection() as conn:
-            cursor = conn.execute(
-                """
-                SELECT url, title, count, domain FROM frequency
-                ORDER BY count DESC
-                """
-            )
-            
-            frequent_pages = []
-            for row in cursor:
-                row_dict = dict(row)
-                frequent_pages.append({
-                    'id': str(datetime.now().timestamp() * 1000),  # Generate a new ID
-                    'url': row_dict['url'],
-                    'title': row_dict['title'],
-                    'visitCount': row_dict['count'],
-                    'timestamp': datetime.now().isoformat()
-                })
-            
-            return frequent_pages
+            cursor = conn.execute(FREQUENT_QUERY)
+            yield from encode_rows(cursor)
 
 # Database operations for folders
 class FoldersDB:
     def __init__(self, db_manager):
         self.db_manager = db_manager
+        
+        # In-memory copy of the folder tree, rebuilt after any folder mutation
+        self._cache = None
+        self._cache_stamp = None
+        self._cache_generation = 0
+        self._cache_lock = threading.Lock()
+    
+    def invalidate_cache(self):
+        """Drop the cached folder tree so the next read reloads it"""
+        with self._cache_lock:
+            self._cache = None
+            self._cache_generation += 1
+    
+    @contextmanager
+    def write_connection(self):
+        """Connection for folder mutations; invalidates the cache after commit"""
+        with self.db_manager.get_connection() as conn:
+            yield conn
+        self.invalidate_cache()
     
     def get_all(self):
-        """Get all folders with their pages"""
+        """Get all folders with their pages.
+        
+        The tree is served from memory once loaded and is shared between
+        callers, so it must not be modified in place.
+        """
+        # Mutations in other processes, the CLI included, don't invalidate
+        # the cache, so it is only good while the folders version stands still
+        stamp = self.db_manager.get_etag('folders')
+        
+        with self._cache_lock:
+            if self._cache is not None and stamp == self._cache_stamp:
+                return self._cache
+            generation = self._cache_generation
+        
+        folders = self.load_tree()
+        
+        # Only keep the result if no mutation landed while it was loading
+        with self._cache_lock:
+            if generation == self._cache_generation:
+                self._cache = folders
+                self._cache_stamp = stamp
+        return folders
+    
+    def load_tree(self):
+        """Load all folders and their pages with a single joined query"""
         with self.db_manager.get_connection() as conn:
-            # Get all folders
             cursor = conn.execute(
-                "SELECT * FROM folders ORDER BY display_order"
+                """
+                SELECT f.id, f.name, f.is_collapsed, f.display_order,
+                       p.page_id, p.url, p.title, p.timestamp,
+                       p.display_order AS page_order
+                FROM folders f
+                LEFT JOIN folder_pages p ON p.folder_id = f.id
+                ORDER BY f.display_order, f.id, p.display_order
+                """
             )
-            folders = [dict(row) for row in cursor]
             
-            # For each folder, get its pages
-            for folder in folders:
-                cursor = conn.execute(
-                    """
-                    SELECT * FROM folder_pages 
-                    WHERE folder_id = ? 
-                    ORDER BY display_order
-                    """,
-                    (folder['id'],)
-                )
-                folder['pages'] = [dict(row) for row in cursor]
+            # Rows arrive grouped by folder, so the tree is built in one pass
+            folders = []
+            folder = None
+            for row in cursor:
+                if folder is None or folder['id'] != row['id']:
+                    folder = {
+                        'id': row['id'],
+                        'name': row['name'],
+                        'display_order': row['display_order'],
+                        'pages': [],
+                        # Convert is_collapsed to isCollapsed for frontend compatibility
+                        'isCollapsed': row['is_collapsed']
+                    }
+                    folders.append(folder)
                 
-                # Convert is_collapsed to isCollapsed for frontend compatibility
-                folder['isCollapsed'] = folder.pop('is_collapsed', False)
+                if row['page_id'] is not None:
+                    folder['pages'].append({
+                        'folder_id': row['id'],
+                        'page_id': row['page_id'],
+                        'url': row['url'],
+                        'title': row['title'],
+                        'timestamp': row['timestamp'],
+                        'display_order': row['page_order']
+                    })
             
             return folders
     
+    def iter_pages(self):
+        """Stream (folder id, folder name, url, title, timestamp) for every page, folder by folder.
+        
+        Folders without pages appear once with a url of None.
+        """
+        with self.db_manager.get_connection() as conn:
+            cursor = conn.execute(
+                """
+                SELECT f.id, f.name, p.url, p.title, p.timestamp
+                FROM folders f
+                LEFT JOIN folder_pages p ON p.folder_id = f.id
+                ORDER BY f.display_order, f.id, p.display_order
+                """
+            )
+            for row in cursor:
+                yield row['id'], row['name'], row['url'], row['title'], row['timestamp']
+    
+    def iter_all_json(self):
+        """Stream all folders with their pages as encoded JSON objects"""
+        for folder in self.get_all():
+            yield json.dumps(folder)
+    
     def create(self, folder):
         """Create a new folder"""
-        with self.db_manager.get_connection() as conn:
+        with self.write_connection() as conn:
             # Get max display_order
             cursor = conn.execute("SELECT MAX(display_order) as max_order FROM folders")
             row = cursor.fetchone()
@@ -337,17 +1295,19 @@ class FoldersDB:
             # Return created folder
             folder['id'] = folder_id
             folder['pages'] = []
+            self.db_manager.journal.record(conn, 'folders.create', [{k: v for k, v in folder.items() if k != 'pages'}])
             return folder
     
     def delete(self, folder_id):
         """Delete a folder and its pages"""
-        with self.db_manager.get_connection() as conn:
+        with self.write_connection() as conn:
             conn.execute("DELETE FROM folders WHERE id = ?", (folder_id,))
+            self.db_manager.journal.record(conn, 'folders.delete', [folder_id])
             return True
     
     def add_page(self, folder_id, page):
         """Add a page to a folder"""
-        with self.db_manager.get_connection() as conn:
+        with self.write_connection() as conn:
             # Check if URL already exists in this folder
             cursor = conn.execute(
                 "SELECT COUNT(*) as count FROM folder_pages WHERE folder_id = ? AND url = ?",
@@ -367,6 +1327,7 @@ class FoldersDB:
             max_order = row['max_order'] if row and row['max_order'] is not None else 0
             
             page_id = page.get('id', str(datetime.now().timestamp() * 1000))
+            timestamp = page.get('timestamp', datetime.now().isoformat())
             
             conn.execute(
                 """
@@ -378,26 +1339,28 @@ class FoldersDB:
                     page_id,
                     page['url'],
                     page.get('title', ''),
-                    page.get('timestamp', datetime.now().isoformat()),
+                    timestamp,
                     max_order + 1
                 )
             )
             
             page['id'] = page_id
+            self.db_manager.journal.record(conn, 'folders.add_page', [folder_id, dict(page, timestamp=timestamp)])
             return True, page
     
     def remove_page(self, folder_id, page_id):
         """Remove a page from a folder"""
-        with self.db_manager.get_connection() as conn:
+        with self.write_connection() as conn:
             conn.execute(
                 "DELETE FROM folder_pages WHERE folder_id = ? AND page_id = ?",
                 (folder_id, page_id)
             )
+            self.db_manager.journal.record(conn, 'folders.remove_page', [folder_id, page_id])
             return True
     
     def move_page(self, source_id, page_id, target_id):
         """Move a page from one place (history or folder) to a folder"""
-        with self.db_manager.get_connection() as conn:
+        with self.write_connection() as conn:
             page = None
             
             # Try to find page in a folder
@@ -419,11 +1382,24 @@ class FoldersDB:
             # If not found in folders, look in history
             if not page:
                 cursor = conn.execute(
-                    "SELECT * FROM history WHERE id = ?",
+                    f"SELECT {HISTORY_COLUMNS} FROM history_pages WHERE id = ?",
                     (page_id,)
                 )
                 row = cursor.fetchone()
                 
+                # Older entries may have been rolled up into a daily one
+                daily = parse_daily_id(page_id)
+                if not row and daily:
+                    cursor = conn.execute(
+                        f"SELECT {HISTORY_COLUMNS} FROM history_daily_pages WHERE url_id = ? AND day = ?",
+                        daily
+                    )
+                    row = cursor.fetchone()
+                
+                # ...or moved out to an archive
+                if not row and not daily:
+                    row = self.db_manager.archives.find(conn, page_id, HISTORY_COLUMNS)
+                
                 if row:
                     page = dict(row)
             
@@ -464,11 +1440,12 @@ class FoldersDB:
                 )
             )
             
+            self.db_manager.journal.record(conn, 'folders.move_page', [source_id, page_id, target_id])
             return True, page
     
     def rename(self, folder_id, new_name):
         """Rename a folder"""
-        with self.db_manager.get_connection() as conn:
+        with self.write_connection() as conn:
             # Check for name collisions
             cursor = conn.execute(
                 "SELECT COUNT(*) as count FROM folders WHERE name = ? AND id != ?",
@@ -484,33 +1461,230 @@ class FoldersDB:
                 (new_name, folder_id)
             )
             
+            self.db_manager.journal.record(conn, 'folders.rename', [folder_id, new_name])
             return True, {"name": new_name}
     
     def update_order(self, folders):
         """Update the order of folders"""
-        with self.db_manager.get_connection() as conn:
+        with self.write_connection() as conn:
             for idx, folder in enumerate(folders):
                 conn.execute(
                     "UPDATE folders SET display_order = ?, is_collapsed = ? WHERE id = ?",
                     (idx, folder.get('isCollapsed', False), folder['id'])
                 )
             
+            self.db_manager.journal.record(
+                conn, 'folders.update_order',
+                [[{'id': folder['id'], 'isCollapsed': folder.get('isCollapsed', False)} for folder in folders]]
+            )
             return True
     
     def update_page_order(self, folder_id, pages):
         """Update the order of pages in a folder"""
-        with self.db_manager.get_connection() as conn:
+        with self.write_connection() as conn:
             for idx, page in enumerate(pages):
                 conn.execute(
                     "UPDATE folder_pages SET display_order = ? WHERE folder_id = ? AND page_id = ?",
                     (idx, folder_id, page['id'])
                 )
             
+            self.db_manager.journal.record(
+                conn, 'folders.update_page_order', [folder_id, [{'id': page['id']} for page in pages]]
+            )
             return True
 
+# Append-only change log written by triggers on every data table
+class ChangesDB:
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self._last_trim = 0
+    
+    def latest_seq(self):
+        """Get the sequence number of the newest change"""
+        with self.db_manager.get_connection() as conn:
+            return self._latest_seq(conn)
+    
+    def _latest_seq(self, conn):
+        """Read the newest sequence number, which survives trimming"""
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+        return row['seq'] if row else 0
+    
+    def get_since(self, since, limit=MAX_PAGE_SIZE):
+        """Get changes after `since` as encoded JSON objects.
+        
+        Returns (changes, last_seq, reset). `reset` is True when entries the
+        client hasn't seen were already trimmed, so it has to reload in full.
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        
+        with self.db_manager.get_connection() as conn:
+            latest = self._latest_seq(conn)
+            oldest = conn.execute("SELECT MIN(seq) AS seq FROM changes").fetchone()['seq']
+            if oldest is None:
+                oldest = latest + 1
+            if since < oldest - 1:
+                return [], latest, True
+            
+            cursor = conn.execute(
+                """
+                SELECT seq, json_object('seq', seq, 'resource', resource, 'op', op, 'data', json(data)) AS change
+                FROM changes
+                WHERE seq > ?
+                ORDER BY seq
+                LIMIT ?
+                """,
+                (since, limit)
+            )
+            rows = cursor.fetchall()
+        
+        last_seq = rows[-1]['seq'] if rows else max(since, 0)
+        return [row['change'] for row in rows], last_seq, False
+    
+    def save_cursor(self, client_id, seq):
+        """Record how far a client has read, then trim the log if it's due"""
+        with self.db_manager.get_connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO change_cursors (client_id, seq, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(client_id) DO UPDATE SET seq = excluded.seq, updated_at = excluded.updated_at
+                """,
+                (client_id, seq, datetime.now().isoformat())
+            )
+        
+        if time.monotonic() - self._last_trim >= CHANGE_TRIM_INTERVAL:
+            self.trim()
+    
+    def remove_cursor(self, client_id):
+        """Forget a client that has disconnected"""
+        with self.db_manager.get_connection() as conn:
+            conn.execute("DELETE FROM change_cursors WHERE client_id = ?", (client_id,))
+    
+    def trim(self):
+        """Delete changes that every known client has already read"""
+        self._last_trim = time.monotonic()
+        expiry = datetime.fromtimestamp(time.time() - CHANGE_CURSOR_EXPIRY_DAYS * 86400).isoformat()
+        
+        with self.db_manager.get_connection() as conn:
+            conn.execute("DELETE FROM change_cursors WHERE updated_at < ?", (expiry,))
+            row = conn.execute("SELECT MIN(seq) AS seq FROM change_cursors").fetchone()
+            
+            # With no clients left, nobody needs any of the log
+            horizon = row['seq'] if row['seq'] is not None else self._latest_seq(conn)
+            conn.execute("DELETE FROM changes WHERE seq <= ?", (horizon,))
+
+# Full-text search over history and folder pages
+class SearchDB:
+    # Control characters mark highlighted terms until the snippet has been escaped
+    HIGHLIGHT_START = '\x02'
+    HIGHLIGHT_END = '\x03'
+    
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+    
+    def build_query(self, text):
+        """Turn free text into an FTS5 query matching every word as a prefix"""
+        terms = re.findall(r'\w+', text)
+        return ' '.join('"' + term + '"*' for term in terms)
+    
+    def highlight(self, snippet):
+        """Escape a snippet for HTML and turn the markers into <mark> tags"""
+        if snippet is None:
+            return None
+        return (
+            html.escape(snippet)
+            .replace(self.HIGHLIGHT_START, '<mark>')
+            .replace(self.HIGHLIGHT_END, '</mark>')
+        )
+    
+    def search(self, text, scope='all', limit=DEFAULT_PAGE_SIZE, offset=0):
+        """Search titles and URLs, best bm25 matches first.
+        
+        History matches are per URL, represented by its latest visit, or
+        its latest daily rollup once every visit has been rolled up.
+        """
+        match = self.build_query(text)
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        offset = max(0, int(offset))
+        if not match:
+            return {'items': [], 'nextOffset': None}
+        
+        marks = (self.HIGHLIGHT_START, self.HIGHLIGHT_END)
+        parts = []
+        params = []
+        
+        # Titles weigh more than URLs in the ranking
+        if scope in ('all', 'history'):
+            parts.append(
+                """
+                SELECT 'history' AS source, h.id AS id, NULL AS folder_id,
+                       h.url, h.title, h.timestamp,
+                       snippet(urls_fts, 0, ?, ?, '…', 12) AS title_snippet,
+                       snippet(urls_fts, 1, ?, ?, '…', 12) AS url_snippet,
+                       bm25(urls_fts, 5.0, 1.0) AS score
+                FROM urls_fts
+                JOIN history_pages h ON h.seq = (
+                    SELECT seq FROM history
+                    WHERE url_id = urls_fts.rowid
+                    ORDER BY visited_at DESC
+                    LIMIT 1
+                )
+                WHERE urls_fts MATCH ?
+                UNION ALL
+                SELECT 'history' AS source, h.id AS id, NULL AS folder_id,
+                       h.url, h.title, h.timestamp,
+                       snippet(urls_fts, 0, ?, ?, '…', 12) AS title_snippet,
+                       snippet(urls_fts, 1, ?, ?, '…', 12) AS url_snippet,
+                       bm25(urls_fts, 5.0, 1.0) AS score
+                FROM urls_fts
+                JOIN history_daily_pages h ON h.url_id = urls_fts.rowid AND h.day = (
+                    SELECT MAX(day) FROM history_daily WHERE url_id = urls_fts.rowid
+                )
+                WHERE urls_fts MATCH ?
+                  AND NOT EXISTS (SELECT 1 FROM history WHERE url_id = urls_fts.rowid)
+                """
+            )
+            params += [*marks, *marks, match, *marks, *marks, match]
+        if scope in ('all', 'folders'):
+            parts.append(
+                """
+                SELECT 'folder' AS source, fp.page_id AS id, fp.folder_id,
+                       fp.url, fp.title, fp.timestamp,
+                       snippet(folder_pages_fts, 0, ?, ?, '…', 12) AS title_snippet,
+                       snippet(folder_pages_fts, 1, ?, ?, '…', 12) AS url_snippet,
+                       bm25(folder_pages_fts, 5.0, 1.0) AS score
+                FROM folder_pages_fts
+                JOIN folder_pages fp ON fp.rowid = folder_pages_fts.rowid
+                WHERE folder_pages_fts MATCH ?
+                """
+            )
+            params += [*marks, *marks, match]
+        if not parts:
+            raise ValueError(f"Unknown search scope: {scope}")
+        
+        query = ' UNION ALL '.join(parts) + ' ORDER BY score LIMIT ? OFFSET ?'
+        params += [limit + 1, offset]
+        
+        with self.db_manager.get_connection() as conn:
+            rows = [dict(row) for row in conn.execute(query, params)]
+        
+        items = rows[:limit]
+        for item in items:
+            item['titleSnippet'] = self.highlight(item.pop('title_snippet'))
+            item['urlSnippet'] = self.highlight(item.pop('url_snippet'))
+        
+        return {
+            'items': items,
+            'nextOffset': offset + limit if len(rows) > limit else None
+        }
+
 # Create database manager instance
 db_manager = DatabaseManager()
 
+# Write out buffered journal records when the process exits
+atexit.register(db_manager.journal.stop)
+
 # Create model instances
 history_db = HistoryDB(db_manager)
-folders_db = FoldersDB(db_manager)
\ No newline at end of file
+folders_db = FoldersDB(db_manager)
+search_db = SearchDB(db_manager)
+changes_db = ChangesDB(db_manager)
\ No newline at end of file
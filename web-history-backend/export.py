@@ -0,0 +1,169 @@
+import csv
+import html
+import io
+import zlib
+from datetime import datetime
+
+# Parquet output needs pyarrow; the other formats don't
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from database_manager import history_db, folders_db
+from frecency import visit_seconds
+from json_stream import encode_value
+
+# Export settings
+EXPORT_BATCH_ROWS = 5000     # Rows read and encoded per step; also the Parquet row group size
+EXPORT_COLUMNS = ["id", "url", "title", "timestamp", "domain"]
+
+# Content type and file extension of each history export format
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+class _ChunkSink:
+    """File-like object that collects what pyarrow writes so it can be streamed out"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        """Return and forget everything written so far"""
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_csv(batches):
+    """Encode batches of history rows as CSV, header first"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def iter_ndjson(batches):
+    """Encode batches of history rows as one JSON object per line"""
+    prefixes = ['{"' + EXPORT_COLUMNS[0] + '":'] + [',"' + name + '":' for name in EXPORT_COLUMNS[1:]]
+    for batch in batches:
+        lines = []
+        for row in batch:
+            lines.append("".join(prefix + encode_value(value) for prefix, value in zip(prefixes, row)))
+        yield ("}\n".join(lines) + "}\n").encode("utf-8")
+
+def iter_parquet(batches):
+    """Encode batches of history rows as a Parquet file, one row group per batch"""
+    schema = pyarrow.schema([(name, pyarrow.string()) for name in EXPORT_COLUMNS])
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode="w"), schema, compression="zstd")
+    try:
+        for batch in batches:
+            columns = [[row[index] for row in batch] for index in range(len(EXPORT_COLUMNS))]
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, pyarrow.string()) for column in columns], schema=schema
+            ))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+def gzip_stream(chunks):
+    """Compress a stream of byte chunks into a gzip stream"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_history(export_format="csv", start=None, end=None, gzip=False):
+    """Stream history in [start, end) in one of EXPORT_FORMATS as byte chunks, newest first.
+
+    Rows are read EXPORT_BATCH_ROWS at a time from the tiers' cursors and
+    encoded batch by batch, so memory stays flat however much is exported.
+    Raises ValueError for an unknown format or range before anything is
+    read, and RuntimeError for Parquet without pyarrow.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == "parquet" and pyarrow is None:
+        raise RuntimeError("Parquet export needs pyarrow; install it with pip install pyarrow")
+
+    batches = history_db.iter_range(start, end, EXPORT_BATCH_ROWS)
+
+    # Pull the first batch now so a bad range fails before a response starts
+    first = next(batches, None)
+
+    def all_batches():
+        if first is not None:
+            yield [tuple(row) for row in first]
+        for batch in batches:
+            yield [tuple(row) for row in batch]
+
+    encoders = {"csv": iter_csv, "ndjson": iter_ndjson, "parquet": iter_parquet}
+    chunks = encoders[export_format](all_batches())
+    return gzip_stream(chunks) if gzip else chunks
+
+def export_filename(export_format, gzip=False):
+    """Download file name for a history export"""
+    name = f"webhistory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{EXPORT_FORMATS[export_format][1]}"
+    return name + ".gz" if gzip else name
+
+def export_bookmarks():
+    """Stream the folders as a Netscape bookmarks file, line by line.
+
+    Each page's ADD_DATE is the time it was stored in its folder.
+    """
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M')
+    yield (
+        '<!DOCTYPE NETSCAPE-Bookmark-file-1>\n'
+        '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; charset=UTF-8">\n'
+        '<TITLE>Bookmarks</TITLE>\n'
+        '<H1>Bookmarks</H1>\n'
+        '<DL><p>\n'
+        f'    <DT><H3>WebHistoryManager Export - {timestamp}</H3>\n'
+        '    <DL><p>\n'
+    )
+
+    folder_id = None
+    for row_folder_id, name, url, title, added in folders_db.iter_pages():
+        if row_folder_id != folder_id:
+            if folder_id is not None:
+                yield '        </DL><p>\n'
+            folder_id = row_folder_id
+            yield f'        <DT><H3>{html.escape(name)}</H3>\n        <DL><p>\n'
+        if url is not None:
+            add_date = int(visit_seconds(added))
+            yield (
+                f'            <DT><A HREF="{html.escape(url)}" ADD_DATE="{add_date}">'
+                f'{html.escape(title or url)}</A>\n'
+            )
+
+    if folder_id is not None:
+        yield '        </DL><p>\n'
+    yield '    </DL><p>\n</DL><p>\n'
@@ -0,0 +1,111 @@
+import math
+import threading
+import time
+from datetime import datetime
+
+# Frecency settings
+HALF_LIFE_DAYS = 30          # A visit counts half as much after this many days
+EPOCH = 1577836800           # 2020-01-01 UTC, the reference point for scores
+TOP_K = 1000                 # Number of best-ranked pages kept in memory
+
+DECAY_RATE = math.log(2) / (HALF_LIFE_DAYS * 86400)
+
+# Scores are kept as log(sum(2 ** ((visit - EPOCH) / half-life))) over all
+# visits. Every score decays at the same rate, so ranking by the stored value
+# matches ranking by the decayed value at any moment, and a new visit only
+# ever adds to a score. That lets scores be updated incrementally and lets
+# the top-K set be maintained exactly from the visits we see.
+
+def visit_seconds(timestamp):
+    """Convert an ISO timestamp or epoch milliseconds to epoch seconds, falling back to now"""
+    if isinstance(timestamp, (int, float)):
+        return timestamp / 1000.0
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+def visit_weight(timestamp):
+    """Log-space weight of a single visit"""
+    return (visit_seconds(timestamp) - EPOCH) * DECAY_RATE
+
+def logaddexp(a, b):
+    """Combine two log-space scores"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+def seed_score(count, timestamp=None):
+    """Score for `count` visits that all happened at `timestamp` (default now)"""
+    return math.log(max(count or 1, 1)) + visit_weight(timestamp)
+
+def current_score(score, now=None):
+    """Decay a stored score to the number of visit-equivalents it is worth now"""
+    now = time.time() if now is None else now
+    return math.exp(score - (now - EPOCH) * DECAY_RATE)
+
+class LogSumExp:
+    """SQLite aggregate that sums visit weights in log space"""
+
+    def __init__(self):
+        self.total = None
+
+    def step(self, weight):
+        if weight is not None:
+            self.total = logaddexp(self.total, weight)
+
+    def finalize(self):
+        return self.total
+
+def register_functions(conn):
+    """Make the frecency helpers available to SQL on a connection"""
+    conn.create_function("frecency_weight", 1, visit_weight, deterministic=True)
+    conn.create_function("frecency_add", 2, logaddexp, deterministic=True)
+    conn.create_function("frecency_seed", 1, seed_score)
+    conn.create_aggregate("frecency_sum", 1, LogSumExp)
+
+class TopFrecency:
+    """The TOP_K best-scoring pages, kept sorted in memory.
+
+    Scores only grow, so a page outside the set can only enter it by being
+    visited. Feeding every frequency update through update() therefore keeps
+    the set exact without ever rescanning the table.
+    """
+
+    def __init__(self, capacity=TOP_K):
+        self.capacity = capacity
+        self._entries = {}
+        self._ranked = []
+        self._lock = threading.Lock()
+
+    def load(self, rows):
+        """Replace the contents with rows already ordered by score"""
+        with self._lock:
+            self._entries = {row['url']: row for row in rows[:self.capacity]}
+            self._rank()
+
+    def update(self, rows):
+        """Apply rows whose scores just changed"""
+        with self._lock:
+            floor = self._ranked[-1]['frecency'] if len(self._ranked) >= self.capacity else None
+            changed = False
+            for row in rows:
+                if row['url'] in self._entries or floor is None or row['frecency'] > floor:
+                    self._entries[row['url']] = row
+                    changed = True
+            if changed:
+                self._rank()
+
+    def top(self, limit):
+        """Return the `limit` best-ranked pages"""
+        return self._ranked[:limit]
+
+    def _rank(self):
+        """Sort entries by score and drop any beyond capacity"""
+        ranked = sorted(self._entries.values(), key=lambda row: row['frecency'], reverse=True)
+        for row in ranked[self.capacity:]:
+            del self._entries[row['url']]
+        self._ranked = ranked[:self.capacity]
@@ -0,0 +1,168 @@
+import atexit
+import queue
+import threading
+import time
+
+from database_manager import history_db
+
+# Queue settings
+QUEUE_CAPACITY = 10000       # Visits held in memory before callers are turned away
+BATCH_SIZE = 200             # Commit after this many visits...
+FLUSH_INTERVAL_MS = 250      # ...or after this long, whichever comes first
+RETRY_AFTER_SECONDS = 1      # Suggested wait for clients when the queue is full
+
+class IngestQueueFull(Exception):
+    """Raised when a visit is submitted while the queue is at capacity"""
+    pass
+
+class IngestQueue:
+    """Write-behind queue in front of HistoryDB.
+
+    Visits are accepted into a bounded in-memory queue and a single writer
+    thread drains it, committing every BATCH_SIZE visits or FLUSH_INTERVAL_MS
+    milliseconds through HistoryDB.add_batch. Only that thread writes visits,
+    so concurrent requests never contend for the SQLite write lock.
+    """
+
+    def __init__(self, history_db, capacity=QUEUE_CAPACITY, batch_size=BATCH_SIZE,
+                 flush_interval_ms=FLUSH_INTERVAL_MS):
+        self.history_db = history_db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._queue = queue.Queue(maxsize=capacity)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Counters
+        self.submitted = 0
+        self.rejected = 0
+        self.committed = 0
+        self.commits = 0
+        self.failed = 0
+        self.last_commit_ms = 0.0
+        self.max_commit_ms = 0.0
+        self.total_commit_ms = 0.0
+
+    def start(self):
+        """Start the writer thread if it isn't running yet"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+            print("Ingest writer thread started")
+
+    def submit(self, page):
+        """Queue a visit for the writer thread without waiting for the commit"""
+        if not self._thread:
+            self.start()
+        try:
+            self._queue.put_nowait(page)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            raise IngestQueueFull("Ingest queue is full")
+        with self._lock:
+            self.submitted += 1
+
+    def flush(self):
+        """Block until every visit queued so far has been committed"""
+        if self._thread and self._thread.is_alive():
+            self._queue.join()
+        else:
+            self._drain()
+
+    def stop(self):
+        """Stop the writer thread, committing whatever is still queued"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        # Anything that arrived after the thread exited is written here
+        self._drain()
+
+    def stats(self):
+        """Return queue depth and commit counters"""
+        return {
+            "depth": self._queue.qsize(),
+            "capacity": self._queue.maxsize,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "committed": self.committed,
+            "failed": self.failed,
+            "commits": self.commits,
+            "last_commit_ms": round(self.last_commit_ms, 3),
+            "max_commit_ms": round(self.max_commit_ms, 3),
+            "avg_commit_ms": round(self.total_commit_ms / self.commits, 3) if self.commits else 0.0
+        }
+
+    def _run(self):
+        """Writer loop: gather a batch, then commit it in one transaction"""
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._commit(batch)
+
+    def _drain(self):
+        """Commit everything left in the queue from the calling thread"""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._commit(batch)
+
+    def _commit(self, batch):
+        """Write one batch and record how long the commit took"""
+        started = time.perf_counter()
+        try:
+            self.history_db.add_batch(batch)
+            self.committed += len(batch)
+        except Exception as e:
+            print(f"Error committing {len(batch)} queued visits, retrying them one at a time: {e}")
+            self._commit_each(batch)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.commits += 1
+            self.last_commit_ms = elapsed_ms
+            self.max_commit_ms = max(self.max_commit_ms, elapsed_ms)
+            self.total_commit_ms += elapsed_ms
+            for _ in batch:
+                self._queue.task_done()
+
+    def _commit_each(self, batch):
+        """Write the visits of a failed batch separately, so one bad visit doesn't lose the rest"""
+        for page in batch:
+            try:
+                self.history_db.add_batch([page])
+                self.committed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error committing queued visit {page.get('id')}: {e}")
+                import traceback
+                traceback.print_exc()
+
+# Create an instance for direct use
+ingest_queue = IngestQueue(history_db)
+
+# Commit anything still queued when the process exits
+atexit.register(ingest_queue.stop)
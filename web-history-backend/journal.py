@@ -0,0 +1,301 @@
+import heapq
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+from process_lock import ProcessLock
+
+# Journal settings
+SEGMENT_MAGIC = b"WHJ1"                  # First bytes of every segment file
+SEGMENT_MAX_BYTES = 16 * 1024 * 1024     # Start a new segment once one grows past this
+FLUSH_INTERVAL_MS = 100                  # Buffered records are written and fsynced this often
+IMPORT_OP = "import"                     # Marks a bulk import, which replay can't re-run
+
+# Each record is a fixed header followed by a JSON-encoded [op, args] payload.
+# The CRC covers the payload so a torn write at the end of a segment is
+# detected and ignored instead of being replayed.
+RECORD_HEADER = struct.Struct("<IIQd")   # payload length, crc32, lsn, unix time
+
+class Journal:
+    """Append-only log of every write made through HistoryDB and FoldersDB.
+
+    Write methods call record() inside their transaction once their changes
+    are made. The record gets the next log sequence number (LSN), which is
+    also stored in the journal_state table of the same transaction, so any
+    snapshot of the database knows exactly which records it already holds.
+    Records are appended in commit order and written out by a background
+    thread that fsyncs once per FLUSH_INTERVAL_MS rather than once per write.
+
+    Every process writing to the database appends to segments of its own,
+    and readers merge them back into LSN order. Segments are only deleted or
+    moved under a lock file in the journal directory, and a writer whose
+    segment is gone starts a new one.
+    """
+
+    def __init__(self, directory=None, flush_interval_ms=FLUSH_INTERVAL_MS):
+        self.directory = directory
+        self.flush_interval = flush_interval_ms / 1000.0
+
+        # Held from LSN assignment until the record is buffered after commit,
+        # so LSNs are buffered in the order their transactions committed
+        self._order_lock = threading.Lock()
+        self._pending = {}
+        self._floor_lsn = None
+
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._file_lock = threading.Lock()
+        self._segment_lock = None
+
+        self._local = threading.local()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def configure(self, directory, flush_interval_ms=FLUSH_INTERVAL_MS):
+        """Set where segments are written; a directory of None disables the journal"""
+        self.directory = os.path.abspath(directory) if directory else None
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._segment_lock = ProcessLock(os.path.join(self.directory, ".lock")) if directory else None
+
+    def record(self, conn, op, args):
+        """Journal one write operation as part of the connection's open transaction.
+
+        Must be called at most once per transaction, after its writes.
+        """
+        replay_lsn = getattr(self._local, "replay_lsn", None)
+        if replay_lsn is not None:
+            # Replaying: only move the database's position forward
+            conn.execute("UPDATE journal_state SET lsn = ?", (replay_lsn,))
+            return
+        if self.directory is None:
+            return
+
+        self._order_lock.acquire()
+        try:
+            if self._floor_lsn is None:
+                self._floor_lsn = self.last_lsn()
+
+            # The LSN comes from the database rather than a counter in this
+            # process, so processes sharing the file never hand out the same one
+            conn.execute("UPDATE journal_state SET lsn = MAX(lsn, ?) + 1", (self._floor_lsn,))
+            lsn = conn.execute("SELECT lsn FROM journal_state").fetchone()[0]
+            self._pending[id(conn)] = (lsn, self.encode(lsn, op, args))
+        except BaseException:
+            self._order_lock.release()
+            raise
+
+    def committed(self, conn):
+        """Buffer the connection's journal record once its transaction committed"""
+        pending = self._pending.pop(id(conn), None)
+        if pending is None:
+            return
+        with self._buffer_lock:
+            self._buffer.append(pending)
+        self._order_lock.release()
+
+        if not self._thread:
+            self.start()
+
+    def aborted(self, conn):
+        """Drop the connection's journal record after a rollback"""
+        if self._pending.pop(id(conn), None) is not None:
+            self._order_lock.release()
+
+    @contextmanager
+    def replaying(self, lsn):
+        """Apply writes on this thread as the replay of record `lsn`"""
+        self._local.replay_lsn = lsn
+        try:
+            yield
+        finally:
+            self._local.replay_lsn = None
+
+    def encode(self, lsn, op, args):
+        """Encode one record"""
+        payload = json.dumps([op, args], separators=(",", ":")).encode("utf-8")
+        return RECORD_HEADER.pack(len(payload), zlib.crc32(payload), lsn, time.time()) + payload
+
+    def start(self):
+        """Start the flusher thread if it isn't running yet"""
+        with self._file_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="journal-flusher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and write out anything still buffered"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self.close()
+
+    def _run(self):
+        """Flusher loop: write and fsync buffered records in batches"""
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing journal: {e}")
+
+    def flush(self):
+        """Write buffered records to the current segment and fsync it"""
+        with self._file_lock:
+            with self._buffer_lock:
+                records, self._buffer = self._buffer, []
+            if not records:
+                return
+
+            with self._segment_lock:
+                # Another process may have pruned or set aside the segment
+                if self._file is not None and not self.segment_exists():
+                    self._file.close()
+                    self._file = None
+
+                # Each process starts a fresh segment so it never appends after a torn tail
+                if self._file is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    self._path = os.path.join(self.directory, self.segment_name(records[0][0]))
+                    self._file = open(self._path, "ab")
+                    if self._file.tell() == 0:
+                        self._file.write(SEGMENT_MAGIC)
+
+                self._file.write(b"".join(data for _, data in records))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+            if self._file.tell() >= SEGMENT_MAX_BYTES:
+                self._file.close()
+                self._file = None
+
+    def segment_exists(self):
+        """Whether the open segment is still the file at its path"""
+        try:
+            return os.stat(self._path).st_ino == os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def close(self):
+        """Close the current segment; the next flush starts a new one"""
+        with self._file_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def rotate(self):
+        """Flush and start a new segment, so segments line up with snapshots"""
+        self.flush()
+        self.close()
+
+    def segment_name(self, first_lsn):
+        """File name of a segment whose first record is `first_lsn`"""
+        return f"journal_{first_lsn:012d}.log"
+
+    def segments(self):
+        """List (first_lsn, path) for every segment, oldest first"""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+
+        segments = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith("journal_") and filename.endswith(".log"):
+                first_lsn = int(filename[len("journal_"):-len(".log")])
+                segments.append((first_lsn, os.path.join(self.directory, filename)))
+        segments.sort()
+        return segments
+
+    def read_segment(self, path):
+        """Yield (lsn, unix_time, op, args, end_offset) for each intact record"""
+        with open(path, "rb") as f:
+            if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+                print(f"Skipping journal segment with bad header: {path}")
+                return
+
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return
+                length, crc, lsn, timestamp = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    print(f"Ignoring torn journal record {lsn} at the end of {path}")
+                    return
+                op, args = json.loads(payload)
+                yield lsn, timestamp, op, args, f.tell()
+
+    def read(self, after_lsn, until=None):
+        """Yield (lsn, unix_time, op, args) for records after `after_lsn`, up to time `until`"""
+        # Segments of different processes interleave, so they are read side by side
+        readers = [self.read_segment(path) for _, path in self.segments()]
+        for lsn, timestamp, op, args, _ in heapq.merge(*readers, key=lambda record: record[0]):
+            if lsn <= after_lsn:
+                continue
+            if until is not None and timestamp > until:
+                return
+            yield lsn, timestamp, op, args
+
+    def segment_last_lsn(self, path):
+        """LSN of the last intact record in a segment, or 0 when it has none"""
+        last = 0
+        for lsn, _, _, _, _ in self.read_segment(path):
+            last = lsn
+        return last
+
+    def last_lsn(self):
+        """LSN of the newest record on disk, or 0 when there are none"""
+        return max((self.segment_last_lsn(path) for _, path in self.segments()), default=0)
+
+    def prune(self, lsn):
+        """Delete segments holding only records at or before `lsn`"""
+        if self._segment_lock is None:
+            return
+        with self._segment_lock:
+            for _, path in self.segments():
+                if self.segment_last_lsn(path) <= lsn:
+                    os.remove(path)
+                    print(f"Removed old journal segment: {os.path.basename(path)}")
+
+    def truncate_after(self, lsn):
+        """Set aside every record after `lsn`, which a restore has abandoned.
+
+        The records are kept in an abandoned/ subdirectory rather than
+        deleted, and the next write continues from the database's position.
+        """
+        with self._order_lock:
+            self.rotate()
+            self._floor_lsn = None
+            if self._segment_lock is None:
+                return
+
+            with self._segment_lock:
+                archive = os.path.join(self.directory or "", "abandoned", datetime.now().strftime("%Y%m%d_%H%M%S"))
+                for first_lsn, path in self.segments():
+                    if first_lsn > lsn:
+                        os.makedirs(archive, exist_ok=True)
+                        shutil.move(path, os.path.join(archive, os.path.basename(path)))
+                        continue
+
+                    # Cut a segment that runs past the restore point at the last kept record
+                    keep = len(SEGMENT_MAGIC)
+                    tail = False
+                    for record_lsn, _, _, _, end in self.read_segment(path):
+                        if record_lsn > lsn:
+                            tail = True
+                            break
+                        keep = end
+                    if tail:
+                        os.makedirs(archive, exist_ok=True)
+                        shutil.copy2(path, os.path.join(archive, os.path.basename(path)))
+                        with open(path, "r+b") as f:
+                            f.truncate(keep)
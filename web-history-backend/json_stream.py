@@ -0,0 +1,162 @@
+import json
+import re
+from json.encoder import encode_basestring_ascii
+
+# Flush streamed output in chunks of roughly this many characters
+CHUNK_SIZE = 64 * 1024
+
+# Read streamed input in blocks of this many characters
+READ_SIZE = 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_DECODER = json.JSONDecoder()
+
+def _encode_other(value):
+    """Encode a value that has no dedicated fast path"""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    return json.dumps(value)
+
+# Encoders for the value types sqlite3 hands back, looked up by exact type
+_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: float.__repr__,
+    type(None): lambda value: 'null',
+    bool: lambda value: 'true' if value else 'false',
+}
+
+def encode_value(value):
+    """Encode a single scalar as JSON"""
+    return _ENCODERS.get(type(value), _encode_other)(value)
+
+def encode_rows(cursor, rows=None):
+    """Encode rows straight from a sqlite3 cursor as JSON objects.
+
+    Column names are encoded once up front and each row tuple is written
+    out directly, so no intermediate dict is built per row. `rows` replaces
+    the cursor's own rows, for results merged from cursors sharing its
+    columns.
+    """
+    columns = [column[0] for column in cursor.description]
+    prefixes = ['{' + encode_basestring_ascii(columns[0]) + ':']
+    prefixes += [',' + encode_basestring_ascii(name) + ':' for name in columns[1:]]
+
+    encoders = _ENCODERS
+    fallback = _encode_other
+    for row in cursor if rows is None else rows:
+        parts = []
+        for prefix, value in zip(prefixes, row):
+            parts.append(prefix)
+            parts.append(encoders.get(type(value), fallback)(value))
+        parts.append('}')
+        yield ''.join(parts)
+
+def stream_json_array(items, chunk_size=CHUNK_SIZE):
+    """Write an iterable of encoded JSON values out as one JSON array.
+
+    Output is buffered into chunks of about `chunk_size` characters so a
+    large result is sent as a modest number of writes without ever being
+    held in memory as a whole.
+    """
+    buffer = ['[']
+    size = 1
+    first = True
+    for item in items:
+        if first:
+            first = False
+        else:
+            buffer.append(',')
+        buffer.append(item)
+        size += len(item) + 1
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    buffer.append(']')
+    yield ''.join(buffer)
+
+class _StreamReader:
+    """Decodes JSON values one at a time from a text file read in blocks"""
+
+    def __init__(self, f, read_size=READ_SIZE):
+        self.f = f
+        self.read_size = read_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read the next block, dropping what has already been consumed"""
+        data = self.f.read(self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character, or '' at the end"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, char):
+        """Consume `char`, which must be the next non-whitespace character"""
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r} in JSON stream")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+                # A number that ends the buffer may continue in the next block
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+def iter_json_array(f, read_size=READ_SIZE):
+    """Yield the items of a top-level JSON array without loading the file.
+
+    Files holding one JSON value per line are read the same way.
+    """
+    reader = _StreamReader(f, read_size)
+    if reader.peek() != '[':
+        while reader.peek():
+            yield reader.value()
+        return
+
+    reader.expect('[')
+    if reader.peek() == ']':
+        return
+    while True:
+        yield reader.value()
+        if reader.peek() == ']':
+            return
+        reader.expect(',')
+
+def iter_json_object(f, read_size=READ_SIZE):
+    """Yield the (key, value) pairs of a top-level JSON object without loading the file"""
+    reader = _StreamReader(f, read_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        yield key, reader.value()
+        if reader.peek() == '}':
+            return
+        reader.expect(',')
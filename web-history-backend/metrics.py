@@ -0,0 +1,429 @@
+import bisect
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Histogram buckets, in seconds
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BACKUP_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+# Statement tracking settings
+MAX_STATEMENTS = 500        # Distinct normalized statements tracked; any more are counted as OTHER_STATEMENT
+OTHER_STATEMENT = "other"
+FETCH_BATCH_ROWS = 256      # Rows read per timed step while a cursor is iterated
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_SPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+")
+
+@functools.lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """Statement text with literals and placeholder lists folded, so variants of a query count as one"""
+    text = _SPACE.sub(" ", sql).strip()
+    text = _STRING.sub("?", text)
+    text = _NUMBER.sub("?", text)
+    text = _PLACEHOLDERS.sub("(?...)", text)
+    return _ROWS.sub("(?...), ...", text)
+
+def escape_label(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+class Histogram:
+    """Counts of observations per bucket, with their sum, as Prometheus histograms keep them"""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        """Text format lines of the histogram, with cumulative buckets"""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{format_labels(labels + [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_sum{format_labels(labels)} {self.sum:.6f}")
+        lines.append(f"{name}_count{format_labels(labels)} {self.count}")
+        return lines
+
+class RequestTimer:
+    """Where one request's time went, collected while it is handled"""
+    __slots__ = ("method", "route", "started", "sql_seconds", "statements", "rows", "json_seconds",
+                 "json_bytes", "connection_seconds")
+
+    def __init__(self, method, route):
+        self.method = method
+        self.route = route
+        self.started = time.perf_counter()
+        self.sql_seconds = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.json_seconds = 0.0
+        self.json_bytes = 0
+        self.connection_seconds = 0.0
+
+class RouteStats:
+    """Totals of every request to one route"""
+    __slots__ = ("duration", "statuses", "response_bytes", "sql_seconds", "statements", "rows",
+                 "json_seconds", "json_bytes", "connection_seconds")
+
+    def __init__(self):
+        self.duration = Histogram(REQUEST_BUCKETS)
+        self.statuses = {}
+        self.response_bytes = 0
+        self.sql_seconds = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.json_seconds = 0.0
+        self.json_bytes = 0
+        self.connection_seconds = 0.0
+
+class StatementStats:
+    """Totals of every run of one normalized statement"""
+    __slots__ = ("calls", "seconds", "rows", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.errors = 0
+
+class Metrics:
+    """In-process counters and histograms of requests, SQL, connections and backups.
+
+    Request hooks and instrumented connections feed it; render() writes it
+    out in the Prometheus text format. SQL run while a request is handled on
+    the same thread is also charged to that request's route, which shows
+    how its time splits between SQL, JSON and connection checkout. Each
+    process keeps its own figures.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.slow_query_ms = 0
+        self.slow_query_log = None
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._local = threading.local()
+        self.started = time.time()
+
+        # Called as hook(connection, sql, parameters) before each statement
+        # on an instrumented connection runs, by tools that inspect them
+        self.statement_hook = None
+
+        self.routes = {}
+        self.statements = {}
+        self.backups = {}
+        self.backup_bytes = {"snapshot": 0, "stored": 0}
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.connections_opened = 0
+
+    def configure(self, enabled=True, slow_query_ms=0, slow_query_log=None):
+        """Apply the metrics settings of the database config"""
+        self.enabled = bool(enabled)
+        self.slow_query_ms = float(slow_query_ms or 0)
+        self.slow_query_log = slow_query_log
+
+    # Requests
+
+    def begin_request(self, method, route):
+        """Start timing a request handled on this thread"""
+        timer = RequestTimer(method, route)
+        self._local.request = timer
+        return timer
+
+    def end_request(self, timer, status, response_bytes):
+        """Record a request once its response has been sent"""
+        if getattr(self._local, "request", None) is timer:
+            self._local.request = None
+        elapsed = time.perf_counter() - timer.started
+        with self._lock:
+            stats = self.routes.get((timer.method, timer.route))
+            if stats is None:
+                stats = self.routes[(timer.method, timer.route)] = RouteStats()
+            stats.duration.observe(elapsed)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.response_bytes += response_bytes
+            stats.sql_seconds += timer.sql_seconds
+            stats.statements += timer.statements
+            stats.rows += timer.rows
+            stats.json_seconds += timer.json_seconds
+            stats.json_bytes += timer.json_bytes
+            stats.connection_seconds += timer.connection_seconds
+
+    def current_request(self):
+        return getattr(self._local, "request", None)
+
+    def observe_json(self, seconds, size):
+        """Charge JSON encoding or decoding to the request on this thread"""
+        timer = getattr(self._local, "request", None)
+        if timer is not None:
+            timer.json_seconds += seconds
+            timer.json_bytes += size
+
+    # Connections and SQL
+
+    def observe_checkout(self, seconds, opened):
+        """Record the time taken to lend out a connection, and whether a new one was opened"""
+        timer = getattr(self._local, "request", None)
+        if timer is not None:
+            timer.connection_seconds += seconds
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds += seconds
+            self.connections_opened += opened
+
+    def observe_statement(self, sql, seconds, rows, executed=False, failed=False):
+        """Record time spent on a statement, when it runs or as its rows are fetched"""
+        key = normalize_sql(sql)
+        timer = getattr(self._local, "request", None)
+        if timer is not None:
+            timer.sql_seconds += seconds
+            timer.rows += rows
+            timer.statements += executed
+        with self._lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    key = OTHER_STATEMENT
+                stats = self.statements.setdefault(key, StatementStats())
+            stats.calls += executed
+            stats.seconds += seconds
+            stats.rows += rows
+            stats.errors += failed
+
+    def is_slow(self, seconds):
+        return self.slow_query_ms and seconds * 1000 >= self.slow_query_ms
+
+    def log_slow_query(self, sql, seconds, rows):
+        """Append a slow statement to the slow query log.
+
+        Parameters are left out: they are mostly the URLs and titles of
+        visited pages.
+        """
+        timer = getattr(self._local, "request", None)
+        source = f"{timer.method} {timer.route}" if timer is not None else threading.current_thread().name
+        line = (f"{datetime.now().isoformat(timespec='milliseconds')} {seconds * 1000:.1f} ms {rows} rows "
+                f"[{source}] {_SPACE.sub(' ', sql).strip()}\n")
+        if not self.slow_query_log:
+            print(f"Slow query: {line}", end="")
+            return
+        with self._log_lock:
+            try:
+                directory = os.path.dirname(self.slow_query_log)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.slow_query_log, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"Error writing slow query log: {e}")
+
+    # Backups
+
+    def observe_backup(self, operation, outcome, seconds, size=0, stored=0):
+        """Record how long a backup or restore took and, for new backups, their sizes"""
+        with self._lock:
+            histogram = self.backups.get((operation, outcome))
+            if histogram is None:
+                histogram = self.backups[(operation, outcome)] = Histogram(BACKUP_BUCKETS)
+            histogram.observe(seconds)
+            self.backup_bytes["snapshot"] += size
+            self.backup_bytes["stored"] += stored
+
+    # Output
+
+    def render(self, gauges=()):
+        """Every metric in the Prometheus text format.
+
+        `gauges` adds (name, help, value) entries read from elsewhere at
+        the time of the scrape. Every series is labelled with the process
+        id, as each worker process counts on its own and a scrape reaches
+        whichever worker accepts it.
+        """
+        lines = []
+        process = [("pid", os.getpid())]
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            routes = sorted(self.routes.items())
+            statements = sorted(self.statements.items())
+            backups = sorted(self.backups.items())
+
+            family("web_history_http_request_duration_seconds", "histogram",
+                   "Time to handle a request, including sending its body")
+            for (method, route), stats in routes:
+                lines.extend(stats.duration.samples("web_history_http_request_duration_seconds",
+                                                    process + [("method", method), ("route", route)]))
+            family("web_history_http_requests_total", "counter", "Requests by route and status")
+            for (method, route), stats in routes:
+                for status, count in sorted(stats.statuses.items()):
+                    labels = format_labels(process + [("method", method), ("route", route), ("status", status)])
+                    lines.append(f"web_history_http_requests_total{labels} {count}")
+            for name, attribute, kind, help_text in (
+                ("web_history_http_response_bytes_total", "response_bytes", "counter", "Bytes of response bodies sent"),
+                ("web_history_http_sql_seconds_total", "sql_seconds", "counter", "Time spent running SQL while handling requests"),
+                ("web_history_http_sql_statements_total", "statements", "counter", "SQL statements run while handling requests"),
+                ("web_history_http_sql_rows_total", "rows", "counter", "Rows read from SQL while handling requests"),
+                ("web_history_http_json_seconds_total", "json_seconds", "counter", "Time spent encoding and decoding JSON while handling requests"),
+                ("web_history_http_json_bytes_total", "json_bytes", "counter", "Characters of JSON encoded and decoded while handling requests"),
+                ("web_history_http_connection_seconds_total", "connection_seconds", "counter", "Time spent getting a database connection while handling requests")
+            ):
+                family(name, kind, help_text)
+                for (method, route), stats in routes:
+                    value = getattr(stats, attribute)
+                    labels = format_labels(process + [("method", method), ("route", route)])
+                    lines.append(f"{name}{labels} {value:.6f}" if isinstance(value, float) else f"{name}{labels} {value}")
+
+            for name, attribute, help_text in (
+                ("web_history_sql_calls_total", "calls", "Runs of each normalized SQL statement"),
+                ("web_history_sql_seconds_total", "seconds", "Time spent running and fetching each normalized SQL statement"),
+                ("web_history_sql_rows_total", "rows", "Rows returned by each normalized SQL statement"),
+                ("web_history_sql_errors_total", "errors", "Failed runs of each normalized SQL statement")
+            ):
+                family(name, "counter", help_text)
+                for statement, stats in statements:
+                    value = getattr(stats, attribute)
+                    labels = format_labels(process + [("statement", statement)])
+                    lines.append(f"{name}{labels} {value:.6f}" if isinstance(value, float) else f"{name}{labels} {value}")
+
+            family("web_history_db_checkouts_total", "counter", "Connections lent out by the pool")
+            lines.append(f"web_history_db_checkouts_total{format_labels(process)} {self.checkouts}")
+            family("web_history_db_checkout_seconds_total", "counter", "Time spent lending out connections, opening new ones included")
+            lines.append(f"web_history_db_checkout_seconds_total{format_labels(process)} {self.checkout_seconds:.6f}")
+            family("web_history_db_connections_opened_total", "counter", "Database connections opened")
+            lines.append(f"web_history_db_connections_opened_total{format_labels(process)} {self.connections_opened}")
+
+            family("web_history_backup_duration_seconds", "histogram", "Time taken by backups and restores, by outcome")
+            for (operation, outcome), histogram in backups:
+                lines.extend(histogram.samples("web_history_backup_duration_seconds",
+                                               process + [("operation", operation), ("outcome", outcome)]))
+            family("web_history_backup_bytes_total", "counter",
+                   "Size of the snapshots backed up, and the bytes of new chunks stored for them")
+            for kind, value in sorted(self.backup_bytes.items()):
+                lines.append(f"web_history_backup_bytes_total{format_labels(process + [('kind', kind)])} {value}")
+
+        family("web_history_process_start_time_seconds", "gauge", "When this process started, in Unix time")
+        lines.append(f"web_history_process_start_time_seconds{format_labels(process)} {self.started:.3f}")
+        for name, help_text, value in gauges:
+            family(name, "gauge", help_text)
+            lines.append(f"{name}{format_labels(process)} {value}")
+        return "\n".join(lines) + "\n"
+
+# Create an instance for direct use
+metrics = Metrics()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports the time its statement takes and the rows it returns to `metrics`"""
+
+    def execute(self, sql, parameters=(), /):
+        if metrics.statement_hook is not None:
+            metrics.statement_hook(self.connection, sql, parameters)
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, parameters, /):
+        if metrics.statement_hook is not None:
+            # The hook sees the first set of parameters, so keep them all
+            parameters = list(parameters)
+            if parameters:
+                metrics.statement_hook(self.connection, sql, parameters[0])
+        return self._run(super().executemany, sql, parameters)
+
+    def _run(self, method, sql, parameters):
+        self._sql = sql
+        self._spent = 0.0
+        self._rows = 0
+        self._logged = False
+        started = time.perf_counter()
+        try:
+            method(sql, parameters)
+        except BaseException:
+            self._step(time.perf_counter() - started, 0, executed=True, failed=True)
+            raise
+        self._step(time.perf_counter() - started, 0, executed=True)
+        return self
+
+    def _step(self, seconds, rows, executed=False, failed=False, check=True):
+        metrics.observe_statement(self._sql, seconds, rows, executed, failed)
+        self._spent += seconds
+        self._rows += rows
+        # Logged once, as soon as the time spent on the statement reaches the threshold
+        if check and not self._logged and metrics.is_slow(self._spent):
+            self._logged = True
+            metrics.log_slow_query(self._sql, self._spent, self._rows)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._step(time.perf_counter() - started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._step(time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._step(time.perf_counter() - started, len(rows))
+        return rows
+
+    def __iter__(self):
+        # Timing every row would cost as much as reading it, so rows are
+        # fetched and timed in batches and handed out one by one
+        return self._iterate()
+
+    def _iterate(self):
+        fetch = super().fetchmany
+        try:
+            while True:
+                started = time.perf_counter()
+                rows = fetch(FETCH_BATCH_ROWS)
+                self._step(time.perf_counter() - started, len(rows), check=False)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            # Checked once the rows are read, so the log shows the whole time
+            if not self._logged and metrics.is_slow(self._spent):
+                self._logged = True
+                metrics.log_slow_query(self._sql, self._spent, self._rows)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements run on InstrumentedCursor"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=(), /):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, parameters, /):
+        return self.cursor().executemany(sql, parameters)
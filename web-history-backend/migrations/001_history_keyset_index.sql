@@ -0,0 +1,5 @@
+-- Extend the history timestamp index with the primary key so keyset
+-- pagination on (timestamp, id) can be answered from the index alone
+
+DROP INDEX IF EXISTS idx_history_timestamp;
+CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp, id);
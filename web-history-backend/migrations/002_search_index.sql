@@ -0,0 +1,49 @@
+-- Full-text search over history and folder pages. Both indexes are
+-- external-content FTS5 tables kept in sync with their source tables by
+-- triggers, so the text itself is only stored once.
+
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    title,
+    url,
+    content='history',
+    content_rowid='rowid',
+    prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, title, url) VALUES (new.rowid, new.title, new.url);
+END;
+
+CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, title, url) VALUES ('delete', old.rowid, old.title, old.url);
+END;
+
+CREATE TRIGGER IF NOT EXISTS history_fts_update AFTER UPDATE OF title, url ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, title, url) VALUES ('delete', old.rowid, old.title, old.url);
+    INSERT INTO history_fts(rowid, title, url) VALUES (new.rowid, new.title, new.url);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS folder_pages_fts USING fts5(
+    title,
+    url,
+    content='folder_pages',
+    content_rowid='rowid',
+    prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS folder_pages_fts_insert AFTER INSERT ON folder_pages BEGIN
+    INSERT INTO folder_pages_fts(rowid, title, url) VALUES (new.rowid, new.title, new.url);
+END;
+
+CREATE TRIGGER IF NOT EXISTS folder_pages_fts_delete AFTER DELETE ON folder_pages BEGIN
+    INSERT INTO folder_pages_fts(folder_pages_fts, rowid, title, url) VALUES ('delete', old.rowid, old.title, old.url);
+END;
+
+CREATE TRIGGER IF NOT EXISTS folder_pages_fts_update AFTER UPDATE OF title, url ON folder_pages BEGIN
+    INSERT INTO folder_pages_fts(folder_pages_fts, rowid, title, url) VALUES ('delete', old.rowid, old.title, old.url);
+    INSERT INTO folder_pages_fts(rowid, title, url) VALUES (new.rowid, new.title, new.url);
+END;
+
+-- Index whatever is already stored
+INSERT INTO history_fts(history_fts) VALUES ('rebuild');
+INSERT INTO folder_pages_fts(folder_pages_fts) VALUES ('rebuild');
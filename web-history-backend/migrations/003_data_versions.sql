@@ -0,0 +1,51 @@
+-- Per-resource change counters used as ETags. Every write to a table
+-- bumps the version of the resource it belongs to.
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    resource TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT OR IGNORE INTO data_versions (resource, version) VALUES ('history', 0);
+INSERT OR IGNORE INTO data_versions (resource, version) VALUES ('frequency', 0);
+INSERT OR IGNORE INTO data_versions (resource, version) VALUES ('folders', 0);
+
+CREATE TRIGGER IF NOT EXISTS history_version_insert AFTER INSERT ON history BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'history';
+END;
+CREATE TRIGGER IF NOT EXISTS history_version_update AFTER UPDATE ON history BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'history';
+END;
+CREATE TRIGGER IF NOT EXISTS history_version_delete AFTER DELETE ON history BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'history';
+END;
+
+CREATE TRIGGER IF NOT EXISTS frequency_version_insert AFTER INSERT ON frequency BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'frequency';
+END;
+CREATE TRIGGER IF NOT EXISTS frequency_version_update AFTER UPDATE ON frequency BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'frequency';
+END;
+CREATE TRIGGER IF NOT EXISTS frequency_version_delete AFTER DELETE ON frequency BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'frequency';
+END;
+
+CREATE TRIGGER IF NOT EXISTS folders_version_insert AFTER INSERT ON folders BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'folders';
+END;
+CREATE TRIGGER IF NOT EXISTS folders_version_update AFTER UPDATE ON folders BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'folders';
+END;
+CREATE TRIGGER IF NOT EXISTS folders_version_delete AFTER DELETE ON folders BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'folders';
+END;
+
+CREATE TRIGGER IF NOT EXISTS folder_pages_version_insert AFTER INSERT ON folder_pages BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'folders';
+END;
+CREATE TRIGGER IF NOT EXISTS folder_pages_version_update AFTER UPDATE ON folder_pages BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'folders';
+END;
+CREATE TRIGGER IF NOT EXISTS folder_pages_version_delete AFTER DELETE ON folder_pages BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'folders';
+END;
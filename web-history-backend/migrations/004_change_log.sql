@@ -0,0 +1,76 @@
+-- Append-only change log for incremental client updates. Triggers record
+-- every write to the history, frequency and folder tables as a compact
+-- delta; change_cursors tracks how far each client has read so entries
+-- can be trimmed once everyone has moved past them.
+
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    resource TEXT NOT NULL,
+    op TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS change_cursors (
+    client_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
+-- History
+CREATE TRIGGER IF NOT EXISTS history_change_insert AFTER INSERT ON history BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('history', 'upsert', json_object(
+        'id', new.id, 'url', new.url, 'title', new.title,
+        'timestamp', new.timestamp, 'domain', new.domain));
+END;
+CREATE TRIGGER IF NOT EXISTS history_change_update AFTER UPDATE ON history BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('history', 'upsert', json_object(
+        'id', new.id, 'url', new.url, 'title', new.title,
+        'timestamp', new.timestamp, 'domain', new.domain));
+END;
+CREATE TRIGGER IF NOT EXISTS history_change_delete AFTER DELETE ON history BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('history', 'delete', json_object('id', old.id));
+END;
+
+-- Frequency
+CREATE TRIGGER IF NOT EXISTS frequency_change_insert AFTER INSERT ON frequency BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('frequency', 'upsert', json_object(
+        'url', new.url, 'title', new.title, 'visitCount', new.count));
+END;
+CREATE TRIGGER IF NOT EXISTS frequency_change_update AFTER UPDATE ON frequency BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('frequency', 'upsert', json_object(
+        'url', new.url, 'title', new.title, 'visitCount', new.count));
+END;
+CREATE TRIGGER IF NOT EXISTS frequency_change_delete AFTER DELETE ON frequency BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('frequency', 'delete', json_object('url', old.url));
+END;
+
+-- Folders
+CREATE TRIGGER IF NOT EXISTS folders_change_insert AFTER INSERT ON folders BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('folders', 'upsert', json_object(
+        'id', new.id, 'name', new.name, 'isCollapsed', new.is_collapsed,
+        'display_order', new.display_order));
+END;
+CREATE TRIGGER IF NOT EXISTS folders_change_update AFTER UPDATE ON folders BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('folders', 'upsert', json_object(
+        'id', new.id, 'name', new.name, 'isCollapsed', new.is_collapsed,
+        'display_order', new.display_order));
+END;
+CREATE TRIGGER IF NOT EXISTS folders_change_delete AFTER DELETE ON folders BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('folders', 'delete', json_object('id', old.id));
+END;
+
+-- Pages within folders
+CREATE TRIGGER IF NOT EXISTS folder_pages_change_insert AFTER INSERT ON folder_pages BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('folder_pages', 'upsert', json_object(
+        'folder_id', new.folder_id, 'page_id', new.page_id, 'url', new.url,
+        'title', new.title, 'timestamp', new.timestamp, 'display_order', new.display_order));
+END;
+CREATE TRIGGER IF NOT EXISTS folder_pages_change_update AFTER UPDATE ON folder_pages BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('folder_pages', 'upsert', json_object(
+        'folder_id', new.folder_id, 'page_id', new.page_id, 'url', new.url,
+        'title', new.title, 'timestamp', new.timestamp, 'display_order', new.display_order));
+END;
+CREATE TRIGGER IF NOT EXISTS folder_pages_change_delete AFTER DELETE ON folder_pages BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('folder_pages', 'delete', json_object(
+        'folder_id', old.folder_id, 'page_id', old.page_id));
+END;
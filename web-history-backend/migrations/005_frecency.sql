@@ -0,0 +1,15 @@
+-- Frecency score (visit count with time decay) and last visit time per URL.
+-- Scores are backfilled from the visits in history; URLs with no recorded
+-- visits are seeded from their count as if visited now.
+
+ALTER TABLE frequency ADD COLUMN frecency REAL NOT NULL DEFAULT 0;
+ALTER TABLE frequency ADD COLUMN last_visit TEXT;
+
+UPDATE frequency SET
+    frecency = COALESCE(
+        (SELECT frecency_sum(frecency_weight(h.timestamp)) FROM history h WHERE h.url = frequency.url),
+        frecency_seed(count)
+    ),
+    last_visit = (SELECT MAX(h.timestamp) FROM history h WHERE h.url = frequency.url);
+
+CREATE INDEX IF NOT EXISTS idx_frequency_frecency ON frequency(frecency);
@@ -0,0 +1,10 @@
+-- Position of the newest mutation journal record applied to this database.
+-- It is updated in the same transaction as the write it describes, so a
+-- snapshot records exactly where journal replay has to pick up.
+
+CREATE TABLE IF NOT EXISTS journal_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    lsn INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO journal_state (id, lsn) VALUES (1, 0);
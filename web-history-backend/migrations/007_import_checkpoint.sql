@@ -0,0 +1,8 @@
+-- Progress of an interrupted JSON import. The state is written in the same
+-- transaction as each chunk of imported rows, so a rerun resumes exactly
+-- where the last committed chunk left off.
+
+CREATE TABLE IF NOT EXISTS import_checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    state TEXT NOT NULL
+);
@@ -0,0 +1,166 @@
+-- Normalized storage for visits. Each URL's text, title and domain is
+-- stored once in urls; history keeps one compact row per visit with the
+-- visit time as integer milliseconds, and frequency is keyed by URL id.
+-- The history_pages and frequent_pages views put the rows back into the
+-- shape the API has always returned.
+
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    title TEXT,
+    domain TEXT
+);
+
+-- frequency holds the latest title of every URL it knows; the newest visit
+-- supplies it for the rest
+INSERT OR IGNORE INTO urls (url, title, domain)
+SELECT url, title, domain FROM frequency;
+
+INSERT OR IGNORE INTO urls (url, title, domain)
+SELECT url, title, domain FROM history ORDER BY timestamp DESC;
+
+-- Visits; seq gives every visit a stable integer position for pagination
+CREATE TABLE history_normalized (
+    seq INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    url_id INTEGER NOT NULL REFERENCES urls(id),
+    visited_at INTEGER NOT NULL
+);
+
+INSERT INTO history_normalized (id, url_id, visited_at)
+SELECT h.id, u.id, epoch_ms(h.timestamp)
+FROM history h
+JOIN urls u ON u.url = h.url
+ORDER BY h.timestamp;
+
+CREATE TABLE frequency_normalized (
+    url_id INTEGER PRIMARY KEY REFERENCES urls(id),
+    count INTEGER DEFAULT 1,
+    frecency REAL NOT NULL DEFAULT 0,
+    last_visit INTEGER
+);
+
+INSERT INTO frequency_normalized (url_id, count, frecency, last_visit)
+SELECT u.id, f.count, f.frecency, epoch_ms(f.last_visit)
+FROM frequency f
+JOIN urls u ON u.url = f.url;
+
+-- Dropping the old tables drops their indexes and triggers with them
+DROP TABLE IF EXISTS history_fts;
+DROP TABLE history;
+DROP TABLE frequency;
+ALTER TABLE history_normalized RENAME TO history;
+ALTER TABLE frequency_normalized RENAME TO frequency;
+
+-- Newest-first paging walks (visited_at, seq); the rowid completes the key
+CREATE INDEX IF NOT EXISTS idx_history_visited_at ON history(visited_at);
+CREATE INDEX IF NOT EXISTS idx_history_url_id ON history(url_id, visited_at);
+CREATE INDEX IF NOT EXISTS idx_frequency_frecency ON frequency(frecency);
+
+-- API-shaped views
+CREATE VIEW IF NOT EXISTS history_pages AS
+SELECT h.seq, h.visited_at, h.id, u.url, u.title,
+       strftime('%Y-%m-%dT%H:%M:%fZ', h.visited_at / 1000.0, 'unixepoch') AS timestamp,
+       u.domain
+FROM history h
+JOIN urls u ON u.id = h.url_id;
+
+CREATE VIEW IF NOT EXISTS frequent_pages AS
+SELECT 'freq-' || f.url_id AS id, f.url_id, u.url,
+       COALESCE(NULLIF(u.title, ''), u.url) AS title,
+       f.count AS visitCount,
+       strftime('%Y-%m-%dT%H:%M:%fZ', f.last_visit / 1000.0, 'unixepoch') AS timestamp,
+       f.frecency
+FROM frequency f
+JOIN urls u ON u.id = f.url_id;
+
+-- Search now indexes each URL once instead of every visit
+CREATE VIRTUAL TABLE IF NOT EXISTS urls_fts USING fts5(
+    title,
+    url,
+    content='urls',
+    content_rowid='id',
+    prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS urls_fts_insert AFTER INSERT ON urls BEGIN
+    INSERT INTO urls_fts(rowid, title, url) VALUES (new.id, new.title, new.url);
+END;
+
+CREATE TRIGGER IF NOT EXISTS urls_fts_delete AFTER DELETE ON urls BEGIN
+    INSERT INTO urls_fts(urls_fts, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+END;
+
+CREATE TRIGGER IF NOT EXISTS urls_fts_update AFTER UPDATE OF title, url ON urls BEGIN
+    INSERT INTO urls_fts(urls_fts, rowid, title, url) VALUES ('delete', old.id, old.title, old.url);
+    INSERT INTO urls_fts(rowid, title, url) VALUES (new.id, new.title, new.url);
+END;
+
+INSERT INTO urls_fts(urls_fts) VALUES ('rebuild');
+
+-- Version counters
+CREATE TRIGGER IF NOT EXISTS history_version_insert AFTER INSERT ON history BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'history';
+END;
+CREATE TRIGGER IF NOT EXISTS history_version_update AFTER UPDATE ON history BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'history';
+END;
+CREATE TRIGGER IF NOT EXISTS history_version_delete AFTER DELETE ON history BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'history';
+END;
+
+CREATE TRIGGER IF NOT EXISTS frequency_version_insert AFTER INSERT ON frequency BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'frequency';
+END;
+CREATE TRIGGER IF NOT EXISTS frequency_version_update AFTER UPDATE ON frequency BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'frequency';
+END;
+CREATE TRIGGER IF NOT EXISTS frequency_version_delete AFTER DELETE ON frequency BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'frequency';
+END;
+
+-- A new title shows up in both history and frequent pages
+CREATE TRIGGER IF NOT EXISTS urls_version_update AFTER UPDATE ON urls BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource IN ('history', 'frequency');
+END;
+
+-- Change log
+CREATE TRIGGER IF NOT EXISTS history_change_insert AFTER INSERT ON history BEGIN
+    INSERT INTO changes (resource, op, data)
+    SELECT 'history', 'upsert', json_object(
+        'id', new.id, 'url', u.url, 'title', u.title,
+        'timestamp', strftime('%Y-%m-%dT%H:%M:%fZ', new.visited_at / 1000.0, 'unixepoch'),
+        'domain', u.domain)
+    FROM urls u WHERE u.id = new.url_id;
+END;
+CREATE TRIGGER IF NOT EXISTS history_change_update AFTER UPDATE ON history BEGIN
+    INSERT INTO changes (resource, op, data)
+    SELECT 'history', 'upsert', json_object(
+        'id', new.id, 'url', u.url, 'title', u.title,
+        'timestamp', strftime('%Y-%m-%dT%H:%M:%fZ', new.visited_at / 1000.0, 'unixepoch'),
+        'domain', u.domain)
+    FROM urls u WHERE u.id = new.url_id;
+END;
+CREATE TRIGGER IF NOT EXISTS history_change_delete AFTER DELETE ON history BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('history', 'delete', json_object('id', old.id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS frequency_change_insert AFTER INSERT ON frequency BEGIN
+    INSERT INTO changes (resource, op, data)
+    SELECT 'frequency', 'upsert', json_object('url', url, 'title', title, 'visitCount', visitCount)
+    FROM frequent_pages WHERE url_id = new.url_id;
+END;
+CREATE TRIGGER IF NOT EXISTS frequency_change_update AFTER UPDATE ON frequency BEGIN
+    INSERT INTO changes (resource, op, data)
+    SELECT 'frequency', 'upsert', json_object('url', url, 'title', title, 'visitCount', visitCount)
+    FROM frequent_pages WHERE url_id = new.url_id;
+END;
+CREATE TRIGGER IF NOT EXISTS frequency_change_delete AFTER DELETE ON frequency BEGIN
+    INSERT INTO changes (resource, op, data)
+    SELECT 'frequency', 'delete', json_object('url', url) FROM urls WHERE id = old.url_id;
+END;
+CREATE TRIGGER IF NOT EXISTS urls_change_update AFTER UPDATE OF title ON urls BEGIN
+    INSERT INTO changes (resource, op, data)
+    SELECT 'frequency', 'upsert', json_object('url', url, 'title', title, 'visitCount', visitCount)
+    FROM frequent_pages WHERE url_id = new.id;
+END;
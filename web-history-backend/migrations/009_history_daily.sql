@@ -0,0 +1,58 @@
+-- Cold tier for history. Visits older than the retention period are rolled
+-- up into one row per URL and day (days since the Unix epoch, in UTC) and
+-- removed from history, which keeps the hot table small. history_daily_pages
+-- presents the rollups as history entries: negative seq values keep their
+-- positions distinct from raw visits, and last_seen stands in for the
+-- visit time. Rolled-up entries have ids like day-<url_id>-<day>.
+
+CREATE TABLE IF NOT EXISTS history_daily (
+    seq INTEGER PRIMARY KEY,
+    url_id INTEGER NOT NULL REFERENCES urls(id),
+    day INTEGER NOT NULL,
+    visits INTEGER NOT NULL,
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    UNIQUE (url_id, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_history_daily_last_seen ON history_daily(last_seen);
+
+CREATE VIEW IF NOT EXISTS history_daily_pages AS
+SELECT -d.seq AS seq, d.last_seen AS visited_at,
+       'day-' || d.url_id || '-' || d.day AS id, u.url, u.title,
+       strftime('%Y-%m-%dT%H:%M:%fZ', d.last_seen / 1000.0, 'unixepoch') AS timestamp,
+       u.domain, d.url_id, d.day
+FROM history_daily d
+JOIN urls u ON u.id = d.url_id;
+
+-- Rollups are part of the history resource
+CREATE TRIGGER IF NOT EXISTS history_daily_version_insert AFTER INSERT ON history_daily BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'history';
+END;
+CREATE TRIGGER IF NOT EXISTS history_daily_version_update AFTER UPDATE ON history_daily BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'history';
+END;
+CREATE TRIGGER IF NOT EXISTS history_daily_version_delete AFTER DELETE ON history_daily BEGIN
+    UPDATE data_versions SET version = version + 1 WHERE resource = 'history';
+END;
+
+CREATE TRIGGER IF NOT EXISTS history_daily_change_insert AFTER INSERT ON history_daily BEGIN
+    INSERT INTO changes (resource, op, data)
+    SELECT 'history', 'upsert', json_object(
+        'id', 'day-' || new.url_id || '-' || new.day, 'url', u.url, 'title', u.title,
+        'timestamp', strftime('%Y-%m-%dT%H:%M:%fZ', new.last_seen / 1000.0, 'unixepoch'),
+        'domain', u.domain)
+    FROM urls u WHERE u.id = new.url_id;
+END;
+CREATE TRIGGER IF NOT EXISTS history_daily_change_update AFTER UPDATE ON history_daily BEGIN
+    INSERT INTO changes (resource, op, data)
+    SELECT 'history', 'upsert', json_object(
+        'id', 'day-' || new.url_id || '-' || new.day, 'url', u.url, 'title', u.title,
+        'timestamp', strftime('%Y-%m-%dT%H:%M:%fZ', new.last_seen / 1000.0, 'unixepoch'),
+        'domain', u.domain)
+    FROM urls u WHERE u.id = new.url_id;
+END;
+CREATE TRIGGER IF NOT EXISTS history_daily_change_delete AFTER DELETE ON history_daily BEGIN
+    INSERT INTO changes (resource, op, data) VALUES ('history', 'delete', json_object(
+        'id', 'day-' || old.url_id || '-' || old.day));
+END;
@@ -0,0 +1,13 @@
+-- Catalog of the monthly archive files that raw visits are moved into.
+-- name is the UTC month (YYYY_MM); first_visit and last_visit bound the
+-- visits an archive holds, in epoch milliseconds, so range queries attach
+-- only the archives that overlap. version goes up with every write so
+-- backups can skip archives that haven't changed.
+
+CREATE TABLE IF NOT EXISTS history_archives (
+    name TEXT PRIMARY KEY,
+    first_visit INTEGER NOT NULL,
+    last_visit INTEGER NOT NULL,
+    visits INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 0
+);
@@ -0,0 +1,25 @@
+-- State that every worker process serving the database has to agree on.
+--
+-- database_epoch is part of every ETag. A restore gives the restored file a
+-- new epoch before moving it into place, so ETags handed out before never
+-- match the data_versions it starts counting from again, in any process.
+--
+-- import_jobs tracks browser imports, which run in whichever worker took
+-- the request while their status may be polled through any other.
+
+CREATE TABLE IF NOT EXISTS database_epoch (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    epoch TEXT NOT NULL
+);
+
+INSERT OR IGNORE INTO database_epoch (id, epoch) VALUES (1, lower(hex(randomblob(4))));
+
+CREATE TABLE IF NOT EXISTS import_jobs (
+    id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started TEXT NOT NULL,
+    finished TEXT,
+    result TEXT,
+    error TEXT
+);
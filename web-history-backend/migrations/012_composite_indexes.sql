@@ -0,0 +1,20 @@
+-- Composite indexes for statements that had to read more than they return,
+-- found by checking query plans (benchmarks/query_plans.py).
+
+-- add_page and move_page refuse a URL that is already in the target
+-- folder. The primary key only narrows that to the folder.
+CREATE INDEX IF NOT EXISTS idx_folder_pages_folder_url ON folder_pages(folder_id, url);
+
+-- New pages go after the last one in their folder, and the folder tree
+-- lists each folder's pages in display order
+CREATE INDEX IF NOT EXISTS idx_folder_pages_order ON folder_pages(folder_id, display_order);
+
+-- Folders in display order, so the tree is no longer sorted as a whole
+CREATE INDEX IF NOT EXISTS idx_folders_order ON folders(display_order, id);
+
+-- history_daily_pages orders rollups by (visited_at, seq), that is
+-- (last_seen, -seq). Indexing the same expression lets keyset pages and
+-- streams of rollups come straight off the index, and the index still
+-- answers ranges of last_seen on its own.
+DROP INDEX IF EXISTS idx_history_daily_last_seen;
+CREATE INDEX IF NOT EXISTS idx_history_daily_order ON history_daily(last_seen, -seq);
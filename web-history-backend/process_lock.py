@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+
+# Advisory file locks: fcntl on POSIX, msvcrt on Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# How often a blocking acquire retries where the OS can't wait for the lock itself
+POLL_SECONDS = 0.05
+
+class ProcessLock:
+    """Lock shared by every process that uses the same lock file.
+
+    Within a process it behaves like threading.RLock, so the thread holding
+    it may take it again. The file lock is dropped by the OS when the
+    process exits, however it exits, so a crashed holder never leaves it
+    stuck.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """Take the lock, or return False if `blocking` is off and another holder has it"""
+        if not self._lock.acquire(blocking):
+            return False
+        if self._depth == 0:
+            try:
+                locked = self._lock_file(blocking)
+            except BaseException:
+                self._lock.release()
+                raise
+            if not locked:
+                self._lock.release()
+                return False
+        self._depth += 1
+        return True
+
+    def release(self):
+        """Release one level of the lock; the file lock goes with the last"""
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file()
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    @property
+    def held(self):
+        """Whether this process holds the lock"""
+        return self._depth > 0
+
+    def _lock_file(self, blocking):
+        """Open the lock file and lock it; returns False if it is taken and `blocking` is off"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        f = open(self.path, "a+b")
+        try:
+            while True:
+                try:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                    else:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if not blocking:
+                        f.close()
+                        return False
+                    time.sleep(POLL_SECONDS)
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+        return True
+
+    def _unlock_file(self):
+        """Unlock and close the lock file"""
+        f, self._file = self._file, None
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            f.close()
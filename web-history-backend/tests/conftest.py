@@ -0,0 +1,91 @@
+import itertools
+import json
+import os
+import shutil
+import sqlite3
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Seconds between 1601-01-01, where Chrome's timestamps start, and the Unix epoch
+CHROME_EPOCH_OFFSET = 11644473600
+
+# Visit ids of every Chrome history written, unique like those of one browser profile
+chrome_visit_ids = itertools.count(1)
+
+def load_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir(tmp_path_factory):
+    """Run the whole session in a directory of its own, as the backend keeps its files in the working directory"""
+    directory = tmp_path_factory.mktemp("web-history")
+    shutil.copy(os.path.join(BACKEND_DIR, "schema.sql"), directory)
+    shutil.copytree(os.path.join(BACKEND_DIR, "migrations"), directory / "migrations")
+
+    # Tuning comes from the backend's configs, but every path stays inside the directory
+    database_config = load_json(os.path.join(BACKEND_DIR, "database_config.json"))
+    database_config.update(journal_directory="./backups/journal", archive_directory="./archive",
+                           slow_query_log="./slow_queries.log")
+    write_json(directory / "database_config.json", database_config)
+    write_json(directory / "backup_config.json", {"backup_directory": "./backups", "max_backups": 10})
+
+    previous = os.getcwd()
+    os.chdir(directory)
+    from database_manager import db_manager
+    from ingest_queue import ingest_queue
+    db_manager.initialize_db()
+    try:
+        yield directory
+    finally:
+        # Anything written at exit would otherwise go to the original directory
+        ingest_queue.stop()
+        db_manager.journal.stop()
+        db_manager.close_all()
+        os.chdir(previous)
+
+@pytest.fixture
+def backup_config(workdir, tmp_path):
+    """Point backups at a directory of their own for one test; returns a function to change settings"""
+    path = workdir / "backup_config.json"
+    saved = load_json(path)
+    config = {"backup_directory": str(tmp_path / "backups"), "max_backups": 10}
+    write_json(path, config)
+
+    def update(**settings):
+        config.update(settings)
+        write_json(path, config)
+        return config
+
+    yield update
+    write_json(path, saved)
+
+@pytest.fixture
+def chrome_history(tmp_path):
+    """Write a Chrome History database with one visit per given (url, epoch-second) pair"""
+    def write(visits, name="History"):
+        path = str(tmp_path / name)
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE urls (id INTEGER PRIMARY KEY, url TEXT, title TEXT)")
+        conn.execute("CREATE TABLE visits (id INTEGER PRIMARY KEY, url INTEGER, visit_time INTEGER, transition INTEGER)")
+        url_ids = {}
+        for url, visited in visits:
+            if url not in url_ids:
+                url_ids[url] = len(url_ids) + 1
+                conn.execute("INSERT INTO urls VALUES (?, ?, ?)", (url_ids[url], url, url))
+            conn.execute(
+                "INSERT INTO visits VALUES (?, ?, ?, 0)",
+                (next(chrome_visit_ids), url_ids[url], int((visited + CHROME_EPOCH_OFFSET) * 1000000))
+            )
+        conn.commit()
+        conn.close()
+        return path
+    return write
@@ -0,0 +1,56 @@
+import os
+import uuid
+from datetime import datetime
+
+import backup_manager as backup_module
+from backup_manager import backup_manager, MANIFEST_DIR
+from database_manager import folders_db
+
+class FrozenDatetime(datetime):
+    """datetime whose now() stays on one second"""
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 4, 7, 12, 6, 53)
+
+def change_and_back_up():
+    """Make a change so the next backup isn't skipped, back up, and return the new folder's name"""
+    name = uuid.uuid4().hex
+    folders_db.create({"name": name})
+    backup_manager.perform_backup()
+    return name
+
+def folder_names():
+    return {folder["name"] for folder in folders_db.get_all()}
+
+def test_pruning_keeps_newest_backups(backup_config):
+    config = backup_config(max_backups=2)
+    names = [change_and_back_up() for _ in range(4)]
+
+    backups = backup_manager.list_backups()
+    assert len(backups) == 2
+    manifests = sorted(os.listdir(os.path.join(config["backup_directory"], MANIFEST_DIR)))
+    assert manifests == sorted(entry["filename"] for entry in backups)
+
+    # The oldest backup kept still restores, with every chunk it needs
+    assert backup_manager.restore_backup(backups[-1]["timestamp"])
+    assert names[2] in folder_names()
+    assert names[3] not in folder_names()
+
+def test_backups_in_the_same_second_keep_their_own_manifests(backup_config, monkeypatch):
+    backup_config(max_backups=2)
+    monkeypatch.setattr(backup_module, "datetime", FrozenDatetime)
+    names = [change_and_back_up() for _ in range(3)]
+
+    timestamps = [entry["timestamp"] for entry in backup_manager.list_backups()]
+    assert timestamps == ["20250407_120653_03", "20250407_120653_02"]
+
+    assert backup_manager.restore_backup("20250407_120653_02")
+    assert names[1] in folder_names()
+    assert names[2] not in folder_names()
+
+def test_unchanged_database_is_not_backed_up_again(backup_config):
+    backup_config()
+    change_and_back_up()
+    backup_manager.perform_backup()
+
+    assert len(backup_manager.list_backups()) == 1
@@ -0,0 +1,111 @@
+import time
+import uuid
+
+import pytest
+
+from browser_import import import_browser_history
+from compaction import history_compactor
+from database_manager import db_manager
+
+def old_visits(count, days=200):
+    """`count` visits a minute apart to a URL of their own, `days` days ago"""
+    url = f"https://{uuid.uuid4().hex}.example/"
+    start = time.time() - days * 86400
+    return url, [(url, start + i * 60) for i in range(count)]
+
+def url_state(url):
+    """(frequency count, raw visits, rolled-up visits, archived visits) of one URL"""
+    with db_manager.get_connection() as conn:
+        url_id = conn.execute("SELECT id FROM urls WHERE url = ?", (url,)).fetchone()[0]
+        frequency = conn.execute("SELECT count FROM frequency WHERE url_id = ?", (url_id,)).fetchone()[0]
+        raw = conn.execute("SELECT COUNT(*) FROM history WHERE url_id = ?", (url_id,)).fetchone()[0]
+        daily = conn.execute(
+            "SELECT COALESCE(SUM(visits), 0) FROM history_daily WHERE url_id = ?", (url_id,)
+        ).fetchone()[0]
+    archived = 0
+    with db_manager.get_connection() as conn:
+        for archive in db_manager.archives.list(conn):
+            with db_manager.archives.attached(conn, archive["name"]) as schema:
+                archived += conn.execute(
+                    f"SELECT COUNT(*) FROM {schema}.history WHERE url_id = ?", (url_id,)
+                ).fetchone()[0]
+    return frequency, raw, daily, archived
+
+@pytest.fixture
+def compaction_settings(monkeypatch):
+    """Set history_retention_days and history_archive_days for one test"""
+    def update(retention_days=0, archive_days=0):
+        monkeypatch.setitem(db_manager.config, "history_retention_days", retention_days)
+        monkeypatch.setitem(db_manager.config, "history_archive_days", archive_days)
+    return update
+
+def test_compaction_is_off_by_default(chrome_history):
+    url, visits = old_visits(3)
+    import_browser_history(chrome_history(visits))
+    history_compactor.run_once()
+
+    assert url_state(url) == (3, 3, 0, 0)
+
+def test_rollup_keeps_visit_counts(chrome_history, compaction_settings):
+    url, visits = old_visits(5)
+    import_browser_history(chrome_history(visits))
+    compaction_settings(retention_days=90)
+    history_compactor.run_once()
+
+    assert url_state(url) == (5, 0, 5, 0)
+
+def test_archiving_moves_visits_unchanged(chrome_history, compaction_settings):
+    url, visits = old_visits(4)
+    import_browser_history(chrome_history(visits))
+    compaction_settings(archive_days=90)
+    history_compactor.run_once()
+
+    assert url_state(url) == (4, 0, 0, 4)
+
+def test_recent_visits_stay_raw(chrome_history, compaction_settings):
+    url, visits = old_visits(2, days=1)
+    import_browser_history(chrome_history(visits))
+    compaction_settings(retention_days=90, archive_days=90)
+    history_compactor.run_once()
+
+    assert url_state(url) == (2, 2, 0, 0)
+
+def test_reimport_skips_visits_already_stored(chrome_history):
+    url, visits = old_visits(3)
+    path = chrome_history(visits)
+    assert import_browser_history(path)["inserted"] == 3
+
+    summary = import_browser_history(path)
+
+    assert summary["inserted"] == 0
+    assert summary["skipped"] == 3
+    assert url_state(url) == (3, 3, 0, 0)
+
+@pytest.mark.parametrize("settings, expected", [
+    ({"retention_days": 90}, (10, 0, 10, 0)),
+    ({"archive_days": 90}, (10, 0, 0, 10))
+])
+def test_reimport_after_compaction_skips_moved_visits(chrome_history, compaction_settings, settings, expected):
+    url, visits = old_visits(10)
+    path = chrome_history(visits)
+    import_browser_history(path)
+    compaction_settings(**settings)
+    history_compactor.run_once()
+
+    summary = import_browser_history(path)
+
+    assert summary["inserted"] == 0
+    assert url_state(url) == expected
+
+def test_reimport_after_rollup_adds_only_new_visits(chrome_history, compaction_settings):
+    url, visits = old_visits(4)
+    import_browser_history(chrome_history(visits))
+    compaction_settings(retention_days=90)
+    history_compactor.run_once()
+
+    # The browser has since recorded a visit a day later, outside the rolled-up span
+    later = visits + [(url, visits[-1][1] + 86400)]
+    summary = import_browser_history(chrome_history(later, name="History-later"))
+
+    assert summary["inserted"] == 1
+    assert url_state(url) == (5, 1, 4, 0)
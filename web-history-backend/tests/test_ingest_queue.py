@@ -0,0 +1,84 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app import create_app
+from database_manager import db_manager, history_db
+from ingest_queue import IngestQueue, ingest_queue
+
+def visit(**fields):
+    page = {"id": uuid.uuid4().hex, "url": f"https://{uuid.uuid4().hex}.example/", "title": "Example",
+            "timestamp": datetime.now().isoformat()}
+    page.update(fields)
+    return page
+
+def stored(*ids):
+    """Ids among `ids` that are in history"""
+    with db_manager.get_connection() as conn:
+        cursor = conn.execute(f"SELECT id FROM history WHERE id IN ({','.join('?' * len(ids))})", ids)
+        return {row["id"] for row in cursor}
+
+@pytest.fixture
+def writer():
+    queue = IngestQueue(history_db, flush_interval_ms=10)
+    yield queue
+    queue.stop()
+
+@pytest.fixture
+def client():
+    return create_app({"BACKGROUND_JOBS": False}).test_client()
+
+def test_flush_commits_queued_visits(writer):
+    pages = [visit() for _ in range(5)]
+    for page in pages:
+        writer.submit(page)
+    writer.flush()
+
+    assert stored(*(page["id"] for page in pages)) == {page["id"] for page in pages}
+    stats = writer.stats()
+    assert stats["depth"] == 0
+    assert stats["submitted"] == stats["committed"] == 5
+
+def test_stop_commits_visits_still_queued(writer):
+    page = visit()
+    writer.submit(page)
+    writer.stop()
+
+    assert stored(page["id"]) == {page["id"]}
+
+def test_bad_visit_doesnt_discard_its_batch(writer):
+    good = [visit(), visit()]
+    bad = visit()
+    del bad["url"]
+    for page in (good[0], bad, good[1]):
+        writer.submit(page)
+    writer.flush()
+
+    assert stored(*(page["id"] for page in good)) == {page["id"] for page in good}
+    assert writer.stats()["committed"] == 2
+    assert writer.stats()["failed"] == 1
+
+def test_duplicate_visits_are_stored_once(writer):
+    page = visit()
+    writer.submit(page)
+    writer.submit(dict(page))
+    writer.flush()
+
+    with db_manager.get_connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM history WHERE id = ?", (page["id"],)).fetchone()[0]
+    assert count == 1
+
+@pytest.mark.parametrize("body", [{"title": "No url"}, {"url": ""}, ["https://example.com/"]])
+def test_post_history_rejects_visits_without_url(client, body):
+    response = client.post("/api/history", json=body)
+
+    assert response.status_code == 400
+
+def test_post_history_queues_visit(client):
+    page = visit()
+    response = client.post("/api/history", json=page)
+    assert response.status_code == 202
+
+    ingest_queue.flush()
+    assert stored(page["id"]) == {page["id"]}
@@ -0,0 +1,51 @@
+import re
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+# The check runs in a process of its own, as it fills a database of its own
+# and the backend keeps one database per process
+@pytest.fixture(scope="module")
+def plan_check():
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.query_plans", "--visits", "2k", "--verbose"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=600
+    )
+    plans = {}
+    for block in result.stdout.split("\n\n"):
+        lines = block.strip("\n").splitlines()
+        if len(lines) >= 2 and re.match(r"(ok|FAIL) \(", lines[0]):
+            steps = [line.strip() for line in lines[2:] if not line.strip().startswith("->")]
+            plans.setdefault(lines[1].strip(), []).append("\n".join(steps))
+    return result, plans
+
+def test_every_statement_uses_an_index(plan_check):
+    result, plans = plan_check
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert plans
+    assert "0 plans with disallowed scans or sorts" in result.stdout
+
+@pytest.mark.parametrize("statement, step", [
+    (r"^SELECT COUNT\(\*\) as count FROM folder_pages WHERE folder_id = \? AND url = \?$",
+     r"SEARCH folder_pages USING COVERING INDEX idx_folder_pages_folder_url \(folder_id=\? AND url=\?\)"),
+    (r"^SELECT MAX\(display_order\) as max_order FROM folder_pages WHERE folder_id = \?$",
+     r"idx_folder_pages_order \(folder_id=\?\)"),
+    (r"FROM history_pages WHERE \(visited_at, seq\) < \(\?\.\.\.\) ORDER BY visited_at DESC, seq DESC LIMIT \?$",
+     r"SEARCH h USING INDEX idx_history_visited_at \(visited_at<\?\)"),
+    (r"FROM history_daily_pages WHERE \(visited_at, seq\) < \(\?\.\.\.\) ORDER BY visited_at DESC, seq DESC LIMIT \?$",
+     r"SEARCH d USING INDEX idx_history_daily_order \(last_seen<\?\)"),
+    (r"FROM frequent_pages ORDER BY frecency DESC LIMIT \?$",
+     r"SCAN f USING INDEX idx_frequency_frecency"),
+])
+def test_statement_plan(plan_check, statement, step):
+    _, plans = plan_check
+    matching = [plan for key, found in plans.items() if re.search(statement, key) for plan in found]
+
+    assert matching, f"No statement like {statement} ran"
+    for plan in matching:
+        assert re.search(step, plan), plan
+        assert "USE TEMP B-TREE" not in plan, plan
@@ -1,4 +1,4 @@
-import { Component, OnInit } from '@angular/core';
+import { Component, OnInit, OnDestroy } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
 import { CdkDragDrop, moveItemInArray, transferArrayItem } from '@angular/cdk/drag-drop';
 import { NgIf, NgFor } from '@angular/common';
@@ -7,6 +7,7 @@ import { FormsModule } from '@angular/forms';
 import { DragDropModule } from '@angular/cdk/drag-drop';
 
 interface WebPage {
+  id?: string;
   page_id: string;
   url: string;
   title: string;
@@ -15,6 +16,19 @@ interface WebPage {
   visitCount?: number;
 }
 
+interface HistoryPage {
+  items: WebPage[];
+  nextCursor: string | null;
+  prevCursor: string | null;
+}
+
+interface Change {
+  seq: number;
+  resource: 'history' | 'frequency' | 'folders' | 'folder_pages';
+  op: 'upsert' | 'delete';
+  data: any;
+}
+
 interface Folder {
   id: string;
   name: string;
@@ -30,8 +44,9 @@ interface Folder {
   standalone: true,
   imports: [NgIf, NgFor, CommonModule, FormsModule, DragDropModule ]
 })
-export class AppComponent implements OnInit {
+export class AppComponent implements OnInit, OnDestroy {
   history: WebPage[] = [];
+  historyCursor: string | null = null; // Cursor for the next (older) page of history
   frequentPages: WebPage[] = [];
   folders: Folder[] = [];
   newFolderName: string = '';
@@ -39,6 +54,7 @@ export class AppComponent implements OnInit {
   currentUrl: string = '';
   activeTab: 'history' | 'frequent' = 'history';
   editingFolderName: string = '';
+  private changeStream?: EventSource;
   
   constructor(private http: HttpClient) {}
 
@@ -47,6 +63,7 @@ export class AppComponent implements OnInit {
     this.loadFrequentPages();
     this.loadFolders();
     this.getCurrentTab();
+    this.subscribeToChanges();
     
     // Set up listener for browser history updates
     window.addEventListener('message', (event) => {
@@ -57,6 +74,47 @@ export class AppComponent implements OnInit {
     });
   }
 
+  ngOnDestroy() {
+    this.changeStream?.close();
+  }
+
+  // Apply small deltas pushed by the backend instead of reloading everything
+  subscribeToChanges() {
+    this.changeStream = new EventSource('http://localhost:5000/api/changes/stream');
+    this.changeStream.addEventListener('changes', (event: MessageEvent) => {
+      this.applyChanges(JSON.parse(event.data));
+    });
+    // The backend trimmed changes we hadn't seen yet, so start over
+    this.changeStream.addEventListener('reset', () => this.refreshData());
+  }
+
+  applyChanges(changes: Change[]) {
+    let foldersChanged = false;
+
+    for (const change of changes) {
+      if (change.resource === 'history') {
+        if (change.op === 'delete') {
+          this.history = this.history.filter(p => p.id !== change.data.id);
+        } else if (!this.history.some(p => p.id === change.data.id)) {
+          this.history.unshift(change.data);
+        }
+      } else if (change.resource === 'frequency') {
+        const page = this.frequentPages.find(p => p.url === change.data.url);
+        if (page && change.op === 'upsert') {
+          page.visitCount = change.data.visitCount;
+          page.title = change.data.title;
+        }
+      } else {
+        foldersChanged = true;
+      }
+    }
+
+    // The folder tree is cached on the backend, so one reload is cheap
+    if (foldersChanged) {
+      this.loadFolders();
+    }
+  }
+
   get connectedDropLists(): string[] {
     return [
       'history',
@@ -71,10 +129,10 @@ export class AppComponent implements OnInit {
     
   loadHistory() {
     console.log("loadHistory()")
-    const timestamp = new Date().getTime();
-    this.http.get<WebPage[]>(`http://localhost:5000/api/history?t=${timestamp}`).subscribe(
+    this.http.get<HistoryPage>('http://localhost:5000/api/history').subscribe(
       (data) => {
-        this.history = data;
+        this.history = data.items;
+        this.historyCursor = data.nextCursor;
       },
       (error) => {
         console.error('Error loading history:', error);
@@ -82,10 +140,23 @@ export class AppComponent implements OnInit {
     );
   }
 
+  loadMoreHistory() {
+    if (!this.historyCursor) return;
+    const cursor = encodeURIComponent(this.historyCursor);
+    this.http.get<HistoryPage>(`http://localhost:5000/api/history?before=${cursor}`).subscribe(
+      (data) => {
+        this.history = this.history.concat(data.items);
+        this.historyCursor = data.nextCursor;
+      },
+      (error) => {
+        console.error('Error loading more history:', error);
+      }
+    );
+  }
+
   loadFrequentPages() {
     console.log("loadFrequentPages()")
-    const timestamp = new Date().getTime();
-    this.http.get<WebPage[]>(`http://localhost:5000/api/history/frequent?t=${timestamp}`).subscribe(
+    this.http.get<WebPage[]>('http://localhost:5000/api/history/frequent').subscribe(
       (data) => {
         this.frequentPages = data;
       },
@@ -97,8 +168,7 @@ export class AppComponent implements OnInit {
 
   loadFolders() {
     console.log("loadFolders()")
-    const timestamp = new Date().getTime();
-    this.http.get<Folder[]>(`http://localhost:5000/api/folders?t=${timestamp}`).subscribe(
+    this.http.get<Folder[]>('http://localhost:5000/api/folders').subscribe(
       (data) => {
         // Initialize collapse state for each folder
         data.forEach(folder => {
@@ -288,12 +358,14 @@ export class AppComponent implements OnInit {
         
         this.http.delete(`/api/folders/${folderId}/pages/${page.page_id}`).subscribe(
           () => {
+            // The change feed brings the folder up to date
             console.log('Page removed from folder successfully');
-            this.refreshData();
           },
           (error) => {
             console.error('Error removing page from folder:', error);
             console.log('Page details:', JSON.stringify(page));
+            // Revert UI change on error
+            this.refreshData();
           }
         );
       } 
@@ -328,8 +400,8 @@ export class AppComponent implements OnInit {
             
             this.http.post(`/api/folders/${folderId}/pages`, page).subscribe(
               (response) => {
+                // The change feed brings the folder up to date
                 console.log('Page added to folder successfully:', response);
-                this.refreshData();
               },
               (error) => {
                 console.error('Error adding page to folder:', error);
@@ -353,8 +425,8 @@ export class AppComponent implements OnInit {
                 // Then add to target folder
                 this.http.post(`/api/folders/${folderId}/pages`, page).subscribe(
                   (response) => {
+                    // The change feed brings both folders up to date
                     console.log('Added to target folder successfully:', response);
-                    this.refreshData();
                   },
                   (error) => {
                     console.error('Error adding to target folder:', error);
@@ -1,6 +1,65 @@
 // Backend API URL
 const API_URL = 'http://localhost:5000/api';
 
+// Visits are buffered and sent in batches so a burst of tab activity
+// costs the backend a single commit
+const VISIT_BATCH_SIZE = 20;
+const VISIT_FLUSH_DELAY_MS = 5000;
+const VISIT_BUFFER_LIMIT = 500;
+let visitBuffer = [];
+let visitFlushTimer = null;
+
+// Add a visit to the buffer and flush on size or after a short delay
+function queueVisit(pageVisit) {
+  visitBuffer.push(pageVisit);
+
+  if (visitBuffer.length >= VISIT_BATCH_SIZE) {
+    flushVisits();
+  } else if (!visitFlushTimer) {
+    visitFlushTimer = setTimeout(flushVisits, VISIT_FLUSH_DELAY_MS);
+  }
+}
+
+// Send all buffered visits to the backend in one request
+function flushVisits() {
+  if (visitFlushTimer) {
+    clearTimeout(visitFlushTimer);
+    visitFlushTimer = null;
+  }
+  if (visitBuffer.length === 0) {
+    return;
+  }
+
+  const batch = visitBuffer;
+  visitBuffer = [];
+
+  fetch(`${API_URL}/history/batch`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json'
+    },
+    body: JSON.stringify(batch)
+  })
+  .then(response => {
+    // Server errors are retried; a rejected batch would only be rejected again
+    if (response.status >= 500) {
+      throw new Error(`HTTP ${response.status}`);
+    }
+    return response.json();
+  })
+  .then(data => {
+    console.log('Page visits recorded:', data);
+  })
+  .catch(error => {
+    console.error('Error recording page visits:', error);
+    // Keep the visits for the next flush; the backend skips ids it already has
+    visitBuffer = batch.concat(visitBuffer).slice(-VISIT_BUFFER_LIMIT);
+    if (!visitFlushTimer) {
+      visitFlushTimer = setTimeout(flushVisits, VISIT_FLUSH_DELAY_MS);
+    }
+  });
+}
+
 // Track page visits and send to our backend
 chrome.tabs.onUpdated.addListener((tabId, changeInfo, tab) => {
   // Only capture when the page has fully loaded
@@ -8,28 +67,15 @@ chrome.tabs.onUpdated.addListener((tabId, changeInfo, tab) => {
     // Filter out extension pages, settings pages, etc.
     if (tab.url.startsWith('http') || tab.url.startsWith('https')) {
       const pageVisit = {
-        id: Date.now().toString(),
+        id: `${Date.now()}-${Math.random().toString(36).slice(2, 8)}`,
         url: tab.url,
         title: tab.title || tab.url,
         favicon: tab.favIconUrl || 'asserts/icons/default-favicon.png',
         timestamp: new Date().toISOString()
       };
       
-      // Send to our backend API
-      fetch(`${API_URL}/history`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json'
-        },
-        body: JSON.stringify(pageVisit)
-      })
-      .then(response => response.json())
-      .then(data => {
-        console.log('Page visit recorded:', data);
-      })
-      .catch(error => {
-        console.error('Error recording page visit:', error);
-      });
+      // Queue for the next batch sent to our backend API
+      queueVisit(pageVisit);
     }
   }
 });
@@ -83,8 +129,35 @@ chrome.contextMenus.onClicked.addListener((info, tab) => {
   }
 });
 
+// ETag of the folder list the menu was last built from
+let folderMenuEtag = null;
+
 // Function to update the folder menu
 function updateFolderMenu() {
+  // Get folders from backend, asking only for changes since the last build
+  const headers = folderMenuEtag ? { 'If-None-Match': folderMenuEtag } : {};
+
+  fetch(`${API_URL}/folders`, { headers, cache: 'no-store' })
+    .then(response => {
+      if (response.status === 304) {
+        // Folders haven't changed, keep the current menu
+        return null;
+      }
+      folderMenuEtag = response.headers.get('ETag');
+      return response.json();
+    })
+    .then(folders => {
+      if (folders) {
+        rebuildFolderMenu(folders);
+      }
+    })
+    .catch(error => {
+      console.error('Error loading folders for menu:', error);
+    });
+}
+
+// Replace the folder submenus with the given folders
+function rebuildFolderMenu(folders) {
   // Remove existing folder submenus
   chrome.contextMenus.removeAll(() => {
     // Recreate parent menu
@@ -93,32 +166,24 @@ function updateFolderMenu() {
       title: 'Add to Web History Folder',
       contexts: ['page', 'link']
     });
-    
-    // Get folders from backend
-    fetch(`${API_URL}/folders`)
-      .then(response => response.json())
-      .then(folders => {
-        // Create submenu items for each folder
-        folders.forEach(folder => {
-          chrome.contextMenus.create({
-            id: `folder-${folder.id}`,
-            parentId: 'web-history-manager',
-            title: folder.name,
-            contexts: ['page', 'link']
-          });
-        });
-        
-        // Add option to create new folder
-        chrome.contextMenus.create({
-          id: 'create-new-folder',
-          parentId: 'web-history-manager',
-          title: '➕ Create New Folder...',
-          contexts: ['page', 'link']
-        });
-      })
-      .catch(error => {
-        console.error('Error loading folders for menu:', error);
+
+    // Create submenu items for each folder
+    folders.forEach(folder => {
+      chrome.contextMenus.create({
+        id: `folder-${folder.id}`,
+        parentId: 'web-history-manager',
+        title: folder.name,
+        contexts: ['page', 'link']
       });
+    });
+
+    // Add option to create new folder
+    chrome.contextMenus.create({
+      id: 'create-new-folder',
+      parentId: 'web-history-manager',
+      title: '➕ Create New Folder...',
+      contexts: ['page', 'link']
+    });
   });
 }
 